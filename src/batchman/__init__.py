@@ -1,11 +1,19 @@
-from typing import Optional, Union, List, Tuple
+from typing import Iterator, Optional, Union, List, Tuple
 from pathlib import Path
 from .batchman import Batcher
 from .models import Request, UserMessage, ProviderConfig, LocalBatchStatus
 from .batch_interfaces import EditableBatch, UploadedBatch, DownloadedBatch
 
 
-_default_batcher = Batcher(batches_dir=Path.home() / ".batchman" / "batches")
+_default_batcher: Optional[Batcher] = None
+
+
+def _get_default_batcher() -> Batcher:
+    # Created on first use, so importing batchman does not create the ~/.batchman directories
+    global _default_batcher
+    if _default_batcher is None:
+        _default_batcher = Batcher(batches_dir=Path.home() / ".batchman" / "batches")
+    return _default_batcher
 
 
 def create_batch(name: str, unique_id: Optional[str] = None, provider: Optional[str] = None, provider_config: Optional[ProviderConfig] = None) -> "EditableBatch":
@@ -25,7 +33,7 @@ def create_batch(name: str, unique_id: Optional[str] = None, provider: Optional[
         FileExistsError: If the batch already exists
         ValueError: If provider is not found
     """
-    return _default_batcher.create_batch(name, unique_id, provider, provider_config)
+    return _get_default_batcher().create_batch(name, unique_id, provider, provider_config)
 
 def load_batch(unique_id: str, name: Optional[str] = None) -> Union[EditableBatch, UploadedBatch, DownloadedBatch]:
     """Load a batch.
@@ -42,7 +50,7 @@ def load_batch(unique_id: str, name: Optional[str] = None) -> Union[EditableBatc
         ValueError: If neither name nor unique_id is provided
         RuntimeError: If multiple batches are found with the same unique_id
     """
-    return _default_batcher.load_batch(unique_id, name)
+    return _get_default_batcher().load_batch(unique_id, name)
 
 def list_batches() -> Tuple[List[EditableBatch], List[UploadedBatch], List[DownloadedBatch], List[str]]:
     """List all batches in the batches directory in a error resilient way.
@@ -54,15 +62,89 @@ def list_batches() -> Tuple[List[EditableBatch], List[UploadedBatch], List[Downl
         - List of successfully loaded DownloadedBatch instances
         - List of errors that occurred while loading the batches
     """
-    return _default_batcher.list_batches()
+    return _get_default_batcher().list_batches()
 
-def sync_batches() -> None:
+def sync_batches(max_workers: int = 1) -> List[str]:
     """Sync all batches in the batches directory in a error resilient way.
 
+    The completed batches are downloaded, as well as the partial results of the failed or cancelled batches
+    (see ``UploadedBatch.has_results``). The other batches in a final state are not synced.
+
+    Args:
+        max_workers: The maximum number of batches synced concurrently
+
     Returns:
         List of errors with the batch directory and the corresponding exception
     """
-    return _default_batcher.sync_batches()
+    return _get_default_batcher().sync_batches(max_workers)
+
+def upload_batches(batches: List[EditableBatch], max_workers: int = 8) -> Tuple[List[UploadedBatch], List[str]]:
+    """Upload several batches in parallel, in a error resilient way.
+
+    Args:
+        batches: The batches to upload (e.g. from ``EditableBatch.fan_out``)
+        max_workers: The maximum number of concurrent uploads
+
+    Returns:
+        A tuple containing:
+        - List of the successfully uploaded batches, in the order of the given batches
+        - List of errors that occurred while uploading the batches
+    """
+    return _get_default_batcher().upload_batches(batches, max_workers)
+
+def as_completed(
+    batches: List[Union[UploadedBatch, DownloadedBatch]],
+    timeout: Optional[float] = None,
+    poll_interval: float = 10.0,
+    max_poll_interval: float = 300.0,
+    download_workers: int = 4,
+) -> Iterator[Union[DownloadedBatch, UploadedBatch]]:
+    """Yield the batches as soon as they are finished, downloading the completed ones.
+
+    All the pending batches are polled together, with bulk status queries when the provider supports them.
+    The polling interval is shared: it backs off (with jitter) from poll_interval to max_poll_interval while
+    no batch progresses, and is reset when one does.
+
+    Args:
+        batches: The uploaded batches to wait for
+        timeout: The maximum number of seconds to wait. Optional, defaults to no limit.
+        poll_interval: The minimum interval between two polls, in seconds
+        max_poll_interval: The maximum interval between two polls, in seconds
+        download_workers: The maximum number of batches downloaded concurrently
+
+    Returns:
+        An iterator over the finished batches, in completion order: the downloaded batches, and the failed
+        or cancelled batches (as UploadedBatch, check their status)
+
+    Raises:
+        ValueError: If a batch has not been uploaded
+        TimeoutError: If some batches are not finished after timeout seconds
+    """
+    return _get_default_batcher().as_completed(batches, timeout, poll_interval, max_poll_interval, download_workers)
+
+def wait(
+    batches: List[Union[UploadedBatch, DownloadedBatch]],
+    timeout: Optional[float] = None,
+    return_when: str = "ALL_COMPLETED",
+    poll_interval: float = 10.0,
+    max_poll_interval: float = 300.0,
+) -> Tuple[List[Union[DownloadedBatch, UploadedBatch]], List[Union[UploadedBatch, DownloadedBatch]]]:
+    """Wait for the batches to be finished, downloading the completed ones (see ``as_completed``).
+
+    Args:
+        batches: The uploaded batches to wait for
+        timeout: The maximum number of seconds to wait. Optional, defaults to no limit.
+        return_when: When to return, like ``concurrent.futures.wait``: "ALL_COMPLETED" (default),
+            "FIRST_COMPLETED", or "FIRST_EXCEPTION" (when a batch fails or is cancelled)
+        poll_interval: The minimum interval between two polls, in seconds
+        max_poll_interval: The maximum interval between two polls, in seconds
+
+    Returns:
+        A tuple containing:
+        - List of the finished batches, in completion order (downloaded, failed or cancelled)
+        - List of the batches not finished, from the given batches
+    """
+    return _get_default_batcher().wait(batches, timeout, return_when, poll_interval, max_poll_interval)
 
 def delete_batch(unique_id: str) -> None:
     """Delete a batch given its unique ID.
@@ -74,6 +156,6 @@ def delete_batch(unique_id: str) -> None:
         FileNotFoundError: If the batch does not exist
         RuntimeError: If multiple batches are found with the same unique_id
     """
-    return _default_batcher.delete_batch(unique_id)
+    return _get_default_batcher().delete_batch(unique_id)
 
 __all__ = ["Batcher", "Request", "UserMessage", "cli", "EditableBatch", "UploadedBatch", "DownloadedBatch", "ProviderConfig", "LocalBatchStatus"]
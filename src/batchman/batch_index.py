@@ -0,0 +1,159 @@
+import os
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .models.batch import Batch, BatchSummary
+from .models.enums import LocalBatchStatus
+from .utils.files import get_json_codec
+from .utils.logging import logger
+
+if TYPE_CHECKING:
+    from .batchman import Batcher
+
+
+# Version of the summaries format, the entries of another version are recomputed
+INDEX_VERSION = 4
+
+# Fields the summaries can be sorted by
+SORT_FIELDS = ("created_at", "name", "status", "provider", "unique_id")
+
+
+def _stamp(batch_dir: Path) -> List[int]:
+    """Modification times of the files a batch summary is computed from.
+
+    Adding or removing a file (e.g. the remote results) changes the directory mtime, while the params
+    and remote states are updated in place.
+    """
+    stamp = [batch_dir.stat().st_mtime_ns]
+    # BatchFiles is not used, as it looks for the compressed variants of the large files
+    for path in (batch_dir / "batch_params.json", batch_dir / "remote_states.jsonl"):
+        try:
+            stamp.append(path.stat().st_mtime_ns)
+        except FileNotFoundError:
+            stamp.append(0)
+    return stamp
+
+
+class BatchIndex:
+    """Persistent index of the summaries of the batches of a Batcher (see ``Batch.summary``).
+
+    The summaries are stored in a single jsonl file in the batches directory, along with the modification
+    times of the files they were computed from. Listing the batches then only costs a few ``stat`` per
+    batch: only the batches modified since the last listing are read again.
+    """
+
+    def __init__(self, batcher: "Batcher") -> None:
+        self.batcher = batcher
+        self.path = batcher.batches_dir / ".index" / "summaries.jsonl"
+        self._lock = threading.Lock()
+
+    def _read(self) -> Dict[str, Dict[str, Any]]:
+        entries: Dict[str, Dict[str, Any]] = {}
+        if not self.path.exists():
+            return entries
+        loads = get_json_codec().loads
+        try:
+            with open(self.path, "rb") as f:
+                for line in f:
+                    if line.strip():
+                        entry = loads(line)
+                        entries[entry["directory"]] = entry
+        except Exception as e:
+            logger.warning(f"Could not read the batch index {self.path}, rebuilding it: {e}")
+            return {}
+        return entries
+
+    def _write(self, entries: Iterable[Dict[str, Any]]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        dumps = get_json_codec().dumps
+        tmp_path = self.path.with_name(f"{self.path.name}.tmp-{os.getpid()}-{threading.get_ident()}")
+        with open(tmp_path, "wb") as f:
+            for entry in entries:
+                f.write(dumps(entry) + b"\n")
+        os.replace(tmp_path, self.path)
+
+    def summaries(self) -> Tuple[List[BatchSummary], List[str]]:
+        """Return the summaries of all the batches, updating the index for the modified batches.
+
+        Returns:
+            A tuple containing:
+            - List of the batch summaries
+            - List of errors that occurred while reading the batches
+        """
+        with self._lock:
+            stored = self._read()
+            entries = []
+            summaries = []
+            errors = []
+            changed = False
+            for batch_dir in self.batcher.batches_dir.iterdir():
+                # hidden entries (e.g. the blob store, this index) are not batches
+                if batch_dir.name.startswith("."):
+                    continue
+                try:
+                    stamp = _stamp(batch_dir)
+                    entry = stored.get(batch_dir.name)
+                    if entry is None or entry["stamp"] != stamp or entry.get("version") != INDEX_VERSION:
+                        summary = Batch.from_directory(self.batcher, batch_dir).summary()
+                        entry = {"directory": batch_dir.name, "version": INDEX_VERSION, "stamp": stamp, "summary": summary.to_dict()}
+                        changed = True
+                    else:
+                        summary = BatchSummary.from_dict(entry["summary"])
+                except Exception as e:
+                    errors.append(f"Error loading batch from {batch_dir}: {e}")
+                    continue
+                entries.append(entry)
+                summaries.append(summary)
+
+            if changed or len(entries) != len(stored):
+                try:
+                    self._write(entries)
+                except OSError as e:
+                    logger.warning(f"Could not write the batch index {self.path}: {e}")
+            return summaries, errors
+
+
+def query_summaries(
+    summaries: Iterable[BatchSummary],
+    statuses: Optional[Sequence[LocalBatchStatus]] = None,
+    providers: Optional[Sequence[Optional[str]]] = None,
+    search: Optional[str] = None,
+    sort_by: str = "created_at",
+    descending: bool = True,
+) -> List[BatchSummary]:
+    """Filter and sort batch summaries.
+
+    Args:
+        summaries: The summaries to query, e.g. from ``Batcher.batch_summaries``
+        statuses: Only keep the batches with one of these statuses
+        providers: Only keep the batches with one of these providers (None for the batches without provider)
+        search: Only keep the batches whose name, unique_id or remote_id contains this text (case insensitive)
+        sort_by: The field to sort by, one of ``SORT_FIELDS``
+        descending: Whether to sort in descending order (most recent first for created_at)
+    """
+    if sort_by not in SORT_FIELDS:
+        raise ValueError(f"Invalid sort field: {sort_by}, expected one of {SORT_FIELDS}")
+
+    results = list(summaries)
+    if statuses is not None:
+        status_set = set(statuses)
+        results = [summary for summary in results if summary.status in status_set]
+    if providers is not None:
+        provider_set = set(providers)
+        results = [summary for summary in results if summary.provider in provider_set]
+    if search:
+        search = search.lower()
+        results = [
+            summary for summary in results
+            if search in summary.name.lower() or search in summary.unique_id or search in (summary.remote_id or "").lower()
+        ]
+
+    def sort_key(summary: BatchSummary) -> Any:
+        value = getattr(summary, sort_by)
+        if sort_by == "status":
+            return value.value
+        return value or ""
+
+    results.sort(key=sort_key, reverse=descending)
+    return results
@@ -1,12 +1,26 @@
-from typing import Any, Dict, List, Optional, Union
+import itertools
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Literal, Optional, Union, cast
 
 from batchman.models.request import Request
+from batchman.models.content import intern_request
+from batchman.models.request_table import RequestTable
 from batchman.models.provider_config import ProviderConfig
-from batchman.models.result import Result
+from batchman.models.result import Result, TextResult
+from batchman.models.result_table import ResultTable
 from batchman.models.batch import LocalBatchStatus, Batch
-from batchman.utils import upsert_json, read_jsonl, append_jsonl, logger
+from batchman.utils import upsert_json, read_json, read_jsonl, iter_jsonl, append_jsonl, write_jsonl, logger
+from batchman.utils.blobs import detach_file
+from batchman.utils.files import write_json
 from batchman.providers.registry import ProviderRegistry
 
+if TYPE_CHECKING:
+    import pandas
+    import pyarrow
+
+ResultsMode = Literal["raw", "text", "full"]
+
 
 class EditableBatch(Batch):
     """
@@ -20,14 +34,28 @@ class EditableBatch(Batch):
         """Add metadata to the batch."""
         upsert_json(self._files.metadata, metadata)
 
-    def add_requests(self, requests: Union[Request, List[Request]]) -> None:
-        """Add one or more requests to the batch."""
+    def add_requests(self, requests: Union[Request, List[Request], RequestTable], intern_content: bool = False) -> None:
+        """Add one or more requests (or the requests of a RequestTable) to the batch.
+
+        Args:
+            requests: The requests to add
+            intern_content: Whether to store the large texts, local image files and base64 images in the
+                content blob store of the batcher, the requests only holding references to them. The
+                references are expanded by the provider when the batch is uploaded, but the requests read
+                back from the batch (``requests``, ``get_request``...) hold ``BlobContent`` references
+                (see ``expand_content``). Disabled by default.
+        """
         if isinstance(requests, Request):
             requests = [requests]
 
-        append_jsonl(
-            self._files.requests, [request.model_dump() for request in requests]
-        )
+        request_dicts = (request.model_dump() for request in requests)
+        if intern_content:
+            request_dicts = (intern_request(request, self.batcher.content_blobs) for request in request_dicts)
+
+        # the requests file may be shared with copies of this batch
+        detach_file(self._files.requests)
+        append_jsonl(self._files.requests, list(request_dicts))
+        self._requests_index.update()
 
     def override_request_params(self, **kwargs: Any) -> None:
         """Set or update global parameters for all requests in the batch."""
@@ -84,6 +112,44 @@ class EditableBatch(Batch):
         new_directory = self._copy_dir(new_name, new_unique_id, keep_provider)
         return EditableBatch.from_directory(self.batcher, new_directory)
 
+    def fan_out(
+        self,
+        models: Optional[List[str]] = None,
+        params_grid: Optional[Union[Dict[str, List[Any]], List[Dict[str, Any]]]] = None,
+    ) -> List["EditableBatch"]:
+        """Derive one batch per model and per combination of params, from the requests of this batch.
+
+        The derived batches keep the provider of this batch, and share its requests file (see ``copy``):
+        each of them only stores its own overridden params. They can then be uploaded in parallel
+        with ``Batcher.upload_batches``.
+
+        Args:
+            models: The models to run the requests on. Optional, if not provided, the model is not overridden.
+            params_grid: The request params to override, either as a dict of lists of values (all the
+                combinations are used), or as a list of dicts of params.
+
+        Returns:
+            List[EditableBatch]: The derived batches, one per (model, params) combination.
+
+        Example:
+            >>> batches = batch.fan_out(models=["gpt-4o", "gpt-4o-mini"], params_grid={"temperature": [0, 1]})
+            >>> uploaded_batches, errors = batcher.upload_batches(batches)
+        """
+        if isinstance(params_grid, dict):
+            keys = list(params_grid.keys())
+            params_combinations = [dict(zip(keys, values)) for values in itertools.product(*params_grid.values())]
+        else:
+            params_combinations = params_grid or [{}]
+        models_overrides: List[Dict[str, Any]] = [{"model": model} for model in models] if models else [{}]
+
+        derived_batches = []
+        for model_override, params in itertools.product(models_overrides, params_combinations):
+            derived_batch = self.copy(keep_provider=True)
+            upsert_json(derived_batch._files.batch_params, {"parent_id": self.unique_id})
+            derived_batch.override_request_params(**{**params, **model_override})
+            derived_batches.append(derived_batch)
+        return derived_batches
+
     def prevalidate_requests(self) -> None:
         """Pre-validates all requests in the batch against the provider's requirements, before uploading.
 
@@ -99,7 +165,7 @@ class EditableBatch(Batch):
 
         invalid_requests = []
 
-        for request in self.requests:
+        for request in self.request_table:
             try:
                 self._provider.validate_request(request)
             except ValueError as e:
@@ -115,11 +181,77 @@ class EditableBatch(Batch):
                 )
             )
 
-    def upload(self) -> "UploadedBatch":
+    def _exclude_duplicated_requests(self) -> None:
+        """Map the requests identical to a previous request of the batch to it, these requests are not uploaded.
+
+        The requests are compared as in the result cache, ignoring their custom_id and metadata.
+        """
+        first_custom_ids: Dict[str, str] = {}
+        duplicates = []
+        for request in self.request_table:
+            key = self.batcher.result_cache.request_key(self._provider.name, request)
+            first_custom_id = first_custom_ids.setdefault(key, request.custom_id)
+            if first_custom_id != request.custom_id:
+                duplicates.append({"custom_id": request.custom_id, "duplicate_of": first_custom_id})
+        write_jsonl(self._files.duplicates, duplicates)
+        logger.info(f"Batch {self.params.name}:{self.unique_id}: {len(duplicates)} duplicated requests not uploaded")
+
+    def _exclude_cached_requests(self, max_cached_temperature: float) -> bool:
+        """Store the cached results of the requests of the batch, these requests are not uploaded.
+
+        Returns:
+            Whether all the requests to upload are answered from the cache
+        """
+        result_cache = self.batcher.result_cache
+        cached_results = []
+        request_count = 0
+        for request in self._requests_to_upload():
+            request_count += 1
+            if not result_cache.is_cacheable(request, max_cached_temperature):
+                continue
+            cached_result = result_cache.get(self._provider.name, request)
+            if cached_result is not None:
+                cached_results.append(self._provider.with_result_custom_id(cached_result, request.custom_id))
+
+        write_jsonl(self._files.cached_results, cached_results)
+        logger.info(f"Batch {self.params.name}:{self.unique_id}: {len(cached_results)} requests answered from the result cache")
+        return bool(cached_results) and len(cached_results) == request_count
+
+    def _complete_from_cache(self) -> "DownloadedBatch":
+        """Complete the batch without uploading it, when all its requests are answered from the cache."""
+        remote_id = f"cache-{self.unique_id}"
+        total = len(self.request_table)
+        self._save_remote_state({
+            "id": remote_id,
+            "local_status": LocalBatchStatus.COMPLETED.value,
+            "request_counts": {"total": total, "completed": total, "failed": 0},
+        })
+        upsert_json(self._files.batch_params, {"remote_id": remote_id, "uploaded_at": datetime.now(timezone.utc)})
+        logger.info(f"Batch {self.params.name}:{self.unique_id} answered from the result cache, not uploaded")
+        return cast(UploadedBatch, UploadedBatch.from_directory(self.batcher, self.directory)).download(sync=False)
+
+    def upload(
+        self, use_cache: bool = False, max_cached_temperature: float = 0.0, deduplicate: bool = False
+    ) -> Union["UploadedBatch", "DownloadedBatch"]:
         """Upload the batch to the provider, and return the uploaded batch object.
         The editable batch object is no longer valid after this operation (because the batch is not
         editable anymore after uploading).
 
+        When use_cache is set and all the requests are answered from the cache, nothing is uploaded: the
+        batch is completed right away, and the downloaded batch is returned.
+
+        Args:
+            use_cache: Whether to answer the requests already answered in a previously downloaded batch
+                (same provider, model, messages, system prompt and sampling params) from the result cache
+                of the batcher. These requests are not uploaded, and their cached results are merged in the
+                results of the batch when it is downloaded.
+            max_cached_temperature: The highest temperature of the requests answered from the cache. By
+                default only deterministic (temperature 0) requests are, the requests without explicit
+                temperature never are.
+            deduplicate: Whether to upload once the identical requests of the batch (same messages and params,
+                after global params). The result of the uploaded request is given to all its duplicates when
+                the batch is downloaded.
+
         Raises:
             ValueError: If provider is not set
             RuntimeError: If the batch upload fails
@@ -133,9 +265,19 @@ class EditableBatch(Batch):
             )
             return self
         self.prevalidate_requests()
+        # the duplicates are excluded first, so only one of them is looked up in the result cache
+        if deduplicate:
+            self._exclude_duplicated_requests()
+        else:
+            self._files.duplicates.unlink(missing_ok=True)
+        if use_cache:
+            if self._exclude_cached_requests(max_cached_temperature):
+                return self._complete_from_cache()
+        else:
+            self._files.cached_results.unlink(missing_ok=True)
         remote_id = self._provider.upload_batch(self)
         logger.info(f"Batch {self.params.name}:{self.unique_id} uploaded, remote_id: {remote_id})")
-        upsert_json(self._files.batch_params, {"remote_id": remote_id})
+        upsert_json(self._files.batch_params, {"remote_id": remote_id, "uploaded_at": datetime.now(timezone.utc)})
         if not remote_id:
             raise RuntimeError("Failed to upload batch, no remote id returned")
         return UploadedBatch.from_directory(self.batcher, self.directory)
@@ -154,6 +296,8 @@ class UploadedBatch(Batch):
     def sync(self) -> None:
         """Synchronize the local batch state with the remote provider state."""
         self.__check_correct()
+        if self._answered_locally:
+            return
         self._provider.sync_batch(self)
 
     def cancel(self) -> None:
@@ -179,23 +323,86 @@ class UploadedBatch(Batch):
         new_directory = self._copy_dir(new_name, new_unique_id, keep_provider)
         return EditableBatch.from_directory(self.batcher, new_directory)
 
-    def download(self) -> "DownloadedBatch":
+    def _merge_local_results(self) -> None:
+        """Add the results of the requests which were not uploaded (see ``EditableBatch.upload``) to the
+        downloaded results: the results served from the cache, and the results of the duplicated requests."""
+        if self._files.cached_results.exists():
+            append_jsonl(self._files.remote_results, read_jsonl(self._files.cached_results))
+        if self._files.duplicates.exists():
+            duplicated_results = []
+            for duplicate in iter_jsonl(self._files.duplicates):
+                result = self._results_index.get(duplicate["duplicate_of"])
+                if result is None:
+                    logger.warning(f"No result for request {duplicate['duplicate_of']}, duplicated by {duplicate['custom_id']}")
+                    continue
+                duplicated_results.append(self._provider.with_result_custom_id(result, duplicate["custom_id"]))
+            append_jsonl(self._files.remote_results, duplicated_results)
+
+    def _fill_result_cache(self) -> None:
+        """Store the successful downloaded results in the result cache of the batcher."""
+        requests = {request.custom_id: request for request in self.request_table if request.temperature is not None}
+        if not requests:
+            return
+        provider = self._provider
+        entries = []
+        for result in iter_jsonl(self._files.remote_results):
+            request = requests.get(provider.result_custom_id(result))
+            if request is None or provider.decode_text_result(result).error is not None:
+                continue
+            entries.append((self.batcher.result_cache.request_key(provider.name, request), result))
+        self.batcher.result_cache.put_many(entries)
+
+    @property
+    def has_results(self) -> bool:
+        """Whether the batch has results to download: it is completed, or it failed or was cancelled
+        after processing some of its requests (e.g. an expired OpenAI batch, see ``Provider.has_partial_results``)."""
+        status = self.status
+        if status == LocalBatchStatus.COMPLETED:
+            return True
+        remote_state = self._remote_state
+        return (
+            status in (LocalBatchStatus.FAILED, LocalBatchStatus.CANCELLED)
+            and remote_state is not None
+            and not self._answered_locally
+            and self._provider.has_partial_results(remote_state)
+        )
+
+    def download(self, sync: bool = True) -> "DownloadedBatch":
         """
         Download results from the remote provider.
-        If the batch is not completed, raise an error.
+        If the batch has no results (see ``has_results``), raise an error.
+
+        Args:
+            sync: Whether to sync the batch before downloading, can be disabled if it has just been synced.
 
         Returns:
-            DownloadedBatch: The downloaded batch object.
+            DownloadedBatch: The downloaded batch object. A failed or cancelled batch keeps its status.
         Raises:
-            ValueError: If the batch is not completed.
+            ValueError: If the batch has no results.
         """
         self.__check_correct()
-        self.sync()
-        if self.status != LocalBatchStatus.COMPLETED:
+        if sync:
+            self.sync()
+        if not self.has_results:
             raise ValueError("Batch not completed")
-        self._provider.download_batch_results(self)
-
-        return DownloadedBatch.from_directory(self.batcher, self.directory)
+        if self._answered_locally:
+            # all the results are merged from the result cache and the duplicates
+            self._save_remote_results([])
+        else:
+            self._provider.download_batch_results(self)
+        try:
+            self._fill_result_cache()
+        except Exception as e:
+            logger.warning(f"Could not cache results of batch {self.params.name}:{self.unique_id}: {e}")
+        self._merge_local_results()
+
+        downloaded_batch = cast(DownloadedBatch, DownloadedBatch.from_directory(self.batcher, self.directory))
+        try:
+            downloaded_batch._write_results_cache()
+        except Exception as e:
+            # The cache is rebuilt on first access, a conversion error should not fail the download
+            logger.warning(f"Could not convert results of batch {self.params.name}:{self.unique_id}: {e}")
+        return downloaded_batch
 
 
 class DownloadedBatch(Batch):
@@ -204,20 +411,149 @@ class DownloadedBatch(Batch):
     This represents a Batch object that has already been downloaded from a provider.
     """
 
-    def get_results(self) -> Optional[List[Result]]:
+    # Bump when the Result model changes, to invalidate the results cache of existing batches
+    RESULTS_SCHEMA_VERSION = 1
+
+    def _results_cache_key(self) -> Dict[str, Any]:
+        stat = self._files.remote_results.stat()
+        return {
+            "schema_version": self.RESULTS_SCHEMA_VERSION,
+            "remote_results_size": stat.st_size,
+            "remote_results_mtime_ns": stat.st_mtime_ns,
+        }
+
+    def _results_cache_is_valid(self) -> bool:
+        if not self._files.results.exists() or not self._files.results_meta.exists():
+            return False
+        try:
+            return read_json(self._files.results_meta) == self._results_cache_key()
+        except ValueError:
+            return False
+
+    def _write_results_cache(self) -> List[Result]:
+        """Convert the provider results once, and store them in the provider-neutral results file."""
+        jsonlines = read_jsonl(self._files.remote_results)
+        results = [self._provider.convert_batch_result(result) for result in jsonlines]
+        write_jsonl(self._files.results, results)
+        # The metadata is written last: a partially written cache is never considered valid
+        write_json(self._files.results_meta, self._results_cache_key())
+        return results
+
+    def _read_results_cache(self) -> List[Result]:
+        with open(self._files.results, "rb") as f:
+            return [Result.model_validate_json(line) for line in f if line.strip()]
+
+    def __check_correct(self) -> None:
+        assert self._provider, "Provider not set"
+        assert self.remote_id, "Remote ID not found. Please upload the batch first."
+
+        # the failed and cancelled batches can have partial results, see UploadedBatch.has_results
+        assert self.status in (LocalBatchStatus.DOWNLOADED, LocalBatchStatus.FAILED, LocalBatchStatus.CANCELLED)
+
+    def _decode_results(self, jsonlines: List[Dict[str, Any]], mode: ResultsMode) -> List[Any]:
+        if mode == "raw":
+            return jsonlines
+        elif mode == "text":
+            return [self._provider.decode_text_result(result) for result in jsonlines]
+        elif mode == "full":
+            return [self._provider.convert_batch_result(result) for result in jsonlines]
+        raise ValueError(f"Invalid results mode: {mode}, expected one of 'raw', 'text' or 'full'")
+
+    def get_results(
+        self, start: Optional[int] = None, stop: Optional[int] = None, mode: ResultsMode = "full"
+    ) -> Optional[Union[List[Result], List[TextResult], List[Dict[str, Any]]]]:
         """
         Returns the results of the batch.
 
+        Args:
+            start: Index of the first result to return. Optional, defaults to the first result.
+            stop: Index after the last result to return. Optional, defaults to the end of the results.
+                When start or stop is given, only the selected results are read, using the results index.
+            mode: How the results are decoded:
+
+                - ``"full"`` (default): validated ``Result`` objects
+                - ``"text"``: lightweight ``TextResult`` tuples (first choice text, finish reason and token
+                  usage), decoded without validation, much faster on large batches
+                - ``"raw"``: the provider results, as downloaded
+
+        The provider results are converted once (at download time, or on first access), and stored
+        in a provider-neutral results file which is used by the next calls in ``"full"`` mode.
+
         Returns:
             List[Result]: The results of the batch.
         """
-        assert self._provider, "Provider not set"
-        assert self.remote_id, "Remote ID not found. Please upload the batch first."
+        self.__check_correct()
 
-        assert self.status == LocalBatchStatus.DOWNLOADED
+        if start is None and stop is None:
+            if mode == "full":
+                if self._results_cache_is_valid():
+                    return self._read_results_cache()
+                return self._write_results_cache()
+            jsonlines = read_jsonl(self._files.remote_results)
+        else:
+            jsonlines = self._results_index.slice(start, stop)
+        return self._decode_results(jsonlines, mode)
 
-        jsonlines = read_jsonl(self._files.remote_results)
-        return [self._provider.convert_batch_result(result) for result in jsonlines]
+    def get_result(self, custom_id: str, mode: ResultsMode = "full") -> Union[Result, TextResult, Dict[str, Any]]:
+        """
+        Returns the result of a single request of the batch.
+
+        Only the bytes of this result are read, using the results index.
+
+        Args:
+            custom_id: The custom_id of the request
+            mode: How the result is decoded, see ``get_results``
+
+        Raises:
+            KeyError: If no result with this custom_id is found
+        """
+        self.__check_correct()
+
+        result = self._results_index.get(custom_id)
+        if result is None:
+            raise KeyError(f"Result {custom_id} not found in batch {self.unique_id}")
+        return self._decode_results([result], mode)[0]
+
+    def _iter_text_results(self) -> Iterator[TextResult]:
+        self.__check_correct()
+        return (self._provider.decode_text_result(result) for result in iter_jsonl(self._files.remote_results))
+
+    def result_table(self) -> ResultTable:
+        """
+        Returns the results of the batch as a columnar ``ResultTable``, built in a single streaming pass
+        over the downloaded results (see ``get_results(mode="text")`` for the columns).
+        """
+        return ResultTable.from_results(self._iter_text_results())
+
+    def to_arrow(self, chunk_size: int = 65536) -> "pyarrow.Table":
+        """
+        Returns the results of the batch as an Arrow table (requires ``pyarrow``).
+
+        The table is built in a streaming pass, chunk_size results at a time, and the repeated strings
+        (finish_reason, error) are dictionary encoded.
+        """
+        # raises a helpful ImportError if pyarrow is not installed
+        schema = ResultTable.arrow_schema()
+        import pyarrow as pa
+
+        chunks = ResultTable.iter_chunks(self._iter_text_results(), chunk_size)
+        return pa.Table.from_batches([chunk.to_arrow_batch() for chunk in chunks], schema=schema)
+
+    def to_parquet(self, path: Union[str, Path], chunk_size: int = 65536) -> None:
+        """
+        Write the results of the batch to a Parquet file (requires ``pyarrow``).
+
+        The results are written in a streaming pass, one row group of chunk_size results at a time.
+        """
+        ResultTable.write_parquet(ResultTable.iter_chunks(self._iter_text_results(), chunk_size), path)
+
+    def to_pandas(self, chunk_size: int = 65536) -> "pandas.DataFrame":
+        """
+        Returns the results of the batch as a pandas DataFrame (requires ``pyarrow`` and ``pandas``).
+
+        The repeated strings (finish_reason, error) are categorical columns.
+        """
+        return self.to_arrow(chunk_size).to_pandas()
 
     def copy(self, new_name: Optional[str] = None, new_unique_id: Optional[str] = None, keep_provider: bool = False) -> "EditableBatch":
         """Copy the batch to a new editablebatch.
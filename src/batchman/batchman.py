@@ -1,26 +1,57 @@
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, FIRST_EXCEPTION, ThreadPoolExecutor
+from concurrent.futures import as_completed as futures_as_completed
 from pathlib import Path
-from typing import List, Optional, Tuple, Union
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union, cast
 from pydantic import ValidationError
+import itertools
+import json
+import time
 import uuid
 import shutil
 
 from .providers.registry import ProviderRegistry
+from .models import Request, Result
 from .models.provider_config import ProviderConfig
-from .models.batch import Batch
-from .models.enums import LocalBatchStatus
-from .utils import upsert_json, autoinit
+from .models.request_table import RequestTable
+from .models.batch import Batch, BatchFiles, BatchSummary
+from .models.enums import FINAL_STATUSES, LocalBatchStatus
+from .utils import read_json, upsert_json, autoinit
+from .utils.backoff import Backoff
+from .utils.blobs import BlobStore
+from .result_cache import ResultCache
+from .batch_index import BatchIndex
+from .utils.files import COMPRESSION_SUFFIXES, recompress_file
 from .utils.logging import logger
 from .batch_interfaces import EditableBatch, UploadedBatch, DownloadedBatch
 
 
 class Batcher:
-    """Manage batches of requests on different providers."""
+    """Manage batches of requests on different providers.
 
-    def __init__(self, batches_dir: Path = Path("batches")):
+    Args:
+        batches_dir: The directory where the batches are stored
+        compression: Compression of the large batch files (requests, remote requests and results) of the
+            new batches: "zstd" (requires the ``zstandard`` package), "gzip", or None (default) for plain text.
+            Existing batches are read whatever their compression, see ``compress_batches`` to migrate them.
+    """
+
+    def __init__(self, batches_dir: Path = Path("batches"), compression: Optional[str] = None):
         if isinstance(batches_dir, str):
             batches_dir = Path(batches_dir)
+        if compression is not None and compression not in COMPRESSION_SUFFIXES:
+            raise ValueError(f"Unknown compression {compression}, expected one of {list(COMPRESSION_SUFFIXES)}")
         batches_dir.mkdir(parents=True, exist_ok=True)
         self.batches_dir = batches_dir
+        self.compression = compression
+        # Content-addressed store of the requests files shared between batches (see EditableBatch.copy)
+        self.blobs = BlobStore(batches_dir / ".blobs" / "files")
+        # Content-addressed store of the large message contents and images (see EditableBatch.add_requests),
+        # referenced by digest from the requests files, so it is never garbage collected
+        self.content_blobs = BlobStore(batches_dir / ".blobs" / "content")
+        # Results of the downloaded batches, reused by the batches uploaded with use_cache=True
+        self.result_cache = ResultCache(batches_dir / ".cache")
+        # Summaries of the batches, to list them without reading all the batch files
+        self.index = BatchIndex(self)
 
     # NOT UP TO DATE
     # @autoinit
@@ -147,6 +178,9 @@ class Batcher:
         uploaded_batches = []
         downloaded_batches = []
         for batch_dir in self.batches_dir.iterdir():
+            # hidden entries (e.g. the blob store) are not batches
+            if batch_dir.name.startswith("."):
+                continue
             try:
                 batch = Batch.from_directory(self, batch_dir)
                 if batch.remote_id is None:
@@ -161,29 +195,340 @@ class Batcher:
                 errors.append(f"Error loading batch from {batch_dir}: {e}")
         return editable_batches, uploaded_batches, downloaded_batches, errors
 
-    def sync_batches(self) -> List[str]:
+    def _sync_batch(self, batch: UploadedBatch) -> None:
+        batch.sync()
+        if batch.has_results:
+            # just synced, no need to sync again before downloading
+            batch.download(sync=False)
+
+    def sync_batches(self, max_workers: int = 1) -> List[str]:
         """Sync all batches in the batches directory in a error resilient way.
 
+    The completed batches are downloaded, as well as the partial results of the failed or cancelled batches
+    (see ``UploadedBatch.has_results``). The other batches in a final state are not synced.
+
+    Args:
+        max_workers: The maximum number of batches synced concurrently
+
     Returns:
         List of errors with the batch directory and the corresponding exception
     """
 
         # no need to sync editable batches (they are not uploaded), and downloaded batches are already synced
         _, uploaded_batches, _, errors = self.list_batches()
+        batches_to_sync = [batch for batch in uploaded_batches if batch.status not in FINAL_STATUSES or batch.has_results]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [(batch, executor.submit(self._sync_batch, batch)) for batch in batches_to_sync]
+            for batch, future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append(
+                        f"Error syncing batch {batch.params.name}:{batch.unique_id}: {e}"
+                    )
 
-        for batch in uploaded_batches:
-            try:
-                batch.sync()
-                if batch.status == LocalBatchStatus.COMPLETED:
-                    batch.download()
+        return errors
 
-            except Exception as e:
-                errors.append(
-                    f"Error syncing batch {batch.params.name}:{batch.unique_id}: {e}"
-                )
+    def batch_summaries(self, statuses: Optional[List[LocalBatchStatus]] = None) -> Tuple[List[BatchSummary], List[str]]:
+        """List the summaries of the batches in the batches directory, without syncing them.
+
+        Faster than ``list_batches``: the summaries are kept in a persistent index (see ``BatchIndex``), and
+        only the batches modified since the last listing are read.
+
+        Args:
+            statuses: Only return the batches with one of these statuses. Optional, defaults to all the batches.
+
+        Returns:
+            A tuple containing:
+            - List of the batch summaries
+            - List of errors that occurred while reading the batches
+        """
+        summaries, errors = self.index.summaries()
+        if statuses is not None:
+            summaries = [summary for summary in summaries if summary.status in statuses]
+        return summaries, errors
+
+    def upload_batches(self, batches: List[EditableBatch], max_workers: int = 8) -> Tuple[List[UploadedBatch], List[str]]:
+        """Upload several batches in parallel, in a error resilient way.
 
+    Args:
+        batches: The batches to upload (e.g. from ``EditableBatch.fan_out``)
+        max_workers: The maximum number of concurrent uploads
+
+    Returns:
+        A tuple containing:
+        - List of the successfully uploaded batches, in the order of the given batches
+        - List of errors that occurred while uploading the batches
+    """
+        uploaded_batches = []
+        errors = []
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [(batch, executor.submit(batch.upload)) for batch in batches]
+            for batch, future in futures:
+                try:
+                    # uploaded without the result cache, so never completed right away
+                    uploaded_batches.append(cast(UploadedBatch, future.result()))
+                except Exception as e:
+                    errors.append(f"Error uploading batch {batch.params.name}:{batch.unique_id}: {e}")
+
+        return uploaded_batches, errors
+
+    def _sync_many(self, batches: List[UploadedBatch]) -> Dict[str, Exception]:
+        # batches of the same provider and config are synced together, with bulk status queries when supported
+        groups: Dict[str, List[UploadedBatch]] = {}
+        for batch in batches:
+            groups.setdefault(json.dumps(batch.params.provider, sort_keys=True), []).append(batch)
+        errors: Dict[str, Exception] = {}
+        for group in groups.values():
+            errors.update(group[0]._provider.sync_batches(group))
         return errors
 
+    def as_completed(
+        self,
+        batches: List[Union[UploadedBatch, DownloadedBatch]],
+        timeout: Optional[float] = None,
+        poll_interval: float = 10.0,
+        max_poll_interval: float = 300.0,
+        download_workers: int = 4,
+    ) -> Iterator[Union[DownloadedBatch, UploadedBatch]]:
+        """Yield the batches as soon as they are finished, downloading the completed ones.
+
+    All the pending batches are polled together, with bulk status queries when the provider supports them.
+    The polling interval is shared: it backs off (with jitter) from poll_interval to max_poll_interval while
+    no batch progresses, and is reset when one does.
+
+    Args:
+        batches: The uploaded batches to wait for
+        timeout: The maximum number of seconds to wait. Optional, defaults to no limit.
+        poll_interval: The minimum interval between two polls, in seconds
+        max_poll_interval: The maximum interval between two polls, in seconds
+        download_workers: The maximum number of batches downloaded concurrently
+
+    Returns:
+        An iterator over the finished batches, in completion order: the downloaded batches, and the failed
+        or cancelled batches (as UploadedBatch, check their status)
+
+    Raises:
+        ValueError: If a batch has not been uploaded
+        TimeoutError: If some batches are not finished after timeout seconds
+    """
+        pending: Dict[str, UploadedBatch] = {}
+        for batch in batches:
+            if isinstance(batch, EditableBatch):
+                raise ValueError(f"Batch {batch.params.name}:{batch.unique_id} has not been uploaded")
+            if isinstance(batch, DownloadedBatch):
+                yield batch
+            else:
+                pending[batch.unique_id] = batch
+        yield from self._poll_finished(pending, timeout, poll_interval, max_poll_interval, download_workers)
+
+    def _poll_finished(
+        self,
+        pending: Dict[str, UploadedBatch],
+        timeout: Optional[float] = None,
+        poll_interval: float = 10.0,
+        max_poll_interval: float = 300.0,
+        download_workers: int = 4,
+        add_batches: Optional[Callable[[bool], Optional[List[UploadedBatch]]]] = None,
+    ) -> Iterator[Union[DownloadedBatch, UploadedBatch]]:
+        """Poll the pending batches until they are finished, see ``as_completed``.
+
+        add_batches is called before each poll, to add batches to the polled ones without resetting the polling
+        interval. Its argument tells whether no batch is pending (it can then wait for new batches), and it
+        returns None once no batch will be added anymore.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        backoff = Backoff(poll_interval, max(poll_interval, max_poll_interval), jitter=0.1)
+        last_seen = {unique_id: batch.summary() for unique_id, batch in pending.items()}
+        with ThreadPoolExecutor(max_workers=download_workers) as executor:
+            while pending or add_batches is not None:
+                if add_batches is not None:
+                    added = add_batches(not pending)
+                    if added is None:
+                        add_batches = None
+                    for batch in added or []:
+                        pending[batch.unique_id] = batch
+                        last_seen[batch.unique_id] = batch.summary()
+                    if not pending:
+                        continue
+
+                errors = self._sync_many(list(pending.values()))
+                for unique_id, error in errors.items():
+                    logger.warning(f"Error syncing batch {unique_id}: {error}")
+
+                changed = False
+                downloads = {}
+                for unique_id, batch in list(pending.items()):
+                    summary = batch.summary()
+                    changed |= summary.status != last_seen[unique_id].status or summary.progress != last_seen[unique_id].progress
+                    last_seen[unique_id] = summary
+                    if summary.status == LocalBatchStatus.COMPLETED:
+                        downloads[executor.submit(batch.download, sync=False)] = unique_id
+                    elif summary.status in FINAL_STATUSES:
+                        del pending[unique_id]
+                        yield batch
+
+                for future in futures_as_completed(downloads):
+                    unique_id = downloads[future]
+                    try:
+                        downloaded = future.result()
+                    except Exception as e:
+                        # retried at the next poll
+                        logger.warning(f"Error downloading batch {unique_id}: {e}")
+                        continue
+                    del pending[unique_id]
+                    yield downloaded
+
+                if not pending and add_batches is None:
+                    break
+                delay = backoff.next(changed)
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"{len(pending)} batches not finished after {timeout} seconds")
+                    delay = min(delay, remaining)
+                time.sleep(delay)
+
+    def wait(
+        self,
+        batches: List[Union[UploadedBatch, DownloadedBatch]],
+        timeout: Optional[float] = None,
+        return_when: str = ALL_COMPLETED,
+        poll_interval: float = 10.0,
+        max_poll_interval: float = 300.0,
+    ) -> Tuple[List[Union[DownloadedBatch, UploadedBatch]], List[Union[UploadedBatch, DownloadedBatch]]]:
+        """Wait for the batches to be finished, downloading the completed ones (see ``as_completed``).
+
+    Args:
+        batches: The uploaded batches to wait for
+        timeout: The maximum number of seconds to wait. Optional, defaults to no limit.
+        return_when: When to return, like ``concurrent.futures.wait``: "ALL_COMPLETED" (default),
+            "FIRST_COMPLETED", or "FIRST_EXCEPTION" (when a batch fails or is cancelled)
+        poll_interval: The minimum interval between two polls, in seconds
+        max_poll_interval: The maximum interval between two polls, in seconds
+
+    Returns:
+        A tuple containing:
+        - List of the finished batches, in completion order (downloaded, failed or cancelled)
+        - List of the batches not finished, from the given batches
+    """
+        if return_when not in (ALL_COMPLETED, FIRST_COMPLETED, FIRST_EXCEPTION):
+            raise ValueError(f"Invalid return_when: {return_when}")
+        done = []
+        try:
+            for batch in self.as_completed(batches, timeout, poll_interval, max_poll_interval):
+                done.append(batch)
+                if return_when == FIRST_COMPLETED:
+                    break
+                if return_when == FIRST_EXCEPTION and batch.status != LocalBatchStatus.DOWNLOADED:
+                    break
+        except TimeoutError:
+            pass
+        done_ids = {batch.unique_id for batch in done}
+        return done, [batch for batch in batches if batch.unique_id not in done_ids]
+
+    def _create_shards(
+        self,
+        requests: Union[Iterable[Request], RequestTable],
+        name: str,
+        provider: str,
+        provider_config: Optional[ProviderConfig],
+        max_shard: int,
+        request_params: Optional[Dict[str, Any]],
+    ) -> Iterator[EditableBatch]:
+        if isinstance(requests, RequestTable):
+            chunks: Iterable[Union[List[Request], RequestTable]] = requests.shards(max_shard)
+        else:
+            iterator = iter(requests)
+            chunks = iter(lambda: list(itertools.islice(iterator, max_shard)), [])
+        for index, chunk in enumerate(chunks):
+            batch = self.create_batch(f"{name}-{index}", provider=provider, provider_config=provider_config)
+            if request_params:
+                batch.override_request_params(**request_params)
+            batch.add_requests(chunk)
+            yield batch
+
+    def map(
+        self,
+        requests: Union[Iterable[Request], RequestTable],
+        provider: str,
+        max_shard: int = 10_000,
+        ordered: bool = True,
+        name: str = "map",
+        provider_config: Optional[ProviderConfig] = None,
+        request_params: Optional[Dict[str, Any]] = None,
+        max_workers: int = 8,
+        poll_interval: float = 10.0,
+        max_poll_interval: float = 300.0,
+    ) -> Iterator[Result]:
+        """Run requests through a provider, and yield their results.
+
+    The requests are split in batches (shards) of at most max_shard requests, uploaded concurrently while the
+    next shards are created, and the shards are downloaded as they complete (see ``as_completed``). The shards
+    are regular batches, they can be inspected with ``batchman``.
+
+    Args:
+        requests: The requests (any iterable, consumed shard by shard, or a RequestTable)
+        provider: The name of the provider to use
+        max_shard: The maximum number of requests of a shard
+        ordered: Whether to yield the results in the order of the requests, or in completion order (faster).
+            In order, the results of a shard are read at once and yielded after the ones of the previous shards.
+        name: The name of the shards, suffixed by their index
+        provider_config: The configuration for the provider. Optional, defaults to the default config.
+        request_params: Global request params of the shards (see ``EditableBatch.override_request_params``)
+        max_workers: The maximum number of concurrent uploads
+        poll_interval: The minimum interval between two polls, in seconds
+        max_poll_interval: The maximum interval between two polls, in seconds
+
+    Returns:
+        An iterator over the results. A request without result gets a result with an error: the partial results
+        of a failed or cancelled shard (e.g. expired, see ``UploadedBatch.has_results``) are downloaded, and its
+        other requests get an error.
+
+    Raises:
+        ValueError: If a shard can't be uploaded, or fails or is cancelled without any result
+    """
+        if max_shard <= 0:
+            raise ValueError("max_shard must be positive")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            uploads = [executor.submit(shard.upload) for shard in self._create_shards(
+                requests, name, provider, provider_config, max_shard, request_params
+            )]
+            shards: List[Union[UploadedBatch, DownloadedBatch]] = []
+            for upload in uploads:
+                shards.append(cast(UploadedBatch, upload.result()))
+
+        positions = {shard.unique_id: position for position, shard in enumerate(shards)}
+        downloaded: Dict[int, DownloadedBatch] = {}
+        next_position = 0
+        for batch in self.as_completed(shards, poll_interval=poll_interval, max_poll_interval=max_poll_interval):
+            if not isinstance(batch, DownloadedBatch):
+                if not batch.has_results:
+                    raise ValueError(f"Batch {batch.params.name}:{batch.unique_id} {batch.status.value}")
+                # the processed requests of a failed or cancelled shard keep their results
+                batch = batch.download(sync=False)
+            if not ordered:
+                yield from self._shard_results(batch)
+                continue
+            downloaded[positions[batch.unique_id]] = batch
+            while next_position in downloaded:
+                yield from self._shard_results(downloaded.pop(next_position))
+                next_position += 1
+
+    @staticmethod
+    def _shard_results(shard: DownloadedBatch) -> Iterator[Result]:
+        # the results are read at once, rather than by custom_id, and reordered like the requests
+        results = {result.custom_id: result for result in cast(Optional[List[Result]], shard.get_results()) or []}
+        for custom_id in shard.request_table.custom_ids:
+            result = results.get(custom_id)
+            if result is None:
+                result = Result(
+                    custom_id=custom_id, choices=[], error=f"No result in batch {shard.unique_id} ({shard.status.value})"
+                )
+            yield result
+
     def delete_batch(self, unique_id: str) -> None:
         """Delete a batch given its unique ID.
 
@@ -208,7 +553,38 @@ class Batcher:
 
         if not batch_dir.exists():
             raise FileNotFoundError(f"Batch with ID '{unique_id}' does not exist")
+        requests_blob = BatchFiles(directory=batch_dir).requests_blob
+        digest = read_json(requests_blob).get("digest") if requests_blob.exists() else None
         shutil.rmtree(batch_dir)
+        if digest:
+            # remove the shared requests file if this batch was its last user
+            self.blobs.release(digest)
+
+    def compress_batches(self, compression: Optional[str]) -> List[str]:
+        """Rewrite the large files (requests, remote requests and results) of all batches with the given
+        compression, in place.
+
+        Args:
+            compression: "zstd", "gzip", or None to decompress the files
+
+        Returns:
+            List of errors with the file and the corresponding exception
+        """
+        errors = []
+        for batch_dir in self.batches_dir.iterdir():
+            if not batch_dir.is_dir() or batch_dir.name.startswith("."):
+                continue
+            files = BatchFiles(directory=batch_dir)
+            for path in (files.requests, files.remote_requests, files.remote_results):
+                if not path.exists():
+                    continue
+                try:
+                    recompress_file(path, compression)
+                except Exception as e:
+                    errors.append(f"Error compressing {path}: {e}")
+        # the recompressed files don't share the previous blobs anymore
+        self.blobs.gc()
+        return errors
 
     def _rm_batch_dir(self, im_sure_to_delete_all_batches: bool = False) -> None:
         """Remove the batches directory and all its contents.
@@ -1,20 +1,216 @@
-import click
+import json
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
+
+import click
 
-from .utils.ui import TableApp
+from .models.enums import LocalBatchStatus
 from .utils.logging import logger
 
 
-@click.command()
+@click.group(invoke_without_command=True)
 @click.option("--dir", type=click.Path(exists=False), default=Path.home() / ".batchman" / "batches",
                  help="The directory to list the batches from. You shouldn't need to change this.")
-def cli(dir: Optional[str]) -> None:
-    """Manage batches of requests."""
+@click.option("--refresh", type=click.FloatRange(min=0), default=60, show_default=True,
+              help="Interval in seconds between the syncs of the interactive table, backing off while the "
+                   "batches don't progress (0 to disable).")
+@click.pass_context
+def cli(ctx: click.Context, dir: Optional[str], refresh: float) -> None:
+    """Manage batches of requests.
+
+    Without command, opens the interactive batches table."""
+    ctx.obj = dir
+
+    if ctx.invoked_subcommand is None:
+        # the UI stack is only imported for the interactive table
+        from .utils.ui import TableApp
+
+        app = TableApp(dir, poll_interval=refresh)
+        app.run()
+
+
+def _exit_on_errors(errors: List[str]) -> None:
+    for error in errors:
+        click.echo(error, err=True)
+    if errors:
+        raise SystemExit(1)
+
+
+@cli.command("ls")
+@click.option("--json", "as_json", is_flag=True, help="Output the batches as a JSON list.")
+@click.option("--status", "statuses", multiple=True, type=click.Choice([status.value for status in LocalBatchStatus]),
+              help="Only list the batches with this status (can be repeated).")
+@click.pass_obj
+def ls(dir: str, as_json: bool, statuses: Tuple[str, ...]) -> None:
+    """List the batches, from their local state (without syncing them)."""
+    from .batchman import Batcher
+
+    batcher = Batcher(batches_dir=Path(dir))
+    summaries, errors = batcher.batch_summaries([LocalBatchStatus(status) for status in statuses] or None)
+    if as_json:
+        click.echo(json.dumps([summary.to_dict() for summary in summaries]))
+    else:
+        for summary in summaries:
+            click.echo("\t".join([
+                summary.unique_id, summary.name, summary.status.value, summary.provider or "N/A", summary.remote_id or "N/A"
+            ]))
+    _exit_on_errors(errors)
+
+
+@cli.command()
+@click.option("--parallel", type=click.IntRange(min=1), default=1, show_default=True,
+              help="The maximum number of batches synced concurrently.")
+@click.pass_obj
+def sync(dir: str, parallel: int) -> None:
+    """Sync the uploaded batches with their provider, and download the completed ones."""
+    from .batchman import Batcher
+
+    batcher = Batcher(batches_dir=Path(dir))
+    _exit_on_errors(batcher.sync_batches(max_workers=parallel))
+
+
+@cli.command()
+@click.argument("unique_ids", nargs=-1)
+@click.option("--all", "download_all", is_flag=True,
+              help="Download all the batches completed according to their last synced state.")
+@click.option("--parallel", type=click.IntRange(min=1), default=1, show_default=True,
+              help="The maximum number of batches downloaded concurrently.")
+@click.pass_obj
+def download(dir: str, unique_ids: Tuple[str, ...], download_all: bool, parallel: int) -> None:
+    """Download the results of the given batches (or of all the completed batches with --all).
+
+    Outputs the unique IDs of the downloaded batches."""
+    from .batchman import Batcher
+    from .batch_interfaces import DownloadedBatch, UploadedBatch
+
+    if not unique_ids and not download_all:
+        raise click.UsageError("Give the unique IDs of the batches to download, or --all")
+
+    batcher = Batcher(batches_dir=Path(dir))
+    errors = []
+    # The completed batches don't need to be synced before downloading
+    to_download = [(unique_id, True) for unique_id in unique_ids]
+    if download_all:
+        summaries, errors = batcher.batch_summaries([LocalBatchStatus.COMPLETED])
+        to_download.extend((summary.unique_id, False) for summary in summaries if summary.unique_id not in unique_ids)
+
+    def download_batch(unique_id: str, sync: bool) -> None:
+        batch = batcher.load_batch(unique_id)
+        if isinstance(batch, DownloadedBatch):
+            return
+        if not isinstance(batch, UploadedBatch):
+            raise ValueError("Batch has not been uploaded yet")
+        batch.download(sync=sync)
+
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        futures = [(unique_id, executor.submit(download_batch, unique_id, sync)) for unique_id, sync in to_download]
+        for unique_id, future in futures:
+            try:
+                future.result()
+                click.echo(unique_id)
+            except Exception as e:
+                errors.append(f"Error downloading batch {unique_id}: {e}")
+    _exit_on_errors(errors)
+
+
+def _parse_rate_limits(values: Tuple[str, ...]) -> Dict[str, float]:
+    rate_limits = {}
+    for value in values:
+        provider, _, per_minute = value.partition("=")
+        try:
+            rate_limits[provider] = float(per_minute)
+        except ValueError:
+            raise click.BadParameter(f"expected PROVIDER=CALLS_PER_MINUTE, got {value}", param_hint="--rate-limit")
+    return rate_limits
+
+
+@cli.command()
+@click.option("--min-interval", type=click.FloatRange(min=1), default=30, show_default=True,
+              help="The minimum interval between two polls of a batch, in seconds.")
+@click.option("--max-interval", type=click.FloatRange(min=1), default=1800, show_default=True,
+              help="The maximum interval between two polls of a batch, in seconds.")
+@click.option("--parallel", type=click.IntRange(min=1), default=4, show_default=True,
+              help="The maximum number of batches synced, and downloaded, concurrently.")
+@click.option("--rate-limit", "rate_limits", multiple=True, metavar="PROVIDER=CALLS_PER_MINUTE",
+              help="The maximum number of calls per minute to a provider (can be repeated, default 60).")
+@click.option("--once", is_flag=True, help="Exit once all the batches are downloaded, cancelled or failed.")
+@click.option("--deadline-margin", type=click.FloatRange(min=0), default=3600, show_default=True,
+              help="Flag the batches not expected to complete this many seconds before the end of their completion window.")
+@click.option("--resubmit", is_flag=True, help="Resubmit the requests of the flagged batches in a new batch.")
+@click.option("--resubmit-to", metavar="PROVIDER", default=None,
+              help="The provider to resubmit the requests to (defaults to the provider of the batch).")
+@click.pass_obj
+def watch(
+    dir: str, min_interval: float, max_interval: float, parallel: int, rate_limits: Tuple[str, ...], once: bool,
+    deadline_margin: float, resubmit: bool, resubmit_to: Optional[str],
+) -> None:
+    """Poll the uploaded batches on an adaptive schedule, and download them as soon as they are completed.
+
+    The batches held by the upload scheduler are uploaded as the running batches finish, and the batches
+    at risk of expiring are flagged (and resubmitted with --resubmit)."""
+    from .batchman import Batcher
+    from .deadlines import DeadlineTracker
+    from .upload_scheduler import UploadScheduler
+    from .watcher import Watcher
+
+    batcher = Batcher(batches_dir=Path(dir))
+    watcher = Watcher(
+        batcher, min_interval=min_interval, max_interval=max_interval,
+        sync_workers=parallel, download_workers=parallel, rate_limits=_parse_rate_limits(rate_limits),
+        scheduler=UploadScheduler(batcher),
+        deadlines=DeadlineTracker(batcher, margin=deadline_margin, resubmit=resubmit or resubmit_to is not None, provider=resubmit_to),
+    )
+    try:
+        errors = watcher.run(once=once)
+    except KeyboardInterrupt:
+        return
+    if once:
+        _exit_on_errors(errors)
+
+
+@cli.command()
+@click.option("--secret", envvar="OPENAI_WEBHOOK_SECRET", required=True,
+              help="The webhook signing secret (defaults to the OPENAI_WEBHOOK_SECRET environment variable).")
+@click.option("--host", default="127.0.0.1", show_default=True, help="The host to listen on.")
+@click.option("--port", type=click.IntRange(min=0, max=65535), default=8000, show_default=True, help="The port to listen on.")
+@click.option("--path", default="/webhooks", show_default=True, help="The path of the webhook endpoint.")
+@click.option("--poll-interval", type=click.FloatRange(min=0), default=600, show_default=True,
+              help="Minimum interval between the fallback polls of a batch, in seconds (0 to disable polling).")
+@click.pass_obj
+def webhooks(dir: str, secret: str, host: str, port: int, path: str, poll_interval: float) -> None:
+    """Receive the batch webhooks, and download the batches as soon as they are completed."""
+    from .batchman import Batcher
+    from .watcher import Watcher
+    from .webhooks import WebhookReceiver
+
+    batcher = Batcher(batches_dir=Path(dir))
+    receiver = WebhookReceiver(batcher, secret, host=host, port=port, path=path)
+    click.echo(f"Listening on {receiver.url}")
+    try:
+        if poll_interval:
+            receiver.start()
+            # fallback for the missed events
+            Watcher(batcher, min_interval=poll_interval, max_interval=max(poll_interval, 3600)).run()
+        else:
+            receiver.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        receiver.stop()
+
+
+@cli.command()
+@click.option("--format", "compression", type=click.Choice(["zstd", "gzip", "none"]), default="zstd", show_default=True,
+              help="The compression to use, 'none' to decompress the batches.")
+@click.pass_obj
+def compress(dir: str, compression: str) -> None:
+    """Compress the large files of all existing batches, in place."""
+    from .batchman import Batcher
 
-    app = TableApp(dir)
-    app.run()
+    batcher = Batcher(batches_dir=Path(dir))
+    _exit_on_errors(batcher.compress_batches(None if compression == "none" else compression))
 
 
 if __name__ == "__main__":
-    cli()
\ No newline at end of file
+    cli()
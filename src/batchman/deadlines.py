@@ -0,0 +1,219 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Dict, List, NamedTuple, Optional, Tuple, cast
+
+from .batch_interfaces import DownloadedBatch, EditableBatch, UploadedBatch
+from .models import LocalBatchStatus, ProviderConfig, Result
+from .models.progress import BatchProgress
+from .progress import ProgressTracker
+from .upload_scheduler import RUNNING_STATUSES
+from .utils.files import read_json, upsert_json, write_json
+from .utils.logging import logger
+
+if TYPE_CHECKING:
+    from .batchman import Batcher
+
+
+class DeadlineStatus(NamedTuple):
+    """Expected completion of a running batch against its completion window, see ``DeadlineTracker.check``."""
+    unique_id: str
+    name: str
+    deadline: datetime
+    eta: Optional[datetime]
+    """Estimated completion time, None until the batch progress is measured"""
+    at_risk: bool
+    resubmitted_as: Optional[str] = None
+    """unique_id of the batch the requests were resubmitted in, if any"""
+
+    def describe(self, now: Optional[datetime] = None) -> str:
+        """Return a one line description of the status, e.g. for logs."""
+        now = now or datetime.now(timezone.utc)
+        left = (self.deadline - now).total_seconds() / 3600
+        eta = f"expected in {(self.eta - now).total_seconds() / 3600:.1f}h" if self.eta else "no estimate yet"
+        description = f"Batch {self.name}:{self.unique_id} due in {left:.1f}h, {eta}"
+        if self.resubmitted_as:
+            description += f", resubmitted as {self.resubmitted_as}"
+        return description
+
+
+class DeadlineTracker:
+    """Flag the running batches which are not expected to complete within their completion window.
+
+    The deadline of a batch is its upload time plus its completion window (see ``BatchSummary.deadline``),
+    and its completion is estimated from its successive progress (see ``ProgressTracker``), as observed
+    by each ``check``. A batch is at risk when it is expected to complete less than ``margin`` seconds
+    before its deadline, or, while its progress is not measured yet, when its deadline is less than
+    ``stall_margin`` seconds away.
+
+    The requests of the batches at risk can be resubmitted before they expire, as a new batch of the same
+    provider (with a new completion window) or of another provider. By default, all the requests are
+    resubmitted right away and the original batch keeps running, so whichever finishes first can be used:
+    the providers do not tell which requests of a running batch are already processed. With ``cancel``,
+    the original batch is cancelled instead, and once it is cancelled (or failed), its partial results are
+    downloaded and only its requests without a successful result are resubmitted. The observations and the
+    resubmissions are stored in the batches directory, so a new tracker resumes them.
+
+    Args:
+        batcher: The batcher whose batches are tracked
+        margin: The minimum time between the estimated completion of a batch and its deadline, in seconds
+        stall_margin: The time before its deadline a batch without progress estimate is at risk, in seconds
+        resubmit: Whether to resubmit the requests of the batches at risk
+        provider: The provider to resubmit the requests to. Optional, defaults to the provider of the batch
+        provider_config: The config of the provider to resubmit the requests to
+        cancel: Whether to cancel the batches at risk, and resubmit only their requests without result
+    """
+
+    def __init__(
+        self,
+        batcher: "Batcher",
+        margin: float = 3600.0,
+        stall_margin: float = 12 * 3600.0,
+        resubmit: bool = False,
+        provider: Optional[str] = None,
+        provider_config: Optional[ProviderConfig] = None,
+        cancel: bool = False,
+    ) -> None:
+        self.batcher = batcher
+        self.margin = margin
+        self.stall_margin = stall_margin
+        self.resubmit = resubmit
+        self.provider = provider
+        self.provider_config = provider_config
+        self.cancel = cancel
+        self.path = batcher.batches_dir / ".deadlines" / "state.json"
+        self.tracker = ProgressTracker(window=stall_margin)
+        self._lock = threading.Lock()
+
+        # unique_id -> {"observed_at", "done", "resubmitted_as", "cancelled"}
+        self.state: Dict[str, Dict[str, Any]] = self._load()
+        for unique_id, entry in self.state.items():
+            if entry.get("observed_at") is not None:
+                done = entry["done"]
+                self.tracker.observe(unique_id, BatchProgress(done, 0, done), now=entry["observed_at"])
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            return read_json(self.path)
+        except FileNotFoundError:
+            return {}
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.tmp-{os.getpid()}-{threading.get_ident()}")
+        write_json(tmp_path, self.state)
+        os.replace(tmp_path, self.path)
+
+    def check(self, now: Optional[float] = None) -> Tuple[List[DeadlineStatus], List[str]]:
+        """Estimate the completion of the running batches from their last sync, and resubmit the batches at
+        risk if enabled. The batches are not synced (see ``Batcher.sync_batches`` or ``Watcher``): with
+        ``cancel``, the requests of a cancelled batch are resubmitted by the first check after its cancellation
+        is synced, and the new batch is checked right away.
+
+        Returns:
+            A tuple containing:
+            - List of the deadline statuses of the running batches
+            - List of errors that occurred while reading or resubmitting the batches
+        """
+        now = time.time() if now is None else now
+        summaries, errors = self.batcher.batch_summaries(list(RUNNING_STATUSES))
+        statuses = []
+        with self._lock:
+            running = {summary.unique_id for summary in summaries}
+            for unique_id, entry in list(self.state.items()):
+                if unique_id in running:
+                    continue
+                if entry.get("cancelled") and entry["resubmitted_as"] is None:
+                    try:
+                        resubmitted_as = self._resubmit(unique_id, partial=True)
+                        if resubmitted_as is not None:
+                            summaries.append(self.batcher.load_batch(resubmitted_as).summary())
+                    except FileNotFoundError:
+                        # deleted while cancelled
+                        pass
+                    except Exception as e:
+                        # retried at the next check
+                        errors.append(f"Error resubmitting batch {unique_id}: {e}")
+                        continue
+                del self.state[unique_id]
+                self.tracker.forget(unique_id)
+
+            for summary in summaries:
+                if summary.deadline is None or summary.status == LocalBatchStatus.CANCELLING:
+                    continue
+                entry = self.state.setdefault(summary.unique_id, {"observed_at": None, "done": None, "resubmitted_as": None})
+                # only the first observation is stored, the throughput is measured from it
+                progress = summary.progress
+                if progress is not None and self.tracker.observe(summary.unique_id, progress, now) and entry["observed_at"] is None:
+                    entry["observed_at"], entry["done"] = now, progress.done
+                eta = self.tracker.eta(summary.unique_id, progress, now)
+                deadline = summary.deadline.timestamp()
+                if eta is not None:
+                    at_risk = eta.timestamp() > deadline - self.margin
+                else:
+                    at_risk = now > deadline - self.stall_margin
+
+                if at_risk and self.resubmit and entry["resubmitted_as"] is None:
+                    try:
+                        if self.cancel:
+                            self._cancel(summary.unique_id)
+                            entry["cancelled"] = True
+                        else:
+                            entry["resubmitted_as"] = self._resubmit(summary.unique_id)
+                    except Exception as e:
+                        action = "cancelling" if self.cancel else "resubmitting"
+                        errors.append(f"Error {action} batch {summary.unique_id}: {e}")
+                statuses.append(DeadlineStatus(
+                    summary.unique_id, summary.name, summary.deadline, eta, at_risk, entry["resubmitted_as"]
+                ))
+            self._save()
+        return statuses, errors
+
+    def _cancel(self, unique_id: str) -> None:
+        batch = self.batcher.load_batch(unique_id)
+        if not isinstance(batch, UploadedBatch):
+            raise ValueError("it is not uploaded")
+        batch.cancel()
+        logger.warning(
+            f"Batch {batch.params.name}:{unique_id} is not expected to complete before its deadline, it is cancelled "
+            f"and its requests without result will be resubmitted"
+        )
+
+    def _resubmit(self, unique_id: str, partial: bool = False) -> Optional[str]:
+        batch = self.batcher.load_batch(unique_id)
+        if isinstance(batch, EditableBatch):
+            raise ValueError("it is not uploaded")
+        custom_ids = None
+        if partial:
+            # the batch is cancelled (or failed, or completed meanwhile): its requests with a result are not resubmitted
+            if isinstance(batch, UploadedBatch) and batch.has_results:
+                batch = batch.download(sync=False)
+            done = set()
+            if isinstance(batch, DownloadedBatch):
+                results = cast(Optional[List[Result]], batch.get_results()) or []
+                done = {result.custom_id for result in results if result.error is None}
+            custom_ids = [custom_id for custom_id in batch.request_table.custom_ids if custom_id not in done]
+            if not custom_ids:
+                logger.info(f"All the requests of batch {batch.params.name}:{unique_id} have a result")
+                return None
+        new_batch = cast(EditableBatch, EditableBatch.from_directory(self.batcher, batch._copy_dir(
+            f"{batch.params.name}-resubmitted", keep_provider=self.provider is None, custom_ids=custom_ids
+        )))
+        upsert_json(new_batch._files.batch_params, {
+            "parent_id": unique_id, "completion_window": batch.params.completion_window,
+        })
+        if self.provider is not None:
+            new_batch.set_provider(self.provider, self.provider_config)
+        uploaded = new_batch.upload()
+        if custom_ids is None:
+            logger.warning(
+                f"Batch {batch.params.name}:{unique_id} is not expected to complete before its deadline, "
+                f"its requests are resubmitted in batch {uploaded.unique_id}"
+            )
+        else:
+            logger.warning(
+                f"The {len(custom_ids)} requests without result of batch {batch.params.name}:{unique_id} are "
+                f"resubmitted in batch {uploaded.unique_id}"
+            )
+        return uploaded.unique_id
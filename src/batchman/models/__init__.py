@@ -1,17 +1,20 @@
 # from .batch import Batch, BatchParams
 from .request import Request
-from .result import Result
+from .result import Result, TextResult
 from .dataclasses import UserMessage
 from .enums import LocalBatchStatus, CompletionWindow
 from .provider_config import ProviderConfig
+from .progress import BatchProgress
 
 __all__ = [
     "Batch",
     "BatchParams",
+    "BatchProgress",
     "CompletionWindow",
     "Request",
     "UserMessage",
     "LocalBatchStatus",
     "ProviderConfig",
     "Result",
+    "TextResult",
 ]
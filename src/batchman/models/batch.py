@@ -1,13 +1,18 @@
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, Dict, List, Optional, Union
+from typing import TYPE_CHECKING, Any, Collection, Dict, List, NamedTuple, Optional, Union
 from uuid import uuid4
 
 from pydantic import BaseModel
 
 from ..models import CompletionWindow, LocalBatchStatus, Request, ProviderConfig, Result
+from ..models.progress import BatchProgress, parse_timestamp
+from ..models.request_table import RequestTable
 
 from ..utils.logging import logger
-from ..utils.files import append_jsonl, read_json, read_jsonl, upsert_json, write_jsonl
+from ..utils.blobs import link_or_copy
+from ..utils.files import COMPRESSION_SUFFIXES, append_jsonl, iter_jsonl, read_json, read_jsonl, read_last_jsonl, upsert_json, write_json, write_jsonl
+from ..utils.index import JsonlIndex
 from ..providers.registry import ProviderRegistry
 
 if TYPE_CHECKING:
@@ -21,22 +26,87 @@ class BatchParams(BaseModel):
     provider: Dict[str, Any]
     remote_id: Optional[str]
     completion_window: CompletionWindow
+    parent_id: Optional[str] = None
+    """unique_id of the batch this batch was derived from, see EditableBatch.fan_out"""
+    created_at: Optional[datetime] = None
+    uploaded_at: Optional[datetime] = None
+
+
+class BatchSummary(NamedTuple):
+    """Main properties of a batch, see ``Batch.summary``."""
+    unique_id: str
+    name: str
+    status: LocalBatchStatus
+    provider: Optional[str]
+    remote_id: Optional[str]
+    created_at: datetime
+    progress: Optional[BatchProgress] = None
+    deadline: Optional[datetime] = None
+    """When the completion window of the uploaded batch ends"""
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON serializable dict of the summary."""
+        return {
+            **self._asdict(),
+            "status": self.status.value,
+            "created_at": self.created_at.isoformat(),
+            "progress": self.progress.to_dict() if self.progress else None,
+            "deadline": self.deadline.isoformat() if self.deadline else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BatchSummary":
+        progress = data.get("progress")
+        return cls(**{
+            **data,
+            "status": LocalBatchStatus(data["status"]),
+            "created_at": datetime.fromisoformat(data["created_at"]),
+            "progress": BatchProgress.from_dict(progress) if progress else None,
+            "deadline": parse_timestamp(data.get("deadline")),
+        })
 
 
 class BatchFiles:
-    def __init__(self, directory: Path) -> None:
+    # Large files, which can be stored compressed (see Batcher compression)
+    COMPRESSIBLE = ("requests.jsonl", "remote_requests.jsonl", "remote_results.jsonl")
+
+    def __init__(self, directory: Path, compression: Optional[str] = None) -> None:
         self.directory = directory
+        self.compression = compression
 
         self.remote_states = self.directory / "remote_states.jsonl"
-        self.remote_requests = self.directory / "remote_requests.jsonl"
-        self.remote_results = self.directory / "remote_results.jsonl"
+        self.remote_requests = self._compressible("remote_requests.jsonl")
+        self.remote_results = self._compressible("remote_results.jsonl")
+
+        self.requests = self._compressible("requests.jsonl")
+
+        # Sidecar indexes (custom_id -> byte offset/length), see JsonlIndex
+        self.requests_index = self.directory / "requests.index.jsonl"
+        # Digest of the requests file in the batcher blob store, once shared with copies of the batch
+        self.requests_blob = self.directory / "requests_blob.json"
+        self.remote_results_index = self.directory / "remote_results.index.jsonl"
 
-        self.requests = self.directory / "requests.jsonl"
+        # Provider-neutral results, converted once from remote_results, see DownloadedBatch.get_results
+        self.results = self.directory / "results.jsonl"
+        self.results_meta = self.directory / "results_meta.json"
+        # Provider results of the requests served from the result cache instead of being uploaded
+        self.cached_results = self.directory / "cached_results.jsonl"
+        # Requests identical to another request of the batch, not uploaded: {"custom_id", "duplicate_of"}
+        self.duplicates = self.directory / "duplicates.jsonl"
 
         self.metadata = self.directory / "batch_metadata.json"
         self.batch_params = self.directory / "batch_params.json"
         self.global_request_params = self.directory / "global_request_params.json"
 
+    def _compressible(self, name: str) -> Path:
+        """Return the path of an existing file in any format (plain, gzip or zstd), or else the path
+        of the file to create with the configured compression."""
+        for suffix in ("", *COMPRESSION_SUFFIXES.values()):
+            path = self.directory / (name + suffix)
+            if path.exists():
+                return path
+        return self.directory / (name + COMPRESSION_SUFFIXES.get(self.compression or "", ""))
+
 
 class Batch:
     def __init__(
@@ -53,6 +123,8 @@ class Batch:
         self.directory: Path = batcher.batches_dir / f"batch-{name}-{self.unique_id}"
         self.directory.mkdir(parents=True, exist_ok=True)
         self.__provider_instance = None
+        self.__requests_index: Optional[JsonlIndex] = None
+        self.__results_index: Optional[JsonlIndex] = None
 
         if not self._files.batch_params.exists():
             provider_config_hash = None
@@ -68,6 +140,7 @@ class Batch:
                 provider={"name": provider, "config_hash": provider_config_hash},
                 remote_id=None,
                 completion_window=completion_window,
+                created_at=datetime.now(timezone.utc),
             )
             upsert_json(self._files.batch_params, self._batch_params)
 
@@ -87,7 +160,14 @@ class Batch:
 
         return cls(batcher, params["name"], params["unique_id"], params["provider"])
 
-    def _copy_dir(self, new_name: Optional[str] = None, new_unique_id: Optional[str] = None, keep_provider: bool = False) -> Path:
+    def _copy_dir(
+        self,
+        new_name: Optional[str] = None,
+        new_unique_id: Optional[str] = None,
+        keep_provider: bool = False,
+        custom_ids: Optional[Collection[str]] = None,
+    ) -> Path:
+        """Copy the batch to a new batch directory, with all its requests, or only the given custom_ids."""
         import shutil
         new_name = new_name or self.params.name
         new_unique_id = new_unique_id or str(uuid4())
@@ -96,8 +176,21 @@ class Batch:
         if keep_provider:
             upsert_json(batch._files.batch_params, {"provider": self.params.provider})
 
-        if self._files.requests.exists():
-            shutil.copy(self._files.requests, batch._files.requests)
+        if self._files.requests.exists() and custom_ids is not None:
+            # Only the given requests are copied, under the same file name
+            kept_ids = set(custom_ids)
+            write_jsonl(
+                batch.directory / self._files.requests.name,
+                [request for request in iter_jsonl(self._files.requests) if request["custom_id"] in kept_ids],
+            )
+        elif self._files.requests.exists():
+            # The requests are shared through the blob store instead of copied. The file name is
+            # kept, so the copy keeps the same compression
+            digest = self._share_requests()
+            self.batcher.blobs.link(digest, batch.directory / self._files.requests.name)
+            write_json(batch._files.requests_blob, {"digest": digest})
+            if self._files.requests_index.exists():
+                link_or_copy(self._files.requests_index, batch._files.requests_index)
         if self._files.global_request_params.exists():
             shutil.copy(self._files.global_request_params, batch._files.global_request_params)
         if self._files.metadata.exists():
@@ -105,9 +198,19 @@ class Batch:
 
         return batch._files.directory
 
+    def _share_requests(self) -> str:
+        """Move the requests file to the batcher blob store (only once), and return its digest."""
+        digest = None
+        if self._files.requests_blob.exists():
+            digest = read_json(self._files.requests_blob).get("digest")
+        if not self.batcher.blobs.is_blob(self._files.requests, digest):
+            digest = self.batcher.blobs.put_file(self._files.requests)
+            write_json(self._files.requests_blob, {"digest": digest})
+        return digest
+
     @property
     def _files(self) -> BatchFiles:
-        return BatchFiles(directory=self.directory)
+        return BatchFiles(directory=self.directory, compression=self.batcher.compression)
 
     @property
     def params(self) -> BatchParams:
@@ -127,37 +230,147 @@ class Batch:
     def requests(self) -> List[Request]:
         """Return all requests in the batch as a jsonl, with global params applied"""
         jsonlines = read_jsonl(self._files.requests)
+        global_request_params = self.global_request_params
         # Merge global params with request params (global params override request params)
         return [
-            Request(**{**request, **self.global_request_params})
+            Request(**{**request, **global_request_params})
             for request in jsonlines
         ]
 
+    @property
+    def request_table(self) -> RequestTable:
+        """Return all requests in the batch as a compact ``RequestTable``, with global params applied.
+
+        Unlike ``requests``, no ``Request`` object is created, which makes it suitable for very large batches.
+        """
+        if not self._files.requests.exists():
+            return RequestTable(self.global_request_params)
+        return RequestTable.from_dicts(iter_jsonl(self._files.requests), overrides=self.global_request_params)
+
+    def _requests_to_upload(self) -> RequestTable:
+        """Return the requests the provider must upload: all the requests of the batch, except the ones
+        answered from the result cache and the duplicated ones (see ``EditableBatch.upload``)."""
+        request_table = self.request_table
+        excluded_ids = set()
+        if self._files.cached_results.exists():
+            excluded_ids.update(self._provider.result_custom_id(result) for result in iter_jsonl(self._files.cached_results))
+        if self._files.duplicates.exists():
+            excluded_ids.update(duplicate["custom_id"] for duplicate in iter_jsonl(self._files.duplicates))
+        if not excluded_ids:
+            return request_table
+        return request_table.filter(lambda row: row.custom_id not in excluded_ids)
+
+    @property
+    def _requests_index(self) -> JsonlIndex:
+        if self.__requests_index is None:
+            self.__requests_index = JsonlIndex(
+                self._files.requests, self._files.requests_index, key=lambda request: request["custom_id"]
+            )
+        return self.__requests_index
+
+    @property
+    def _results_index(self) -> JsonlIndex:
+        if self.__results_index is None:
+            if not self._provider:
+                raise ValueError("Provider not set")
+            self.__results_index = JsonlIndex(
+                self._files.remote_results, self._files.remote_results_index, key=self._provider.result_custom_id
+            )
+        return self.__results_index
+
+    def get_request(self, custom_id: str) -> Request:
+        """Return a single request of the batch, with global params applied.
+
+        Only the bytes of the request are read, using the requests index.
+
+        Raises:
+            KeyError: If no request with this custom_id is found
+        """
+        request = self._requests_index.get(custom_id)
+        if request is None:
+            raise KeyError(f"Request {custom_id} not found in batch {self.unique_id}")
+        return Request(**{**request, **self.global_request_params})
+
+    def get_requests(self, start: Optional[int] = None, stop: Optional[int] = None) -> List[Request]:
+        """Return the requests between start and stop (python slice semantics), with global params applied.
+
+        Only the bytes of the selected requests are read, using the requests index.
+        """
+        global_request_params = self.global_request_params
+        return [
+            Request(**{**request, **global_request_params})
+            for request in self._requests_index.slice(start, stop)
+        ]
+
     @property
     def _remote_state(self) -> Optional[Dict[str, Any]]:
         try:
-            last_remote_state = read_jsonl(self._files.remote_states)
+            return read_last_jsonl(self._files.remote_states)
         except FileNotFoundError:
             return None
 
-        if len(last_remote_state) == 0:
-            return None
-
-        return last_remote_state[-1]
-
     @property
     def status(self) -> LocalBatchStatus:
+        return self._status(self._remote_state)
+
+    def _status(self, remote_state: Optional[Dict[str, Any]]) -> LocalBatchStatus:
         # If there is no remote file, the batch is pending
-        if not self._remote_state or not self._provider:
+        if not remote_state or not self._provider:
             return LocalBatchStatus.INITIALIZING
 
-        status = self._provider.convert_batch_status(self._remote_state)
+        if "local_status" in remote_state:
+            # not uploaded, see EditableBatch.upload
+            status = LocalBatchStatus(remote_state["local_status"])
+        else:
+            status = self._provider.convert_batch_status(remote_state)
 
         if status == LocalBatchStatus.COMPLETED and self._files.remote_results.exists():
             return LocalBatchStatus.DOWNLOADED
 
         return status
 
+    def _progress(self, remote_state: Optional[Dict[str, Any]]) -> Optional[BatchProgress]:
+        if not remote_state or not self._provider:
+            return None
+        if "local_status" in remote_state:
+            counts = remote_state["request_counts"]
+            return BatchProgress(counts["completed"], counts["failed"], counts["total"])
+        return self._provider.convert_batch_progress(remote_state)
+
+    @property
+    def _answered_locally(self) -> bool:
+        """Whether the batch was answered without being uploaded (all its requests were cached)."""
+        remote_state = self._remote_state
+        return remote_state is not None and "local_status" in remote_state
+
+    @property
+    def progress(self) -> Optional[BatchProgress]:
+        """Request counts of the batch at the last sync, or None if not uploaded or not reported by the provider."""
+        return self._progress(self._remote_state)
+
+    def summary(self) -> BatchSummary:
+        """Return the main properties of the batch, reading each of its files once."""
+        params = self.params
+        remote_state = self._remote_state
+        # batches created before created_at was stored: approximated by the params file date
+        created_at = params.created_at or datetime.fromtimestamp(self._files.batch_params.stat().st_mtime, timezone.utc)
+        deadline = None
+        if remote_state:
+            # batches uploaded before uploaded_at was stored: the creation date of the remote batch, or else
+            # of the local batch (the earliest upload date)
+            uploaded_at = params.uploaded_at or parse_timestamp(remote_state.get("created_at")) or created_at
+            deadline = uploaded_at + params.completion_window.duration
+        return BatchSummary(
+            unique_id=params.unique_id,
+            name=params.name,
+            status=self._status(remote_state),
+            provider=params.provider.get("name") if params.provider else None,
+            remote_id=params.remote_id if remote_state else None,
+            created_at=created_at,
+            progress=self._progress(remote_state),
+            deadline=deadline,
+        )
+
     @property
     def remote_id(self) -> Optional[str]:
         state = self._remote_state
@@ -199,8 +412,10 @@ class Batch:
         write_jsonl(self._files.remote_requests, content)
 
     def _save_remote_results(self, content: Union[List[Dict[str, Any]], Dict[str, Any]]) -> None:
-        """Save remote results to a JSONL file."""
+        """Save remote results to a JSONL file, and index them by custom_id."""
         write_jsonl(self._files.remote_results, content)
+        self._results_index.reset()
+        self._results_index.update()
 
     def _save_remote_state(self, content: Dict[str, Any]) -> None:
         """Append remote state to a JSONL file."""
@@ -0,0 +1,105 @@
+import base64
+import binascii
+import mimetypes
+from pathlib import Path
+from typing import Any, Dict, Optional
+from urllib.parse import unquote, urlparse
+
+from pydantic_core import to_jsonable_python
+
+from ..utils.blobs import BlobStore
+
+
+# Texts (whole message contents or text parts) at least this long are stored in the content blob store
+CONTENT_BLOB_MIN_SIZE = 4096
+
+_REMOTE_URL_SCHEMES = ("http", "https")
+
+
+def _blob_ref(digest: str, media_type: str) -> Dict[str, Any]:
+    return {"digest": digest, "media_type": media_type, "type": "blob"}
+
+
+def _intern_image(url: str, blobs: BlobStore) -> Optional[Dict[str, Any]]:
+    """Store a local image file or a base64 data URL, return None for remote URLs."""
+    if url.startswith("data:"):
+        header, _, data = url.partition(",")
+        if not header.endswith(";base64"):
+            return None
+        try:
+            content = base64.b64decode(data, validate=True)
+        except binascii.Error:
+            return None
+        return _blob_ref(blobs.put_bytes(content), header[len("data:"):-len(";base64")])
+
+    parsed = urlparse(url)
+    if parsed.scheme in _REMOTE_URL_SCHEMES:
+        return None
+    path = Path(unquote(parsed.path)) if parsed.scheme == "file" else Path(url)
+    if not path.is_file():
+        return None
+    media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    return _blob_ref(blobs.put_bytes(path.read_bytes()), media_type)
+
+
+def _intern_part(part: Dict[str, Any], blobs: BlobStore, min_size: int) -> Dict[str, Any]:
+    if part.get("type") == "image":
+        return _intern_image(part["url"], blobs) or part
+    if part.get("type") == "text" and len(part["content"]) >= min_size:
+        return _blob_ref(blobs.put_bytes(part["content"].encode()), "text/plain")
+    return part
+
+
+def intern_request(request: Dict[str, Any], blobs: BlobStore, min_size: int = CONTENT_BLOB_MIN_SIZE) -> Dict[str, Any]:
+    """Replace the large contents of a request dict by references to the content blob store.
+
+    Local image files and base64 data URLs are stored as raw bytes, and texts of at least min_size
+    characters are stored once whatever the number of requests they appear in. Remote image URLs
+    are kept as they are.
+
+    Args:
+        request: The request, as dumped by ``Request.model_dump``
+        blobs: The content blob store (``Batcher.content_blobs``)
+        min_size: The minimum size of the stored texts
+
+    Returns:
+        The request dict, with the contents replaced by ``BlobContent`` references
+    """
+    messages = []
+    for message in request["messages"]:
+        content = to_jsonable_python(message["content"])
+        if isinstance(content, str):
+            if len(content) >= min_size:
+                content = _blob_ref(blobs.put_bytes(content.encode()), "text/plain")
+        elif isinstance(content, list):
+            content = [_intern_part(part, blobs, min_size) for part in content]
+        messages.append({**message, "content": content})
+    return {**request, "messages": messages}
+
+
+def _expand_part(part: Dict[str, Any], blobs: BlobStore) -> Dict[str, Any]:
+    if part.get("type") != "blob":
+        return part
+    data = blobs.get_bytes(part["digest"])
+    if part["media_type"].startswith("text/"):
+        return {"content": data.decode(), "type": "text"}
+    return {"url": f"data:{part['media_type']};base64,{base64.b64encode(data).decode()}", "type": "image"}
+
+
+def expand_content(content: Any, blobs: Optional[BlobStore]) -> Any:
+    """Return the JSON content of a message, with the ``BlobContent`` references replaced by their content.
+
+    A text stored from a whole message content is expanded back to a string, text parts to text
+    parts, and images to base64 data URLs.
+
+    Raises:
+        KeyError: If a referenced content is not in the blob store
+    """
+    content = to_jsonable_python(content)
+    if blobs is None:
+        return content
+    if isinstance(content, dict):
+        return _expand_part(content, blobs)["content"]
+    if isinstance(content, list):
+        return [_expand_part(part, blobs) for part in content]
+    return content
@@ -15,9 +15,21 @@ class TextContent:
     type: str = "text"
 
 
+@dataclass
+class BlobContent:
+    """Reference to a content stored in the content blob store of the Batcher.
+
+    Large texts and images are stored once by digest, and expanded when the batch is uploaded
+    (see ``batchman.models.content``).
+    """
+    digest: str
+    media_type: str
+    type: str = "blob"
+
+
 @dataclass
 class Message:
-    content: Union[str, List[Union[ImageContent, TextContent]]]
+    content: Union[str, BlobContent, List[Union[ImageContent, TextContent, BlobContent]]]
     role: MessageRole
 
 
@@ -1,3 +1,4 @@
+from datetime import timedelta
 from enum import Enum
 
 
@@ -19,6 +20,7 @@ class LocalBatchStatus(str, Enum):
         REGISTERED (str): Batch has been successfully registered in the provider system
         IN_PROGRESS (str): Batch is currently being processed
         COMPLETED (str): Batch has finished processing successfully
+        CANCELLING (str): Batch is being cancelled at the provider, its processed requests may still be returned
         CANCELLED (str): Batch was manually cancelled
         FAILED (str): Batch processing encountered an error (not to confuse with failed requests, a batch can be COMPLETED but with some failed requests)
         DOWNLOADED (str): Batch results have been downloaded
@@ -28,14 +30,24 @@ class LocalBatchStatus(str, Enum):
     REGISTERED = "registered"
     IN_PROGRESS = "in_progress"
     COMPLETED = "completed"
+    CANCELLING = "cancelling"
     CANCELLED = "cancelled"
     FAILED = "failed"
     DOWNLOADED = "downloaded"
 
 
+# Statuses of the batches which won't change on the provider side anymore
+FINAL_STATUSES = (LocalBatchStatus.CANCELLED, LocalBatchStatus.FAILED, LocalBatchStatus.DOWNLOADED)
+
+
 class CompletionWindow(str, Enum):
     HOURS_24 = "24h"
     HOURS_48 = "48h"
     HOURS_72 = "72h"
     HOURS_96 = "96h"
     HOURS_120 = "120h"
+
+    @property
+    def duration(self) -> timedelta:
+        """Time the provider has to process the batch, from its upload."""
+        return timedelta(hours=int(self.value[:-1]))
@@ -0,0 +1,39 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, NamedTuple, Optional, Union
+
+
+def parse_timestamp(value: Union[None, int, float, str, datetime]) -> Optional[datetime]:
+    """Parse a provider timestamp (unix epoch or ISO 8601 string) into an aware datetime."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, timezone.utc)
+    # fromisoformat only handles the "Z" suffix from python 3.11
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+class BatchProgress(NamedTuple):
+    """Request counts of a batch on the provider side, see ``Provider.convert_batch_progress``."""
+    completed: int
+    failed: int
+    total: int
+    started_at: Optional[datetime] = None
+    """When the provider started processing the batch, if known"""
+
+    @property
+    def done(self) -> int:
+        return self.completed + self.failed
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.total - self.done)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**self._asdict(), "started_at": self.started_at.isoformat() if self.started_at else None}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BatchProgress":
+        return cls(**{**data, "started_at": parse_timestamp(data.get("started_at"))})
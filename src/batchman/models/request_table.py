@@ -0,0 +1,253 @@
+import json
+from array import array
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from pydantic_core import to_jsonable_python
+
+from .request import Request
+
+
+# Request fields stored in the params column (everything except custom_id and messages)
+REQUEST_PARAMS = (
+    "system_prompt",
+    "metadata",
+    "model",
+    "temperature",
+    "max_tokens",
+    "top_p",
+    "frequency_penalty",
+    "presence_penalty",
+    "stop",
+    "n",
+)
+
+
+class MessageView(NamedTuple):
+    """Read-only message of a ``RequestTable`` row, with the same attributes as ``Message``."""
+    content: Any
+    role: str
+
+
+class SharedPrefix(NamedTuple):
+    """The prefix of a request shared with other requests of a table, see ``RequestTable.shared_prefixes``."""
+    system_prompt: bool
+    """Whether the system prompt is shared"""
+    messages: int
+    """Number of leading messages shared (along with the system prompt)"""
+
+
+class _Columns:
+    """Column storage shared by a RequestTable and all its views.
+
+    Messages and params are interned: each distinct message (role and content) and each distinct
+    set of params is stored once, and rows only hold integer ids.
+    """
+
+    def __init__(self) -> None:
+        self.custom_ids: List[str] = []
+        self.params_ids = array("l")
+        # messages of row i are message_ids[message_offsets[i]:message_offsets[i + 1]]
+        self.message_ids = array("l")
+        self.message_offsets = array("l", [0])
+
+        self.params_pool: List[Dict[str, Any]] = []
+        self.messages_pool: List[MessageView] = []
+        self._params_lookup: Dict[str, int] = {}
+        self._messages_lookup: Dict[Any, int] = {}
+
+    @staticmethod
+    def _intern(value: Any, key: Any, pool: List[Any], lookup: Dict[Any, int]) -> int:
+        value_id = lookup.get(key)
+        if value_id is None:
+            value_id = len(pool)
+            pool.append(value)
+            lookup[key] = value_id
+        return value_id
+
+    def append(self, request: Dict[str, Any]) -> None:
+        params = {param: request.get(param) for param in REQUEST_PARAMS}
+        params_key = json.dumps(params, sort_keys=True)
+        self.params_ids.append(self._intern(params, params_key, self.params_pool, self._params_lookup))
+
+        for message in request["messages"]:
+            role, content = message["role"], message["content"]
+            message_key = (role, content) if isinstance(content, str) else (role, json.dumps(content, sort_keys=True))
+            message_view = MessageView(content=content, role=role)
+            self.message_ids.append(self._intern(message_view, message_key, self.messages_pool, self._messages_lookup))
+        self.message_offsets.append(len(self.message_ids))
+
+        self.custom_ids.append(request["custom_id"])
+
+
+class RequestRow:
+    """A lightweight view of one request of a ``RequestTable``.
+
+    It exposes the same attributes as ``Request`` (custom_id, messages, model, temperature...), so it can
+    be used wherever a request is only read (validation, provider payload preparation), and can be
+    converted to a full ``Request`` with ``to_request``.
+    """
+
+    __slots__ = ("_table", "_position")
+
+    def __init__(self, table: "RequestTable", position: int) -> None:
+        self._table = table
+        self._position = position
+
+    @property
+    def custom_id(self) -> str:
+        return self._table._columns.custom_ids[self._position]
+
+    @property
+    def messages(self) -> List[MessageView]:
+        columns = self._table._columns
+        start, stop = columns.message_offsets[self._position], columns.message_offsets[self._position + 1]
+        return [columns.messages_pool[message_id] for message_id in columns.message_ids[start:stop]]
+
+    def __getattr__(self, name: str) -> Any:
+        if name not in REQUEST_PARAMS:
+            raise AttributeError(f"{type(self).__name__} has no attribute {name}")
+        overrides = self._table.overrides
+        if name in overrides:
+            return overrides[name]
+        columns = self._table._columns
+        return columns.params_pool[columns.params_ids[self._position]][name]
+
+    def model_dump(self) -> Dict[str, Any]:
+        """Return the request as a dict, with the same keys as ``Request.model_dump``."""
+        return {
+            "messages": [{"content": message.content, "role": message.role} for message in self.messages],
+            "custom_id": self.custom_id,
+            **{param: getattr(self, param) for param in REQUEST_PARAMS},
+        }
+
+    def to_request(self) -> Request:
+        """Build the full (validated) ``Request`` for this row."""
+        return Request(**self.model_dump())
+
+    def __repr__(self) -> str:
+        return f"RequestRow(custom_id={self.custom_id!r})"
+
+
+# Anything the providers can read a request from
+RequestLike = Union[Request, RequestRow]
+
+
+class RequestTable:
+    """Compact, column-oriented representation of a (possibly very large) set of requests.
+
+    The custom_ids are stored in a column, while the messages and the params (model, system prompt,
+    sampling params...) are interned, so shared values (e.g. a system prompt common to all requests)
+    are stored once. Global params (see ``EditableBatch.override_request_params``) are kept aside as
+    ``overrides`` and applied when a row is read.
+
+    Iterating, slicing and filtering a table does not create ``Request`` objects, rows are converted
+    on demand with ``RequestRow.to_request`` or ``RequestTable.to_requests``.
+
+    Example:
+        >>> table = batch.request_table
+        >>> long_requests = table.filter(lambda row: row.max_tokens > 1000)
+        >>> first_request = table[0].to_request()
+    """
+
+    def __init__(self, overrides: Optional[Dict[str, Any]] = None) -> None:
+        self._columns = _Columns()
+        # None means all the rows of the columns, otherwise the positions of the rows in this view
+        self._positions: Optional[Sequence[int]] = None
+        self.overrides: Dict[str, Any] = {k: v for k, v in (overrides or {}).items() if k in REQUEST_PARAMS}
+
+    @classmethod
+    def from_dicts(cls, requests: Iterable[Dict[str, Any]], overrides: Optional[Dict[str, Any]] = None) -> "RequestTable":
+        """Build a table from request dicts (as stored in requests.jsonl)."""
+        table = cls(overrides)
+        for request in requests:
+            table._columns.append(request)
+        return table
+
+    @classmethod
+    def from_requests(cls, requests: Iterable[Request]) -> "RequestTable":
+        return cls.from_dicts(to_jsonable_python(request) for request in requests)
+
+    def _view(self, positions: Sequence[int]) -> "RequestTable":
+        view = RequestTable()
+        view._columns = self._columns
+        view._positions = positions
+        view.overrides = self.overrides
+        return view
+
+    def _position(self, index: int) -> int:
+        if self._positions is None:
+            if index < 0:
+                index += len(self)
+            if not 0 <= index < len(self):
+                raise IndexError("RequestTable index out of range")
+            return index
+        return self._positions[index]
+
+    def __len__(self) -> int:
+        if self._positions is None:
+            return len(self._columns.custom_ids)
+        return len(self._positions)
+
+    def __iter__(self) -> Iterator[RequestRow]:
+        positions = range(len(self._columns.custom_ids)) if self._positions is None else self._positions
+        return (RequestRow(self, position) for position in positions)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[RequestRow, "RequestTable"]:
+        if isinstance(index, slice):
+            positions = range(len(self._columns.custom_ids)) if self._positions is None else self._positions
+            return self._view(positions[index])
+        return RequestRow(self, self._position(index))
+
+    @property
+    def custom_ids(self) -> List[str]:
+        return [row.custom_id for row in self]
+
+    def filter(self, predicate: Callable[[RequestRow], bool]) -> "RequestTable":
+        """Return a view of the rows matching the predicate."""
+        return self._view(array("l", (row._position for row in self if predicate(row))))
+
+    def shards(self, max_size: int) -> List["RequestTable"]:
+        """Split the table in consecutive views of at most max_size rows."""
+        if max_size <= 0:
+            raise ValueError("max_size must be positive")
+        return [self[start:start + max_size] for start in range(0, len(self), max_size)]  # type: ignore[misc]
+
+    def _prefix_key(self, position: int) -> Tuple[str, array]:
+        columns = self._columns
+        start, stop = columns.message_offsets[position], columns.message_offsets[position + 1]
+        system_prompt = RequestRow(self, position).system_prompt
+        return system_prompt or "", columns.message_ids[start:stop]
+
+    def by_shared_prefix(self) -> "RequestTable":
+        """Return a view of the rows ordered so that the rows sharing a prefix (system prompt and leading
+        messages) are adjacent, which helps the providers caching prompt prefixes."""
+        positions = range(len(self._columns.custom_ids)) if self._positions is None else self._positions
+        return self._view(array("l", sorted(positions, key=self._prefix_key)))
+
+    def shared_prefixes(self, min_count: int = 2) -> List[SharedPrefix]:
+        """Return, for each row, the longest prefix (system prompt, then leading messages) it shares with
+        other rows.
+
+        Args:
+            min_count: The minimum number of rows sharing a prefix (this row included)
+        """
+        keys = [self._prefix_key(row._position) for row in self]
+        system_counts = Counter(system_prompt for system_prompt, _ in keys)
+        prefix_counts: Counter = Counter()
+        for system_prompt, message_ids in keys:
+            prefix_counts.update((system_prompt, tuple(message_ids[:length])) for length in range(1, len(message_ids) + 1))
+
+        shared_prefixes = []
+        for system_prompt, message_ids in keys:
+            shared_messages = 0
+            for length in range(len(message_ids), 0, -1):
+                if prefix_counts[(system_prompt, tuple(message_ids[:length]))] >= min_count:
+                    shared_messages = length
+                    break
+            shared_system = bool(system_prompt) and system_counts[system_prompt] >= min_count
+            shared_prefixes.append(SharedPrefix(system_prompt=shared_system, messages=shared_messages))
+        return shared_prefixes
+
+    def to_requests(self) -> List[Request]:
+        return [row.to_request() for row in self]
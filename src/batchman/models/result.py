@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Dict, List, Optional, Union
+from typing import Dict, List, NamedTuple, Optional, Union
 from .dataclasses import Choice
 
 
@@ -8,3 +8,17 @@ class Result(BaseModel):
     choices: List[Choice]
     usage: Optional[Dict[str, Union[int, Dict[str, int]]]] = None
     error: Optional[str] = None
+
+
+class TextResult(NamedTuple):
+    """Lightweight result, decoded from the provider result without any validation.
+
+    It only holds the first choice's text, the finish reason and the token usage, see
+    ``DownloadedBatch.get_results(mode="text")``.
+    """
+    custom_id: str
+    text: Optional[str] = None
+    finish_reason: Optional[str] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    error: Optional[str] = None
@@ -0,0 +1,114 @@
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Union
+
+from .result import TextResult
+
+if TYPE_CHECKING:
+    import pandas
+    import pyarrow
+
+
+def _import_pyarrow() -> Any:
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ImportError(
+            "pyarrow is required for Arrow/Parquet/pandas export, install it with `pip install batchman[arrow]`"
+        ) from e
+    return pyarrow
+
+
+class ResultTable:
+    """Columnar view of the results of a batch.
+
+    Each column is a list, holding one value per result (see ``TextResult`` for the columns).
+    It can be converted to an Arrow table, a Parquet file or a pandas DataFrame, the repeated
+    strings (finish_reason, error) being dictionary encoded.
+
+    Example:
+        >>> table = downloaded_batch.result_table()
+        >>> table.columns["text"][0]
+    """
+
+    COLUMNS = TextResult._fields
+    DICTIONARY_COLUMNS = ("finish_reason", "error")
+
+    def __init__(self, columns: Optional[Dict[str, List[Any]]] = None) -> None:
+        self.columns: Dict[str, List[Any]] = columns or {column: [] for column in self.COLUMNS}
+
+    @classmethod
+    def from_results(cls, results: Iterable[TextResult]) -> "ResultTable":
+        table = cls()
+        table.extend(results)
+        return table
+
+    @classmethod
+    def iter_chunks(cls, results: Iterable[TextResult], chunk_size: int = 65536) -> Iterator["ResultTable"]:
+        """Split a stream of results into tables of at most chunk_size rows."""
+        table = cls()
+        for result in results:
+            table.append(result)
+            if len(table) >= chunk_size:
+                yield table
+                table = cls()
+        if len(table) > 0:
+            yield table
+
+    def append(self, result: TextResult) -> None:
+        for column, value in zip(self.COLUMNS, result):
+            self.columns[column].append(value)
+
+    def extend(self, results: Iterable[TextResult]) -> None:
+        for result in results:
+            self.append(result)
+
+    def __len__(self) -> int:
+        return len(self.columns["custom_id"])
+
+    def __getitem__(self, index: int) -> TextResult:
+        return TextResult(*(self.columns[column][index] for column in self.COLUMNS))
+
+    def __iter__(self) -> Iterator[TextResult]:
+        return (TextResult(*row) for row in zip(*(self.columns[column] for column in self.COLUMNS)))
+
+    @classmethod
+    def arrow_schema(cls) -> "pyarrow.Schema":
+        pa = _import_pyarrow()
+        dictionary_string = pa.dictionary(pa.int32(), pa.string())
+        return pa.schema([
+            ("custom_id", pa.string()),
+            ("text", pa.string()),
+            ("finish_reason", dictionary_string),
+            ("prompt_tokens", pa.int64()),
+            ("completion_tokens", pa.int64()),
+            ("error", dictionary_string),
+        ])
+
+    def to_arrow_batch(self) -> "pyarrow.RecordBatch":
+        pa = _import_pyarrow()
+        schema = self.arrow_schema()
+        arrays = []
+        for field in schema:
+            values = self.columns[field.name]
+            if field.name in self.DICTIONARY_COLUMNS:
+                arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+            else:
+                arrays.append(pa.array(values, type=field.type))
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    def to_arrow(self) -> "pyarrow.Table":
+        pa = _import_pyarrow()
+        return pa.Table.from_batches([self.to_arrow_batch()], schema=self.arrow_schema())
+
+    def to_pandas(self) -> "pandas.DataFrame":
+        return self.to_arrow().to_pandas()
+
+    @classmethod
+    def write_parquet(cls, chunks: Iterable["ResultTable"], path: Union[str, Path]) -> None:
+        """Write the given tables to a single Parquet file, one row group per table."""
+        _import_pyarrow()
+        import pyarrow.parquet as pq
+
+        with pq.ParquetWriter(str(path), cls.arrow_schema()) as writer:
+            for chunk in chunks:
+                writer.write_batch(chunk.to_arrow_batch())
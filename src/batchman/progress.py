@@ -0,0 +1,73 @@
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Deque, Dict, Optional, Tuple
+
+from .models.progress import BatchProgress
+
+
+class ProgressTracker:
+    """Estimate the throughput and the remaining time of batches from their successive progress.
+
+    The throughput is measured between the observations of the last ``window`` seconds (see ``observe``),
+    and falls back to the average since the provider started the batch when there is a single observation.
+
+    Args:
+        window: The duration of the sliding window of observations, in seconds
+    """
+
+    def __init__(self, window: float = 900.0) -> None:
+        self.window = window
+        self._samples: Dict[str, Deque[Tuple[float, int]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key: str, progress: Optional[BatchProgress], now: Optional[float] = None) -> bool:
+        """Record the progress of a batch.
+
+        Returns:
+            Whether the batch progressed since its last observation
+        """
+        if progress is None:
+            return False
+        now = time.time() if now is None else now
+        with self._lock:
+            samples = self._samples.setdefault(key, deque())
+            changed = not samples or samples[-1][1] != progress.done
+            samples.append((now, progress.done))
+            # the oldest sample of the window is kept, to measure the throughput over the whole window
+            while len(samples) > 2 and samples[1][0] <= now - self.window:
+                samples.popleft()
+        return changed
+
+    def forget(self, key: str) -> None:
+        with self._lock:
+            self._samples.pop(key, None)
+
+    def throughput(self, key: str, progress: Optional[BatchProgress], now: Optional[float] = None) -> Optional[float]:
+        """Return the throughput of a batch in requests per minute, or None if unknown."""
+        if progress is None:
+            return None
+        now = time.time() if now is None else now
+        with self._lock:
+            samples = list(self._samples.get(key, ()))
+        if len(samples) >= 2 and samples[-1][0] > samples[0][0] and samples[-1][1] > samples[0][1]:
+            (first_time, first_done), (last_time, last_done) = samples[0], samples[-1]
+            return (last_done - first_done) / (last_time - first_time) * 60
+        if progress.started_at is not None and progress.done:
+            elapsed = now - progress.started_at.timestamp()
+            if elapsed > 0:
+                return progress.done / elapsed * 60
+        return None
+
+    def eta(self, key: str, progress: Optional[BatchProgress], now: Optional[float] = None) -> Optional[datetime]:
+        """Return the estimated completion time of a batch, or None if unknown."""
+        if progress is None:
+            return None
+        now = time.time() if now is None else now
+        if not progress.remaining:
+            return datetime.fromtimestamp(now, timezone.utc)
+        throughput = self.throughput(key, progress, now)
+        if not throughput:
+            return None
+        return datetime.fromtimestamp(now, timezone.utc) + timedelta(minutes=progress.remaining / throughput)
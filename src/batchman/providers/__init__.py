@@ -1,20 +1,9 @@
 from .registry import ProviderRegistry
-from pathlib import Path
-from batchman.utils.logging import logger
 
 
 def discover_providers():
-    """Discover provider modules in the providers directory."""
-    providers_dir = Path(__file__).parent
-    for file in providers_dir.glob("*.py"):
-        if file.stem in ["__init__", "base", "registry", "config_store"]:
-            continue
+    """Import and register all the available providers.
 
-        module_name = f"batchman.providers.{file.stem}"
-        try:
-            ProviderRegistry.try_register_provider(module_name)
-        except Exception as e:
-            logger.warning(f"Failed to load provider from {file}: {e}")
-
-
-discover_providers()
+    Not needed to use a provider, as the providers are imported on first use (see ``ProviderRegistry.get``).
+    """
+    return ProviderRegistry.list()
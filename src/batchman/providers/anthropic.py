@@ -1,28 +1,42 @@
-from typing import Any, Dict, List, cast
+from typing import Any, Dict, List, Optional, cast
 import anthropic
-from pydantic_core import to_jsonable_python
 
 from anthropic.types.message_create_params import MessageCreateParamsNonStreaming
 from anthropic.types.messages.batch_create_params import Request as AnthropicRequest
 from anthropic.types.messages.message_batch_individual_response import MessageBatchIndividualResponse
 
 from ..utils.logging import logger
-from ..models import LocalBatchStatus, Request, Result
+from ..utils.blobs import BlobStore
+from ..models import BatchProgress, LocalBatchStatus, Result, TextResult
+from ..models.progress import parse_timestamp
+from ..models.content import expand_content
+from ..models.request_table import RequestLike, SharedPrefix
 from ..models.dataclasses import Choice, AssistantMessage, TextContent
-from ..providers.base import Provider
+from ..providers.base import BULK_SYNC_SCAN_LIMIT, Provider
 
 from ..models.batch import Batch
 
 
+# Prompt caching breakpoint, see https://docs.anthropic.com/en/docs/build-with-claude/prompt-caching
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
 class AnthropicProvider(Provider):
     name = "anthropic"
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.client = anthropic.Anthropic(api_key=self._api_key, base_url=self._base_url)
-        self.models = [model.id for model in self.client.models.list()]
+        self.__models: Optional[List[str]] = None
+
+    @property
+    def models(self) -> List[str]:
+        # Listed on first use (request validation), not needed to sync or read a batch
+        if self.__models is None:
+            self.__models = [model.id for model in self.client.models.list()]
+        return self.__models
 
-    def validate_request(self, local_request: Request) -> None:
+    def validate_request(self, local_request: RequestLike) -> None:
         """Validate request parameters for Anthropic."""
         # "-latest" models are supported but not listed in Anthropic's API, so we add them to the list of valid models
         latest_models = [model_id+"latest" for model_id in set([model_id[:-8] for model_id in self.models if model_id[-8:].isdigit()])]
@@ -42,16 +56,36 @@ class AnthropicProvider(Provider):
                 f"max_tokens {local_request.max_tokens} exceeds Anthropic's limit of 200000"
             )
 
-    def _prepare_request(self, request: Request) -> AnthropicRequest:
+    @staticmethod
+    def _with_cache_control(content: Any) -> List[Dict[str, Any]]:
+        """Mark the end of a message content as a prompt caching breakpoint."""
+        if isinstance(content, str):
+            return [{"type": "text", "text": content, "cache_control": CACHE_CONTROL}]
+        return [*content[:-1], {**content[-1], "cache_control": CACHE_CONTROL}]
+
+    def _prepare_request(
+        self, request: RequestLike, blobs: Optional[BlobStore] = None, shared_prefix: Optional[SharedPrefix] = None
+    ) -> AnthropicRequest:
         if any((request.frequency_penalty, request.presence_penalty, request.n)):
             logger.warning("Anthropic does not support frequency_penalty, presence_penalty, or n,"
                            " these parameters will be ignored")
+
+        messages = [{"role": message.role, "content": expand_content(message.content, blobs)} for message in request.messages]
+        system: Any = request.system_prompt
+        # The prefixes shared with other requests of the batch are cached by Anthropic when marked
+        if shared_prefix:
+            if shared_prefix.system_prompt and system:
+                system = [{"type": "text", "text": system, "cache_control": CACHE_CONTROL}]
+            if shared_prefix.messages:
+                last_shared = messages[shared_prefix.messages - 1]
+                last_shared["content"] = self._with_cache_control(last_shared["content"])
+
         return AnthropicRequest(
             custom_id=request.custom_id,
             params={ k:v for k,v in MessageCreateParamsNonStreaming(
                 model=request.model,
-                messages=to_jsonable_python(request.messages),
-                system=request.system_prompt,
+                messages=messages,
+                system=system,
                 max_tokens=request.max_tokens,
                 temperature=request.temperature,
                 top_p=request.top_p,
@@ -63,7 +97,11 @@ class AnthropicProvider(Provider):
     def upload_batch(self, local_batch: Batch) -> str:
         """Upload a batch to Anthropic.
         """
-        temp_requests = [self._prepare_request(req) for req in local_batch.requests]
+        request_table = local_batch._requests_to_upload()
+        temp_requests = [
+            self._prepare_request(req, local_batch.batcher.content_blobs, shared_prefix)
+            for req, shared_prefix in zip(request_table, request_table.shared_prefixes())
+        ]
         message_batch = self.client.messages.batches.create(
             requests=temp_requests
         )
@@ -81,6 +119,20 @@ class AnthropicProvider(Provider):
         message_batch = self.client.messages.batches.retrieve(local_batch.remote_id)
         local_batch._save_remote_state(message_batch.model_dump())
 
+    def sync_batches(self, local_batches: List[Batch]) -> Dict[str, Exception]:
+        """Sync the batches from the listing of the message batches, most recent first."""
+        pending = {local_batch.remote_id: local_batch for local_batch in local_batches}
+        try:
+            for scanned, message_batch in enumerate(self.client.messages.batches.list(limit=100), start=1):
+                local_batch = pending.pop(message_batch.id, None)
+                if local_batch is not None:
+                    local_batch._save_remote_state(message_batch.model_dump())
+                if not pending or scanned >= BULK_SYNC_SCAN_LIMIT:
+                    break
+        except Exception as e:
+            logger.warning(f"[Anthropic] Failed to list the batches, syncing them one by one: {e}")
+        return super().sync_batches(list(pending.values()))
+
     def download_batch_results(self, local_batch: Batch) -> None:
         """Download and save batch results from Anthropic.
         
@@ -95,6 +147,23 @@ class AnthropicProvider(Provider):
             
         local_batch._save_remote_results(batch_results)
 
+    def has_partial_results(self, provider_state: Dict[str, Any]) -> bool:
+        # the results of the ended batches include their canceled and expired requests
+        return provider_state["processing_status"] == "ended" and bool(provider_state.get("results_url"))
+
+    def convert_batch_progress(self, provider_state: Dict[str, Any]) -> Optional[BatchProgress]:
+        counts = provider_state.get("request_counts")
+        if not counts:
+            return None
+        failed = counts.get("errored", 0) + counts.get("canceled", 0) + counts.get("expired", 0)
+        total = counts.get("processing", 0) + counts.get("succeeded", 0) + failed
+        if not total:
+            return None
+        return BatchProgress(
+            completed=counts.get("succeeded", 0), failed=failed, total=total,
+            started_at=parse_timestamp(provider_state.get("created_at")),
+        )
+
     def convert_batch_status(self, provider_state: Dict[str, Any]) -> LocalBatchStatus:
         """Convert our tracking state to LocalBatchStatus."""
         if provider_state["processing_status"] == "in_progress":
@@ -105,7 +174,7 @@ class AnthropicProvider(Provider):
             else:
                 return LocalBatchStatus.CANCELLED
         elif provider_state["processing_status"] == "canceling":
-            return LocalBatchStatus.CANCELLED
+            return LocalBatchStatus.CANCELLING
         else:
             return LocalBatchStatus.FAILED
 
@@ -132,3 +201,22 @@ class AnthropicProvider(Provider):
                 choices=[],
                 error=str(result.result.error.model_dump())
             )
+
+    def decode_text_result(self, provider_result: Dict[str, Any]) -> TextResult:
+        """Decode Anthropic result format to TextResult, without building the Anthropic models."""
+        result = provider_result["result"]
+        if result["type"] == "succeeded":
+            message = result["message"]
+            texts = [content["text"] for content in message["content"] if content.get("type", "text") == "text"]
+            usage = message.get("usage") or {}
+            return TextResult(
+                custom_id=provider_result["custom_id"],
+                text=texts[0] if texts else None,
+                finish_reason=message.get("stop_reason"),
+                prompt_tokens=usage.get("input_tokens"),
+                completion_tokens=usage.get("output_tokens"),
+            )
+        elif result["type"] == "errored":
+            return TextResult(custom_id=provider_result["custom_id"], error=str(result["error"]))
+        # canceled or expired requests
+        return TextResult(custom_id=provider_result["custom_id"], error=result["type"])
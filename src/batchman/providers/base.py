@@ -1,11 +1,17 @@
 import os
 from typing import Any, Dict, List, Optional, TYPE_CHECKING
 
-from batchman.models import LocalBatchStatus, ProviderConfig, Request, Result
+from batchman.models import BatchProgress, LocalBatchStatus, ProviderConfig, Result, TextResult
+from batchman.models.request_table import RequestLike
 if TYPE_CHECKING:
     from batchman.models.batch import Batch
 
 
+# Maximum number of remote batches scanned by the bulk status queries (see ``Provider.sync_batches``),
+# the batches not found are then synced one by one
+BULK_SYNC_SCAN_LIMIT = 1000
+
+
 class Provider:
     _registry: Dict[str, type] = {}
 
@@ -44,12 +50,14 @@ class Provider:
     def available_providers(cls) -> List[type]:
         return [provider for provider in cls._registry.values()]
 
-    def validate_request(self, local_request: Request) -> None:
+    def validate_request(self, local_request: RequestLike) -> None:
         """
         Validate a request locally before uploading it to the provider (for example,
         check if the given model is handled by the provider, that the max tokens are
         not too high, etc...).
 
+        The request can be a ``Request`` or a ``RequestRow`` of the batch's ``RequestTable``.
+
         raise ValueError
         """
         raise NotImplementedError
@@ -65,6 +73,13 @@ class Provider:
 
         The remote state can be the dump of the provider's "status" response.
 
+        Only the requests returned by ``local_batch._requests_to_upload()`` must be uploaded, the other
+        ones are answered from the result cache.
+
+        The message contents may hold references to the content blob store of the batcher
+        (``local_batch.batcher.content_blobs``), they must be expanded with
+        ``batchman.models.content.expand_content`` when preparing the requests.
+
         Args:
             local_batch (Batch): The batch to be uploaded to the provider.
 
@@ -89,9 +104,42 @@ class Provider:
         """
         raise NotImplementedError
 
+    def sync_batches(self, local_batches: List["Batch"]) -> Dict[str, Exception]:
+        """
+        Sync several batches of this provider, in a error resilient way.
+
+        The default implementation syncs the batches one by one with ``sync_batch``. Providers with
+        an endpoint listing the batches override it, to sync many batches with a few calls.
+
+        Args:
+            local_batches (List[Batch]): The batches to sync, uploaded with this provider.
+
+        Returns:
+            Dict[str, Exception]: The errors, by unique_id of the batches which could not be synced.
+        """
+        errors: Dict[str, Exception] = {}
+        for local_batch in local_batches:
+            try:
+                self.sync_batch(local_batch)
+            except Exception as e:
+                errors[local_batch.unique_id] = e
+        return errors
+
     def download_batch_results(self, local_batch: "Batch") -> None:
         raise NotImplementedError
 
+    def has_partial_results(self, provider_state: Dict[str, Any]) -> bool:
+        """
+        Whether a failed or cancelled batch has results to download, e.g. the requests processed before
+        its expiration or cancellation.
+
+        The default implementation returns False, the results are only downloaded for the completed batches.
+
+        Args:
+            provider_state (Dict[str, Any]): The provider's state, previously saved using ``_save_remote_state``.
+        """
+        return False
+
     def convert_batch_status(self, provider_state: Dict[str, Any]) -> LocalBatchStatus:
         """
         Convert the provider's state to a compatible local batch status.
@@ -107,6 +155,47 @@ class Provider:
         """
         raise NotImplementedError
 
+    def convert_batch_progress(self, provider_state: Dict[str, Any]) -> Optional[BatchProgress]:
+        """
+        Convert the provider's state to the request counts of the batch.
+
+        The default implementation reads OpenAI-like ``request_counts`` (total, completed and failed),
+        providers reporting the progress differently should override it.
+
+        Args:
+            provider_state (Dict[str, Any]): The provider's state, previously saved using ``_save_remote_state``.
+
+        Returns:
+            Optional[BatchProgress]: The request counts, or None if the provider state doesn't report them.
+        """
+        counts = provider_state.get("request_counts")
+        if not counts or not counts.get("total"):
+            return None
+        return BatchProgress(completed=counts.get("completed", 0), failed=counts.get("failed", 0), total=counts["total"])
+
+    def result_custom_id(self, provider_result: Dict[str, Any]) -> str:
+        """
+        Return the custom_id of a provider's result, without converting the whole result.
+
+        Used to index the downloaded results by custom_id.
+
+        Args:
+            provider_result (Dict[str, Any]): A single line of the response jsonl file.
+
+        Returns:
+            str: The custom_id of the request this result answers.
+        """
+        return provider_result["custom_id"]
+
+    def with_result_custom_id(self, provider_result: Dict[str, Any], custom_id: str) -> Dict[str, Any]:
+        """
+        Return a copy of a provider's result, answering the request with the given custom_id.
+
+        Used to reuse a cached result for another request (see ``ResultCache``), it must be
+        overridden along with ``result_custom_id``.
+        """
+        return {**provider_result, "custom_id": custom_id}
+
     def convert_batch_result(self, provider_result: Dict[str, Any]) -> Result:
         """
         Convert the provider's result to a compatible local result.
@@ -121,3 +210,30 @@ class Provider:
             provider_result will correspond to a single line of the response jsonl file.
         """
         raise NotImplementedError
+
+    def decode_text_result(self, provider_result: Dict[str, Any]) -> TextResult:
+        """
+        Decode the provider's result into a lightweight text result, without validation.
+
+        The default implementation goes through ``convert_batch_result``, providers should override
+        it with a decoder reading only the needed fields.
+
+        Args:
+            provider_result (Dict[str, Any]): The provider's result, previously saved using download_batch_results.
+
+        Returns:
+            TextResult: The text result.
+        """
+        result = self.convert_batch_result(provider_result)
+        usage = result.usage or {}
+        if not result.choices:
+            return TextResult(custom_id=result.custom_id, error=result.error)
+        choice = result.choices[0]
+        return TextResult(
+            custom_id=result.custom_id,
+            text=choice.message.content if isinstance(choice.message.content, str) else None,
+            finish_reason=choice.finish_reason,
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+            error=result.error,
+        )
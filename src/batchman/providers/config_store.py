@@ -4,38 +4,39 @@ from pathlib import Path
 from typing import Dict, Any, Optional
 
 from ..models.provider_config import ProviderConfig
+from ..utils.files import get_json_codec
 
 
 class ConfigStore:
     def __init__(self, store_path: Path):
+        # The store file is created on the first stored config
         self.store_path = store_path
-        self.store_path.parent.mkdir(parents=True, exist_ok=True)
-        if not self.store_path.exists():
-            # Create empty file
-            self.store_path.touch()
 
     def _read_store(self) -> Dict[str, Dict[str, Any]]:
         store = {}
         if self.store_path.exists() and self.store_path.stat().st_size > 0:
-            with open(self.store_path, "r") as f:
+            loads = get_json_codec().loads
+            with open(self.store_path, "rb") as f:
                 for line in f:
-                    entry = json.loads(line)
+                    entry = loads(line)
                     store[entry["hash"]] = entry["config"]
         return store
 
     def _append_entry(self, config_hash: str, config: Dict[str, Any]) -> None:
-        with open(self.store_path, "a") as f:
+        self.store_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.store_path, "ab") as f:
             entry = {"hash": config_hash, "config": config}
-            f.write(json.dumps(entry) + "\n")
+            f.write(get_json_codec().dumps(entry) + b"\n")
 
     def _rewrite_store(self, store: Dict[str, Dict[str, Any]]) -> None:
-        with open(self.store_path, "w") as f:
+        with open(self.store_path, "wb") as f:
             for config_hash, config in store.items():
                 entry = {"hash": config_hash, "config": config}
-                f.write(json.dumps(entry) + "\n")
+                f.write(get_json_codec().dumps(entry) + b"\n")
 
     def _compute_hash(self, config: Dict[str, Any]) -> str:
         # Sort the dictionary to ensure consistent hashing
+        # (always with the stdlib json, so the hashes don't depend on the JSON codec in use)
         config_str = json.dumps(config, sort_keys=True)
         return hashlib.sha256(config_str.encode()).hexdigest()[:16]
 
@@ -1,19 +1,20 @@
 import os
 from typing import TYPE_CHECKING, Any, Dict, Optional
-from pydantic_core import to_jsonable_python
 import requests as http_client
 
 from ..utils.logging import logger
+from ..utils.blobs import BlobStore
 
-from ..models.dataclasses import Choice
-from ..models.result import Result
+from ..models.content import expand_content
+from ..models.result import Result, TextResult
 from ..models.enums import LocalBatchStatus
+from ..models.progress import BatchProgress, parse_timestamp
 from ..models.provider_config import ProviderConfig
 from .base import Provider
 
 if TYPE_CHECKING:
     from ..models.batch import Batch
-    from ..models.request import Request
+    from ..models.request_table import RequestLike
 
 
 class ExxaProvider(Provider):
@@ -27,7 +28,7 @@ class ExxaProvider(Provider):
         if not self.config.url:
             self.config.url = self._BASE_URL
 
-    def validate_request(self, request: "Request") -> None:
+    def validate_request(self, request: "RequestLike") -> None:
         errors = []
 
         request_dict = request.model_dump()
@@ -44,7 +45,7 @@ class ExxaProvider(Provider):
         if len(errors) > 0:
             raise ValueError("\n".join(errors))
 
-    def _prepare_request(self, request: "Request") -> Dict[str, Any]:
+    def _prepare_request(self, request: "RequestLike", blobs: Optional[BlobStore] = None) -> Dict[str, Any]:
         metadata = {"custom_id": request.custom_id}
 
         metadata_dict = request.metadata
@@ -64,7 +65,7 @@ class ExxaProvider(Provider):
 
         for message in request.messages:
             messages.append(
-                {"role": message.role, "content": to_jsonable_python(message.content)}
+                {"role": message.role, "content": expand_content(message.content, blobs)}
             )
 
         request_body: Dict[str, Any] = {}
@@ -90,8 +91,8 @@ class ExxaProvider(Provider):
 
         logger.info("[Exxa] Creating batch")
 
-        for request in local_batch.requests:
-            prepared_request = self._prepare_request(request)
+        for request in local_batch._requests_to_upload():
+            prepared_request = self._prepare_request(request, local_batch.batcher.content_blobs)
 
             request_response = http_client.post(
                 f"{self._base_url}/requests",
@@ -191,11 +192,32 @@ class ExxaProvider(Provider):
         else:
             raise ValueError(f"Unknown batch status: {batch_status}")
 
+    def convert_batch_progress(self, remote_state: Dict[str, Any]) -> Optional[BatchProgress]:
+        # Exxa reports the state of each request of the batch, rather than counts
+        requests = remote_state.get("requests") or []
+        total = len(requests) or len(remote_state.get("requests_ids") or [])
+        if not total:
+            return None
+        statuses = [request.get("status") for request in requests if isinstance(request, dict)]
+        return BatchProgress(
+            completed=statuses.count("completed"),
+            failed=statuses.count("failed") + statuses.count("cancelled"),
+            total=total,
+            started_at=parse_timestamp(remote_state.get("created_at")),
+        )
+
+    def result_custom_id(self, provider_result: Dict[str, Any]) -> str:
+        return provider_result["metadata"]["custom_id"]
+
+    def with_result_custom_id(self, provider_result: Dict[str, Any], custom_id: str) -> Dict[str, Any]:
+        return {**provider_result, "metadata": {**provider_result["metadata"], "custom_id": custom_id}}
+
     def convert_batch_result(self, provider_result: Dict[str, Any]) -> Result:
         custom_id = provider_result["metadata"]["custom_id"]
         result_body = provider_result["result_body"]
 
-        choices = [Choice(**choice) for choice in result_body["choices"]]
+        # Choices are validated once, by the Result model
+        choices = result_body["choices"]
         usage = result_body["usage"]
 
         error = provider_result.get("error", None)
@@ -206,3 +228,18 @@ class ExxaProvider(Provider):
             usage=usage,
             error=error,
         )
+
+    def decode_text_result(self, provider_result: Dict[str, Any]) -> TextResult:
+        result_body = provider_result["result_body"]
+        choices = result_body["choices"]
+        usage = result_body.get("usage") or {}
+        first_choice = choices[0] if choices else {}
+
+        return TextResult(
+            custom_id=provider_result["metadata"]["custom_id"],
+            text=first_choice.get("message", {}).get("content"),
+            finish_reason=first_choice.get("finish_reason"),
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+            error=provider_result.get("error", None),
+        )
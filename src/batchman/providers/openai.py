@@ -1,17 +1,18 @@
-import json
 import os
 import time
 from tempfile import NamedTemporaryFile
-from typing import Any, Dict, Optional
-
-from pydantic_core import to_jsonable_python
+from typing import Any, Dict, List, Optional
 
 from ..utils import logger
+from ..utils.blobs import BlobStore
+from ..utils.files import get_json_codec
+from ..models.content import expand_content
 from ..models.enums import LocalBatchStatus
-from ..models.request import Request
+from ..models.progress import BatchProgress, parse_timestamp
+from ..models.request_table import RequestLike
 from ..models.batch import Batch
-from ..models.result import Result
-from .base import Provider
+from ..models.result import Result, TextResult
+from .base import BULK_SYNC_SCAN_LIMIT, Provider
 
 from openai import OpenAI
 
@@ -24,7 +25,7 @@ class OpenAIProvider(Provider):
         self.client = OpenAI(api_key=self._api_key, base_url=self._base_url)
         self.__models = None
 
-    def _prepare_request(self, request: Request) -> Dict[str, Any]:
+    def _prepare_request(self, request: RequestLike, blobs: Optional[BlobStore] = None) -> Dict[str, Any]:
         metadata = {
             "custom_id": request.custom_id,
             "method": "POST",
@@ -45,7 +46,7 @@ class OpenAIProvider(Provider):
             messages.append(
                 {
                     "role": message.role,
-                    "content": to_jsonable_python(message.content),
+                    "content": expand_content(message.content, blobs),
                 }
             )
 
@@ -67,7 +68,7 @@ class OpenAIProvider(Provider):
 
         return {**metadata, "body": request_body}
 
-    def validate_request(self, local_request: Request) -> None:
+    def validate_request(self, local_request: RequestLike) -> None:
         if not self.__models:
             start = time.time()
             self.__models = [model.id for model in self.client.models.list()]
@@ -81,12 +82,13 @@ class OpenAIProvider(Provider):
 
     def upload_batch(self, local_batch: Batch) -> str:
         # Create a temporary file to store batch requests
-        with NamedTemporaryFile(mode="w", suffix=".jsonl", delete=False) as temp_file:
+        codec = get_json_codec()
+        with NamedTemporaryFile(mode="wb", suffix=".jsonl", delete=False) as temp_file:
             # Write each request to the temp file
-            for request in local_batch.requests:
-                prepared_request = self._prepare_request(request)
-                json.dump(prepared_request, temp_file)
-                temp_file.write("\n")
+            # Requests sharing a prefix are adjacent, so they benefit from OpenAI's automatic prompt caching
+            for request in local_batch._requests_to_upload().by_shared_prefix():
+                prepared_request = self._prepare_request(request, local_batch.batcher.content_blobs)
+                temp_file.write(codec.dumps(prepared_request) + b"\n")
 
             temp_file.flush()  # Ensure that all writes are flushed to disk
 
@@ -132,6 +134,20 @@ class OpenAIProvider(Provider):
         except Exception as e:
             raise ValueError(f"Failed to sync batch: {e}")
 
+    def sync_batches(self, local_batches: List[Batch]) -> Dict[str, Exception]:
+        # The batches are listed from the most recent, a page of 100 batches per call
+        pending = {local_batch.remote_id: local_batch for local_batch in local_batches}
+        try:
+            for scanned, remote_batch in enumerate(self.client.batches.list(limit=100), start=1):
+                local_batch = pending.pop(remote_batch.id, None)
+                if local_batch is not None:
+                    local_batch._save_remote_state(remote_batch.model_dump())
+                if not pending or scanned >= BULK_SYNC_SCAN_LIMIT:
+                    break
+        except Exception as e:
+            logger.warning(f"[OpenAI] Failed to list the batches, syncing them one by one: {e}")
+        return super().sync_batches(list(pending.values()))
+
     def download_batch_results(self, local_batch: Batch) -> None:
         try:
             remote_batch = self.client.batches.retrieve(local_batch.remote_id)
@@ -139,14 +155,13 @@ class OpenAIProvider(Provider):
 
             # if remote_batch.errors:
 
-            if remote_batch.status == "completed":
-                output_file_id = remote_batch.output_file_id
-                output_file = self.client.files.content(output_file_id)
-                results = output_file.text
-                errors_file_id = remote_batch.error_file_id
-                if errors_file_id:
-                    errors_file = self.client.files.content(errors_file_id)
-                    results = results + errors_file.text
+            # expired and cancelled batches have the results of the requests processed before
+            if remote_batch.status == "completed" or self.has_partial_results(remote_batch.model_dump()):
+                results = ""
+                if remote_batch.output_file_id:
+                    results = self.client.files.content(remote_batch.output_file_id).text
+                if remote_batch.error_file_id:
+                    results = results + self.client.files.content(remote_batch.error_file_id).text
 
                 local_batch._save_remote_results(results)
 
@@ -154,6 +169,15 @@ class OpenAIProvider(Provider):
         except Exception as e:
             raise ValueError(f"Failed to download batch results: {e}")
 
+    def has_partial_results(self, provider_state: Dict[str, Any]) -> bool:
+        return bool(provider_state.get("output_file_id") or provider_state.get("error_file_id"))
+
+    def convert_batch_progress(self, remote_state: Dict[str, Any]) -> Optional[BatchProgress]:
+        progress = super().convert_batch_progress(remote_state)
+        if progress is None:
+            return None
+        return progress._replace(started_at=parse_timestamp(remote_state.get("in_progress_at") or remote_state.get("created_at")))
+
     def convert_batch_status(self, remote_state: Dict[str, Any]) -> LocalBatchStatus:
         status = remote_state["status"]
 
@@ -162,23 +186,37 @@ class OpenAIProvider(Provider):
         elif status == "cancelled":
             return LocalBatchStatus.CANCELLED
         elif status == "cancelling":
-            return LocalBatchStatus.CANCELLED
+            return LocalBatchStatus.CANCELLING
         elif status == "validating":
             return LocalBatchStatus.VALIDATING
         elif status == "registered":
             return LocalBatchStatus.REGISTERED
-        elif status == "in_progress":
+        elif status in ("in_progress", "finalizing"):
             return LocalBatchStatus.IN_PROGRESS
+        elif status in ("failed", "expired"):
+            # the requests not processed before the end of the completion window are expired
+            return LocalBatchStatus.FAILED
         else:
             raise ValueError(f"Unknown batch status: {status}")
 
+    @staticmethod
+    def _result_error(result: Dict[str, Any]) -> Optional[str]:
+        # the lines of the error file of the expired or cancelled requests have no response, only an error
+        response = result.get("response")
+        if response is None:
+            return str(result.get("error"))
+        if "error" in response["body"]:
+            return str(response["body"]["error"])
+        return None
+
     def convert_batch_result(self, result: Dict[str, Any]) -> Result:
-        if "error" in result["response"]["body"]:
+        error = OpenAIProvider._result_error(result)
+        if error is not None:
             return Result(
                 custom_id=result["custom_id"],
                 choices=[],
                 usage=None,
-                error=str(result["response"]["body"]["error"]),
+                error=error,
             )
         return Result(
             custom_id=result["custom_id"],
@@ -186,3 +224,18 @@ class OpenAIProvider(Provider):
             usage=result["response"]["body"]["usage"],
             error=None,
         )
+
+    def decode_text_result(self, result: Dict[str, Any]) -> TextResult:
+        error = OpenAIProvider._result_error(result)
+        if error is not None:
+            return TextResult(custom_id=result["custom_id"], error=error)
+        body = result["response"]["body"]
+        usage = body.get("usage") or {}
+        first_choice = body["choices"][0] if body["choices"] else {}
+        return TextResult(
+            custom_id=result["custom_id"],
+            text=first_choice.get("message", {}).get("content"),
+            finish_reason=first_choice.get("finish_reason"),
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+        )
@@ -1,6 +1,13 @@
 from pathlib import Path
 from typing import TYPE_CHECKING, Any, Dict, List, Optional, Type
 import importlib
+import sys
+
+if sys.version_info >= (3, 10):
+    from importlib.metadata import entry_points
+else:
+    # the group selection of entry_points requires Python 3.10
+    from importlib_metadata import entry_points
 
 from .config_store import ConfigStore
 from ..utils.logging import logger
@@ -10,8 +17,30 @@ if TYPE_CHECKING:
     from ..models.provider_config import ProviderConfig
 
 
+# Built-in providers, imported on first use (see ProviderRegistry.get)
+BUILTIN_PROVIDERS = {
+    "openai": "batchman.providers.openai",
+    "anthropic": "batchman.providers.anthropic",
+    "exxa": "batchman.providers.exxa",
+}
+
+# Entry point group of the third-party providers, e.g. in their pyproject.toml:
+# [project.entry-points."batchman.providers"]
+# myprovider = "my_package.my_module:MyProvider"
+ENTRY_POINTS_GROUP = "batchman.providers"
+
+
 class ProviderRegistry:
+    """Registry of the provider classes, by name.
+
+    The providers are registered by name only (built-in providers and ``batchman.providers`` entry points),
+    and their module, with its SDK, is imported on the first ``get``: importing batchman does not import
+    any provider SDK.
+    """
+
     _providers: Dict[str, Type["Provider"]] = {}
+    # Provider name -> module name or entry point, of the providers not imported yet
+    _lazy_providers: Optional[Dict[str, Any]] = None
 
     # Config store in the .batchman directory
     _config_store = ConfigStore(Path.home() / ".batchman" / "providers_configs.jsonl")
@@ -20,6 +49,30 @@ class ProviderRegistry:
     def register(cls, provider_cls: Type["Provider"]) -> None:
         cls._providers[provider_cls.name] = provider_cls
 
+    @classmethod
+    def _lazy(cls) -> Dict[str, Any]:
+        if cls._lazy_providers is None:
+            lazy_providers: Dict[str, Any] = dict(BUILTIN_PROVIDERS)
+            try:
+                for entry_point in entry_points(group=ENTRY_POINTS_GROUP):
+                    lazy_providers[entry_point.name] = entry_point
+            except Exception as e:
+                logger.warning(f"Failed to list the {ENTRY_POINTS_GROUP} entry points: {e}")
+            cls._lazy_providers = lazy_providers
+        return cls._lazy_providers
+
+    @staticmethod
+    def _find_provider_class(module: Any) -> Type["Provider"]:
+        # Find the first class that ends with 'Provider', but avoid importing the base Provider class itself
+        for name, obj in module.__dict__.items():
+            if (
+                isinstance(obj, type)
+                and name.endswith("Provider")
+                and not name.startswith("Provider")
+            ):
+                return obj
+        raise ValueError(f"No provider class found in module {module.__name__}")
+
     @classmethod
     def try_register_provider(cls, module_name: str) -> None:
         """
@@ -29,20 +82,7 @@ class ProviderRegistry:
         """
         try:
             module = importlib.import_module(module_name)
-            # Find the first class that ends with 'Provider', but avoid importing the base Provider class itself
-            provider_class_name = None
-            for name, obj in module.__dict__.items():
-                if (
-                    isinstance(obj, type)
-                    and name.endswith("Provider")
-                    and not name.startswith("Provider")
-                ):
-                    provider_class_name = name
-                    break
-            if provider_class_name is None:
-                raise ValueError(f"No provider class found in module {module_name}")
-            provider_cls = getattr(module, provider_class_name)
-            cls.register(provider_cls)
+            cls.register(cls._find_provider_class(module))
         except ImportError as e:
             logger.warning(
                 f"Provider in {module_name} not available - missing dependencies: {e}"
@@ -50,18 +90,45 @@ class ProviderRegistry:
         except Exception as e:
             logger.warning(f"Failed to register {module_name}: {str(e)}")
 
+    @classmethod
+    def _load(cls, provider_name: str) -> None:
+        """Import and register a lazily registered provider."""
+        target = cls._lazy().pop(provider_name, None)
+        if target is None:
+            return
+        if isinstance(target, str):
+            cls.try_register_provider(target)
+            return
+        try:
+            loaded = target.load()
+            cls.register(loaded if isinstance(loaded, type) else cls._find_provider_class(loaded))
+        except ImportError as e:
+            logger.warning(f"Provider {provider_name} not available - missing dependencies: {e}")
+        except Exception as e:
+            logger.warning(f"Failed to register provider {provider_name}: {str(e)}")
+
+    @classmethod
+    def names(cls) -> List[str]:
+        """Return the names of the known providers, without importing them."""
+        return sorted({*cls._providers, *cls._lazy()})
+
     @classmethod
     def list(cls) -> List[Type["Provider"]]:
+        """Return all the available provider classes (this imports all the providers)."""
+        for provider_name in list(cls._lazy()):
+            cls._load(provider_name)
         return list(cls._providers.values())
 
     @classmethod
     def get(cls, provider_name: str) -> Optional[Type["Provider"]]:
-        """Get the provider class for a given provider name."""
+        """Get the provider class for a given provider name, importing it on first use."""
+        if provider_name not in cls._providers:
+            cls._load(provider_name)
         return cls._providers.get(provider_name, None)
 
     @classmethod
     def is_registered(cls, provider_name: str) -> bool:
-        return provider_name in cls._providers
+        return cls.get(provider_name) is not None
 
     @classmethod
     def get_stored_config(cls, config_hash: str) -> Optional["ProviderConfig"]:
@@ -73,7 +140,7 @@ class ProviderRegistry:
 
     @classmethod
     def get_default_config_hash(cls, provider_name: str) -> str:
-        provider_class = cls._providers.get(provider_name, None)
+        provider_class = cls.get(provider_name)
         if provider_class is None:
             raise ValueError(f"Provider {provider_name} not found")
         #creating a provider instance without config to get default config
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from pydantic_core import to_jsonable_python
+
+from .models.request_table import REQUEST_PARAMS, RequestLike
+from .utils.files import append_jsonl
+from .utils.index import JsonlIndex
+
+
+# Request params which change the response, and are part of the cache key (metadata is not)
+CACHE_KEY_PARAMS = tuple(param for param in REQUEST_PARAMS if param != "metadata")
+
+
+class ResultCache:
+    """Cache of provider results shared by all the batches of a Batcher.
+
+    Results are keyed by a canonical hash of the request (provider, model, messages, system prompt and
+    sampling params, see ``request_key``), and stored as downloaded from the provider in an append-only
+    jsonl file, indexed by key (see ``JsonlIndex``).
+
+    The cache is filled when a batch is downloaded (see ``UploadedBatch.download``), and used when a
+    batch is uploaded with ``use_cache=True`` (see ``EditableBatch.upload``). Only the requests with an
+    explicit temperature are cached, as the default temperature is provider dependent.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self.path = directory / "results.jsonl"
+        self._index = JsonlIndex(self.path, directory / "results.index.jsonl", key=lambda entry: entry["key"])
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def request_key(provider: str, request: RequestLike) -> str:
+        """Return the canonical hash of a request for the given provider.
+
+        The custom_id and the metadata of the request are not part of the key.
+        """
+        canonical = {
+            "provider": provider,
+            "messages": [{"role": message.role, "content": message.content} for message in request.messages],
+            **{param: getattr(request, param) for param in CACHE_KEY_PARAMS},
+        }
+        data = json.dumps(to_jsonable_python(canonical), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    @staticmethod
+    def is_cacheable(request: RequestLike, max_temperature: float = 0.0) -> bool:
+        """Return whether the results of a request can be served from the cache.
+
+        Args:
+            request: The request
+            max_temperature: The highest temperature for which results are reused. By default only
+                deterministic (temperature 0) requests are served from the cache.
+        """
+        return request.temperature is not None and request.temperature <= max_temperature
+
+    def get(self, provider: str, request: RequestLike) -> Optional[Dict[str, Any]]:
+        """Return the cached provider result for the request, or None if not cached."""
+        if not self.path.exists():
+            return None
+        with self._lock:
+            entry = self._index.get(self.request_key(provider, request))
+        return entry["result"] if entry is not None else None
+
+    def put_many(self, entries: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+        """Store provider results by request key, the first stored result of a key is kept.
+
+        Returns:
+            The number of stored results
+        """
+        with self._lock:
+            if self.path.exists():
+                self._index.update()
+            lines = []
+            keys = set()
+            for key, result in entries:
+                if key not in keys and (not self.path.exists() or key not in self._index):
+                    keys.add(key)
+                    lines.append({"key": key, "result": result})
+            if lines:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                append_jsonl(self.path, lines)
+                self._index.update()
+        return len(lines)
+
+    def __len__(self) -> int:
+        if not self.path.exists():
+            return 0
+        with self._lock:
+            return len(self._index)
@@ -0,0 +1,210 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple, Union, cast
+
+from .batch_interfaces import DownloadedBatch, EditableBatch, UploadedBatch
+from .models import ProviderConfig, Request, Result
+from .utils.logging import logger
+
+if TYPE_CHECKING:
+    from .batchman import Batcher
+
+
+ProviderSpec = Union[str, Tuple[str, Optional[ProviderConfig]]]
+
+
+class RollingBatcher:
+    """Accept a continuous stream of requests, and cut it into batches uploaded as they are sealed.
+
+    The open batch is sealed and uploaded (in the background) when it holds ``max_requests`` requests or
+    ``max_bytes`` bytes of requests, or ``max_age`` seconds after its first request: smaller limits
+    give fresher results, larger ones fewer and more efficient batches. The sealed batches are regular
+    batches of the batcher, so they can be inspected with ``batchman``.
+
+    When several providers are given, the sealed batches are spread over them in turn, and a batch whose
+    upload fails is uploaded to the next provider.
+
+    Args:
+        batcher: The batcher the batches are created in
+        providers: The provider name (or names, or (name, config) tuples) to upload the batches to
+        name: The name of the batches, suffixed by their sequence number
+        max_requests: The maximum number of requests of a batch
+        max_bytes: The maximum size of the requests of a batch, in bytes of JSON
+        max_age: The maximum number of seconds between the first request of a batch and its upload
+        request_params: Global request params of the batches (see ``EditableBatch.override_request_params``)
+        upload_workers: The maximum number of batches uploaded concurrently
+    """
+
+    def __init__(
+        self,
+        batcher: "Batcher",
+        providers: Union[ProviderSpec, Sequence[ProviderSpec]],
+        name: str = "rolling",
+        max_requests: int = 10_000,
+        max_bytes: int = 100 * 1024 * 1024,
+        max_age: float = 600.0,
+        request_params: Optional[Dict[str, Any]] = None,
+        upload_workers: int = 2,
+    ) -> None:
+        if isinstance(providers, (str, tuple)):
+            providers = [providers]
+        if not providers:
+            raise ValueError("At least one provider is required")
+        self.batcher = batcher
+        self.providers: List[Tuple[str, Optional[ProviderConfig]]] = [
+            (provider, None) if isinstance(provider, str) else provider for provider in providers
+        ]
+        self.name = name
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.request_params = request_params or {}
+
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+        self._current: Optional[EditableBatch] = None
+        self._current_requests = 0
+        self._current_bytes = 0
+        self._timer: Optional[threading.Timer] = None
+        self._sequence = 0
+        self._closed = False
+        self._uploader = ThreadPoolExecutor(max_workers=upload_workers)
+        self._uploads: List[Future] = []
+
+        self.sealed: List[EditableBatch] = []
+        """The sealed batches, in order"""
+        self.uploaded: List[UploadedBatch] = []
+        """The uploaded batches, in upload order"""
+        self.errors: List[str] = []
+        """The errors of the batches which could not be uploaded, or failed"""
+
+    def __enter__(self) -> "RollingBatcher":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def add_requests(self, requests: Union[Request, List[Request]]) -> None:
+        """Add requests to the open batch, sealing it when it is full."""
+        if isinstance(requests, Request):
+            requests = [requests]
+        with self._lock:
+            if self._closed:
+                raise ValueError("The rolling batcher is closed")
+            for request in requests:
+                size = len(request.model_dump_json())
+                if self._current is not None and (
+                    self._current_requests >= self.max_requests or self._current_bytes + size > self.max_bytes
+                ):
+                    self._seal()
+                if self._current is None:
+                    self._open()
+                self._current.add_requests(request)
+                self._current_requests += 1
+                self._current_bytes += size
+            if self._current is not None and self._current_requests >= self.max_requests:
+                self._seal()
+
+    def _open(self) -> None:
+        self._sequence += 1
+        self._current = self.batcher.create_batch(name=f"{self.name}-{self._sequence}")
+        if self.request_params:
+            self._current.override_request_params(**self.request_params)
+        self._current_requests = 0
+        self._current_bytes = 0
+        self._timer = threading.Timer(self.max_age, self._seal_expired, args=(self._current.unique_id,))
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _seal_expired(self, unique_id: str) -> None:
+        with self._lock:
+            if self._current is not None and self._current.unique_id == unique_id:
+                self._seal()
+
+    def _seal(self) -> None:
+        batch = self._current
+        if batch is None:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._current = None
+        provider_index = len(self.sealed)
+        self.sealed.append(batch)
+        self._uploads.append(self._uploader.submit(self._upload, batch, provider_index))
+        logger.info(f"Batch {batch.params.name}:{batch.unique_id} sealed with {self._current_requests} requests")
+
+    def _upload(self, batch: EditableBatch, provider_index: int) -> None:
+        errors = []
+        for attempt in range(len(self.providers)):
+            provider, provider_config = self.providers[(provider_index + attempt) % len(self.providers)]
+            try:
+                batch.set_provider(provider, provider_config)
+                uploaded = cast(UploadedBatch, batch.upload())
+            except Exception as e:
+                errors.append(f"{provider}: {e}")
+                continue
+            with self._changed:
+                self.uploaded.append(uploaded)
+                self._changed.notify_all()
+            return
+        with self._changed:
+            self.errors.append(f"Error uploading batch {batch.params.name}:{batch.unique_id}: {'; '.join(errors)}")
+            self._changed.notify_all()
+
+    def flush(self) -> None:
+        """Seal and upload the open batch, whatever its size."""
+        with self._lock:
+            self._seal()
+
+    def close(self) -> None:
+        """Seal the open batch, and wait for the uploads to complete. No request can be added afterwards."""
+        with self._lock:
+            self._seal()
+            self._closed = True
+            uploads = list(self._uploads)
+        for upload in uploads:
+            upload.result()
+        self._uploader.shutdown(wait=True)
+        with self._changed:
+            self._changed.notify_all()
+
+    def _uploads_done(self) -> bool:
+        return self._closed and all(upload.done() for upload in self._uploads)
+
+    def results(
+        self, poll_interval: float = 10.0, max_poll_interval: float = 300.0, refresh_interval: float = 60.0
+    ) -> Iterator[Result]:
+        """Yield the results of all the batches, as soon as each batch is downloaded.
+
+        The stream ends once the rolling batcher is closed and all its batches are finished. All the uploaded
+        batches are polled together by a single poller (see ``Batcher.as_completed``): the batches uploaded
+        while waiting join the next poll, without resetting the polling interval.
+
+        Args:
+            poll_interval: The minimum interval between two polls, in seconds (see ``Batcher.as_completed``)
+            max_poll_interval: The maximum interval between two polls, in seconds
+            refresh_interval: The maximum wait for a new batch while no batch is pending, in seconds
+        """
+        polled: Set[str] = set()
+
+        def add_batches(idle: bool) -> Optional[List[UploadedBatch]]:
+            with self._changed:
+                added = [batch for batch in self.uploaded if batch.unique_id not in polled]
+                if not added and idle and not self._uploads_done():
+                    self._changed.wait(refresh_interval)
+                    added = [batch for batch in self.uploaded if batch.unique_id not in polled]
+                polled.update(batch.unique_id for batch in added)
+                if not added and self._uploads_done():
+                    return None
+                return added
+
+        for batch in self.batcher._poll_finished(
+            {}, poll_interval=poll_interval, max_poll_interval=max_poll_interval, add_batches=add_batches
+        ):
+            results = cast(Optional[List[Result]], batch.get_results()) if isinstance(batch, DownloadedBatch) else None
+            if results is not None:
+                yield from results
+            else:
+                with self._lock:
+                    self.errors.append(f"Batch {batch.params.name}:{batch.unique_id} {batch.status.value}")
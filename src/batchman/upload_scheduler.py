@@ -0,0 +1,324 @@
+import os
+import threading
+from typing import TYPE_CHECKING, Any, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from .batch_interfaces import DownloadedBatch, EditableBatch, UploadedBatch
+from .models.batch import Batch
+from .models.enums import LocalBatchStatus
+from .utils.backoff import Backoff
+from .utils.blobs import BlobStore
+from .utils.files import iter_jsonl, read_json, write_json
+from .utils.logging import logger
+
+if TYPE_CHECKING:
+    from .batchman import Batcher
+
+
+# Rough number of characters per token of the usual tokenizers
+CHARS_PER_TOKEN = 4
+
+# Estimated number of tokens of an image
+IMAGE_TOKENS = 765
+
+# Statuses of the batches holding provider capacity
+RUNNING_STATUSES = (
+    LocalBatchStatus.VALIDATING, LocalBatchStatus.REGISTERED, LocalBatchStatus.IN_PROGRESS, LocalBatchStatus.CANCELLING
+)
+
+
+class UploadQuota(NamedTuple):
+    """Capacity of a provider queue, for a model and an API key (see ``UploadScheduler``)."""
+    max_tokens: Optional[int] = None
+    """Maximum number of enqueued prompt tokens (e.g. the OpenAI batch queue limit of the model)"""
+    max_batches: Optional[int] = None
+    """Maximum number of running batches"""
+
+
+def _content_chars(content: Any, blobs: BlobStore) -> Tuple[int, int]:
+    """Return the number of characters and of images of a message content."""
+    if isinstance(content, str):
+        return len(content), 0
+    if isinstance(content, dict):
+        content = [content]
+    chars = images = 0
+    for part in content or []:
+        kind = part.get("type")
+        if kind == "text":
+            chars += len(part["content"])
+        elif kind == "image" or (kind == "blob" and part["media_type"].startswith("image/")):
+            images += 1
+        elif kind == "blob":
+            try:
+                chars += blobs.path(part["digest"]).stat().st_size
+            except FileNotFoundError:
+                pass
+    return chars, images
+
+
+def estimate_tokens(batch: Batch) -> int:
+    """Estimate the number of prompt tokens of the requests of a batch, without tokenizer.
+
+    Texts count for one token per ``CHARS_PER_TOKEN`` characters, and images for ``IMAGE_TOKENS`` tokens.
+    """
+    system_prompt = batch.global_request_params.get("system_prompt")
+    blobs = batch.batcher.content_blobs
+    chars = images = 0
+    for request in iter_jsonl(batch._files.requests):
+        chars += len(system_prompt or request.get("system_prompt") or "")
+        for message in request["messages"]:
+            message_chars, message_images = _content_chars(message["content"], blobs)
+            chars += message_chars
+            images += message_images
+    return chars // CHARS_PER_TOKEN + images * IMAGE_TOKENS
+
+
+QuotaKey = Union[str, Tuple[str, str]]
+
+
+class UploadScheduler:
+    """Hold batches in a persistent queue, and upload them when the provider has the capacity to run them.
+
+    Each batch is charged against the capacity of its provider, model and API key (provider config): its
+    estimated prompt tokens (see ``estimate_tokens``) and one running batch. A queued batch is uploaded
+    (admitted) once the batches already running with the same capacity leave it enough room, in the order
+    of the queue. All the running batches of the batcher are charged, including the ones not uploaded by
+    the scheduler (e.g. with ``EditableBatch.upload``). The capacity is given back when a batch is completed,
+    failed or cancelled, so the held batches are admitted as the running ones finish (see ``run``, or
+    ``batchman watch``).
+
+    The queue, the running batches and the quotas are stored in the batches directory, so a new scheduler
+    (e.g. in another process) resumes them.
+
+    Args:
+        batcher: The batcher of the batches
+        quotas: The quotas, by provider name or (provider name, model). Optional, defaults to the stored
+            quotas. The capacities without quota are unlimited.
+    """
+
+    def __init__(self, batcher: "Batcher", quotas: Optional[Dict[QuotaKey, UploadQuota]] = None) -> None:
+        self.batcher = batcher
+        self.path = batcher.batches_dir / ".scheduler" / "state.json"
+        self._lock = threading.RLock()
+        state = self._load()
+        self.queue: List[Dict[str, Any]] = state.get("queue", [])
+        """The held batches, in order: unique_id, capacity key, estimated tokens and upload kwargs"""
+        self.running: Dict[str, Dict[str, Any]] = state.get("running", {})
+        """The running batches, by unique_id: capacity key and estimated tokens"""
+        # the queued batches being uploaded by admit, by unique_id: they stay queued until they are uploaded
+        self._reserved: Dict[str, Dict[str, Any]] = {}
+        if quotas is None:
+            self.quotas = {
+                (entry["provider"], entry["model"]) if entry.get("model") else entry["provider"]: UploadQuota(
+                    entry.get("max_tokens"), entry.get("max_batches")
+                )
+                for entry in state.get("quotas", [])
+            }
+        else:
+            self.quotas = dict(quotas)
+            self._save()
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            return read_json(self.path)
+        except FileNotFoundError:
+            return {}
+
+    def _save(self) -> None:
+        quotas = [
+            {
+                "provider": key[0] if isinstance(key, tuple) else key,
+                "model": key[1] if isinstance(key, tuple) else None,
+                **quota._asdict(),
+            }
+            for key, quota in self.quotas.items()
+        ]
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.tmp-{os.getpid()}-{threading.get_ident()}")
+        write_json(tmp_path, {"quotas": quotas, "queue": self.queue, "running": self.running})
+        os.replace(tmp_path, self.path)
+
+    def _quota(self, key: List[Optional[str]]) -> UploadQuota:
+        provider, model, _ = key
+        return self.quotas.get((provider, model)) or self.quotas.get(provider) or UploadQuota()
+
+    @staticmethod
+    def capacity_key(batch: Batch) -> List[Optional[str]]:
+        """Return the capacity a batch is charged against: its provider, model and provider config hash."""
+        provider = batch.params.provider
+        if not provider.get("name"):
+            raise ValueError(f"Batch {batch.params.name}:{batch.unique_id} has no provider")
+        model = batch.global_request_params.get("model")
+        if model is None:
+            for request in iter_jsonl(batch._files.requests):
+                model = request.get("model")
+                break
+        return [provider["name"], model, provider.get("config_hash")]
+
+    def submit(self, batch: EditableBatch, **upload_kwargs: Any) -> Optional[Union[UploadedBatch, DownloadedBatch]]:
+        """Queue a batch for upload, and upload the queued batches which fit in their capacity.
+
+        Args:
+            batch: The batch to upload, its provider must be set
+            upload_kwargs: Arguments of ``EditableBatch.upload`` (must be JSON serializable, as they are stored)
+
+        Returns:
+            The uploaded batch if it was admitted right away (downloaded if answered from the result cache),
+            else None (it is held in the queue)
+        """
+        entry = {
+            "unique_id": batch.unique_id,
+            "key": self.capacity_key(batch),
+            "tokens": estimate_tokens(batch),
+            "upload_kwargs": upload_kwargs,
+        }
+        with self._lock:
+            if any(queued["unique_id"] == batch.unique_id for queued in self.queue):
+                raise ValueError(f"Batch {batch.params.name}:{batch.unique_id} is already queued")
+            self.queue.append(entry)
+            self._save()
+        uploaded, errors = self.admit()
+        for error in errors:
+            logger.warning(error)
+        return next((uploaded_batch for uploaded_batch in uploaded if uploaded_batch.unique_id == batch.unique_id), None)
+
+    def usage(self) -> Dict[Tuple[Optional[str], ...], Tuple[int, int]]:
+        """Return the capacity used by the running batches: (tokens, batches) by capacity key.
+
+        The running batches are read from their last sync. The capacity of the batches not uploaded by the
+        scheduler is estimated once, and the batches which are not running anymore are forgotten. The batches
+        being uploaded (see ``admit``) are charged too.
+        """
+        summaries, _ = self.batcher.batch_summaries(list(RUNNING_STATUSES))
+        running_ids = [summary.unique_id for summary in summaries]
+        usage: Dict[Tuple[Optional[str], ...], Tuple[int, int]] = {}
+        with self._lock:
+            for unique_id in set(self.running) - set(running_ids):
+                del self.running[unique_id]
+            for unique_id in running_ids:
+                if unique_id not in self.running:
+                    try:
+                        batch = self.batcher.load_batch(unique_id)
+                        self.running[unique_id] = {"key": self.capacity_key(batch), "tokens": estimate_tokens(batch)}
+                    except Exception as e:
+                        logger.warning(f"Could not estimate the capacity used by batch {unique_id}: {e}")
+                        continue
+                entry = self.running[unique_id]
+                tokens, batches = usage.get(tuple(entry["key"]), (0, 0))
+                usage[tuple(entry["key"])] = (tokens + entry["tokens"], batches + 1)
+            for unique_id, entry in self._reserved.items():
+                if unique_id not in self.running:
+                    tokens, batches = usage.get(tuple(entry["key"]), (0, 0))
+                    usage[tuple(entry["key"])] = (tokens + entry["tokens"], batches + 1)
+        return usage
+
+    def admit(self) -> Tuple[List[Union[UploadedBatch, DownloadedBatch]], List[str]]:
+        """Upload the queued batches which fit in the capacity left by the running batches.
+
+        The batches are admitted in queue order: a batch which does not fit holds the next batches of the
+        same capacity, but not the batches of the other capacities. A batch larger than its whole quota is
+        admitted alone.
+
+        The admitted batches reserve their capacity under the lock, and are uploaded outside of it, so the
+        scheduler is not blocked by the uploads. A batch which fails to upload releases its capacity, and
+        holds the next admitted batches of the same capacity.
+
+        Returns:
+            A tuple containing:
+            - List of the uploaded batches
+            - List of errors that occurred while uploading the batches (they stay queued)
+        """
+        uploaded: List[Union[UploadedBatch, DownloadedBatch]] = []
+        errors: List[str] = []
+        admitted = []
+        with self._lock:
+            usage = self.usage()
+            blocked = set()
+            for entry in self.queue:
+                key = tuple(entry["key"])
+                if key in blocked or entry["unique_id"] in self._reserved:
+                    continue
+                quota = self._quota(entry["key"])
+                tokens, batches = usage.get(key, (0, 0))
+                fits = (quota.max_batches is None or batches < quota.max_batches) and (
+                    quota.max_tokens is None or tokens + entry["tokens"] <= quota.max_tokens or batches == 0
+                )
+                if not fits:
+                    blocked.add(key)
+                    continue
+                self._reserved[entry["unique_id"]] = entry
+                usage[key] = (tokens + entry["tokens"], batches + 1)
+                admitted.append(entry)
+
+        failed = set()
+        for entry in admitted:
+            key = tuple(entry["key"])
+            uploaded_batch = None
+            deleted = False
+            if key not in failed:
+                try:
+                    batch = self.batcher.load_batch(entry["unique_id"])
+                except FileNotFoundError:
+                    # deleted while queued
+                    deleted = True
+                else:
+                    try:
+                        if not isinstance(batch, EditableBatch):
+                            raise ValueError("it is already uploaded")
+                        uploaded_batch = batch.upload(**entry["upload_kwargs"])
+                    except Exception as e:
+                        errors.append(f"Error uploading batch {entry['unique_id']}: {e}")
+                        failed.add(key)
+            with self._lock:
+                del self._reserved[entry["unique_id"]]
+                if uploaded_batch is not None or deleted:
+                    self.queue.remove(entry)
+                if uploaded_batch is not None:
+                    self.running[entry["unique_id"]] = {"key": entry["key"], "tokens": entry["tokens"]}
+            if uploaded_batch is not None:
+                uploaded.append(uploaded_batch)
+                logger.info(f"Batch {entry['unique_id']} admitted ({entry['tokens']} estimated tokens)")
+        with self._lock:
+            self._save()
+        return uploaded, errors
+
+    def sync_running(self) -> List[str]:
+        """Sync the running batches (with bulk status queries when supported), to release their capacity.
+
+        Returns:
+            List of errors that occurred while syncing the batches
+        """
+        batches = []
+        errors = []
+        with self._lock:
+            unique_ids = list(self.running)
+        for unique_id in unique_ids:
+            try:
+                batch = self.batcher.load_batch(unique_id)
+            except FileNotFoundError:
+                continue
+            if isinstance(batch, UploadedBatch):
+                batches.append(batch)
+        for unique_id, error in self.batcher._sync_many(batches).items():
+            errors.append(f"Error syncing batch {unique_id}: {error}")
+        return errors
+
+    def run(self, poll_interval: float = 60.0, max_poll_interval: float = 600.0, stop: Optional[threading.Event] = None) -> List[str]:
+        """Admit the queued batches as the running batches finish, until the queue is empty.
+
+        Returns:
+            List of the errors of the last round
+        """
+        stop = stop or threading.Event()
+        backoff = Backoff(poll_interval, max(poll_interval, max_poll_interval), jitter=0.1)
+        errors: List[str] = []
+        while not stop.is_set():
+            uploaded, errors = self.admit()
+            with self._lock:
+                if not self.queue:
+                    break
+            for error in errors:
+                logger.warning(error)
+            stop.wait(backoff.next(changed=bool(uploaded)))
+            for error in self.sync_running():
+                logger.warning(error)
+        return errors
@@ -1,5 +1,5 @@
 from .envs import read_env_vars
-from .files import read_json, read_jsonl, upsert_json, write_jsonl, append_jsonl
+from .files import read_json, read_jsonl, iter_jsonl, upsert_json, write_jsonl, append_jsonl
 from .logging import logger
 from .common import autoinit
 
@@ -8,6 +8,7 @@ __all__ = [
     "read_env_vars",
     "read_json",
     "read_jsonl",
+    "iter_jsonl",
     "upsert_json",
     "write_jsonl",
     "append_jsonl",
@@ -0,0 +1,50 @@
+import random
+from typing import Optional
+
+
+class Backoff:
+    """Adaptive polling interval: it grows geometrically while nothing changes, and is reset on changes.
+
+    Args:
+        initial: The interval after a change, in seconds
+        maximum: The maximum interval, in seconds
+        factor: The growth factor of the interval when nothing changed
+        jitter: Fraction of the interval randomly added or removed, to spread the polls of concurrent pollers
+        rng: Random generator used for the jitter, for reproducibility
+    """
+
+    def __init__(
+        self,
+        initial: float = 30.0,
+        maximum: float = 600.0,
+        factor: float = 2.0,
+        jitter: float = 0.0,
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        if initial <= 0 or maximum < initial or factor < 1 or not 0 <= jitter < 1:
+            raise ValueError(
+                f"Invalid backoff: initial={initial}, maximum={maximum}, factor={factor}, jitter={jitter}"
+            )
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.interval = initial
+        self._rng = rng or random.Random()
+
+    def reset(self) -> None:
+        self.interval = self.initial
+
+    def next(self, changed: bool) -> float:
+        """Update the interval after a poll, and return the delay before the next one.
+
+        Args:
+            changed: Whether the last poll observed a change (the interval is then reset)
+        """
+        if changed:
+            self.interval = self.initial
+        else:
+            self.interval = min(self.interval * self.factor, self.maximum)
+        if not self.jitter:
+            return self.interval
+        return self.interval * (1 + self._rng.uniform(-self.jitter, self.jitter))
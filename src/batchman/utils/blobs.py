@@ -0,0 +1,147 @@
+import hashlib
+import os
+import shutil
+import stat
+from pathlib import Path
+from typing import Optional
+
+from .logging import logger
+
+
+def link_or_copy(src: Path, dst: Path) -> None:
+    """Hardlink src to dst (replacing dst), or copy it if hardlinks are not supported."""
+    tmp = dst.with_name(dst.name + ".tmp-link")
+    tmp.unlink(missing_ok=True)
+    try:
+        os.link(src, tmp)
+    except OSError as e:
+        logger.debug(f"Could not hardlink {src} to {dst}, copying it instead: {e}")
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+def detach_file(path: Path) -> None:
+    """Make sure the file is not shared with another link (copy on write).
+
+    Must be called before modifying in place a file which may be linked to the blob store.
+    """
+    if path.exists() and path.stat().st_nlink > 1:
+        tmp = path.with_name(path.name + ".tmp-detach")
+        shutil.copyfile(path, tmp)
+        os.replace(tmp, path)
+
+
+class BlobStore:
+    """Content-addressed store of files, keyed by the sha256 of their content.
+
+    Files are shared between the store and the batches using hardlinks (falling back to copies when
+    hardlinks are not supported), so a given content is stored once on disk whatever the number of
+    batches referencing it. The number of links of a blob is its reference count: a blob only
+    linked from the store is not used anymore, and can be garbage collected.
+
+    Blobs are read-only, a linked file must be detached (see ``detach_file``) before being modified.
+
+    Small contents (e.g. message parts, see ``batchman.models.content``) can also be stored with
+    ``put_bytes``. They are referenced by digest instead of links, so they must be kept in a store
+    which is never garbage collected.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+
+    def path(self, digest: str) -> Path:
+        return self.directory / digest[:2] / digest
+
+    def __contains__(self, digest: str) -> bool:
+        return self.path(digest).exists()
+
+    @staticmethod
+    def hash_file(path: Path) -> str:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(1 << 20)
+                if not chunk:
+                    break
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def is_blob(self, path: Path, digest: Optional[str]) -> bool:
+        """Return whether the file is (linked to) the blob with the given digest."""
+        if not digest or digest not in self:
+            return False
+        try:
+            return os.path.samefile(path, self.path(digest))
+        except OSError:
+            return False
+
+    def put_file(self, path: Path) -> str:
+        """Store the file content in the blob store, and replace the file by a link to the blob.
+
+        Returns:
+            The digest of the file content
+        """
+        digest = self.hash_file(path)
+        blob_path = self.path(digest)
+        if blob_path.exists():
+            # Same content already stored: deduplicate the file
+            link_or_copy(blob_path, path)
+        else:
+            blob_path.parent.mkdir(parents=True, exist_ok=True)
+            link_or_copy(path, blob_path)
+            os.chmod(blob_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        return digest
+
+    def put_bytes(self, data: bytes) -> str:
+        """Store the given content, if not already stored.
+
+        Returns:
+            The digest of the content
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        blob_path = self.path(digest)
+        if not blob_path.exists():
+            blob_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = blob_path.with_name(f"{digest}.tmp-{os.getpid()}")
+            tmp.write_bytes(data)
+            os.chmod(tmp, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            os.replace(tmp, blob_path)
+        return digest
+
+    def get_bytes(self, digest: str) -> bytes:
+        """Return the stored content.
+
+        Raises:
+            KeyError: If no content is stored with this digest
+        """
+        try:
+            return self.path(digest).read_bytes()
+        except FileNotFoundError:
+            raise KeyError(f"Blob {digest} not found in {self.directory}")
+
+    def link(self, digest: str, dst: Path) -> None:
+        """Make dst a link to the blob (a copy if hardlinks are not supported)."""
+        link_or_copy(self.path(digest), dst)
+
+    def release(self, digest: str) -> None:
+        """Remove the blob if it is not referenced anymore."""
+        blob_path = self.path(digest)
+        if blob_path.exists() and blob_path.stat().st_nlink <= 1:
+            blob_path.unlink()
+
+    def gc(self) -> int:
+        """Remove all the blobs which are not referenced anymore.
+
+        Returns:
+            The number of removed blobs
+        """
+        removed = 0
+        if not self.directory.exists():
+            return removed
+        for blob_path in self.directory.glob("*/*"):
+            if ".tmp" in blob_path.name:
+                continue
+            if blob_path.stat().st_nlink <= 1:
+                blob_path.unlink()
+                removed += 1
+        return removed
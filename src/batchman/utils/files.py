@@ -1,23 +1,150 @@
+import gzip
+import io
 import json
+import os
 from pathlib import Path
-from typing import Any, Dict, List, TextIO, Union
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Union
 from pydantic import BaseModel
 from pydantic_core import to_jsonable_python
 
 DictOrModel = Union[Dict[str, Any], BaseModel]
 
 
-def fwrite(f: TextIO, data: DictOrModel, end: str = "") -> None:
+class JsonCodec:
+    """Encode and decode JSON, from and to bytes.
+
+    All the backends produce the same output: compact separators and UTF-8 (non ascii characters
+    are not escaped). Types not natively handled by the backend are converted with pydantic's
+    ``to_jsonable_python``.
+
+    The files written by previous versions (stdlib ``json.dumps`` defaults: spaced separators and ascii
+    escapes) are read the same way. The provider config hashes and the result cache keys do not depend
+    on the bytes of these files: they are computed from the decoded values, with their own serialization.
+    """
+
+    name = "json"
+
+    def dumps(self, data: Any) -> bytes:
+        return json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=to_jsonable_python).encode()
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+    name = "orjson"
+
+    def __init__(self) -> None:
+        import orjson
+
+        self._orjson = orjson
+        # dataclasses and datetimes go through to_jsonable_python, to keep the same output as the stdlib codec
+        self._option = orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps(self, data: Any) -> bytes:
+        return self._orjson.dumps(data, default=to_jsonable_python, option=self._option)
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return self._orjson.loads(data)
+
+
+class MsgspecCodec(JsonCodec):
+    name = "msgspec"
+
+    def __init__(self) -> None:
+        import msgspec
+
+        self._encoder = msgspec.json.Encoder(enc_hook=to_jsonable_python)
+        self._decoder = msgspec.json.Decoder()
+
+    def dumps(self, data: Any) -> bytes:
+        return self._encoder.encode(data)
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return self._decoder.decode(data)
+
+
+_CODECS = {codec.name: codec for codec in (OrjsonCodec, MsgspecCodec, JsonCodec)}
+_codec: Optional[JsonCodec] = None
+
+
+def set_json_codec(name: Optional[str] = None) -> JsonCodec:
+    """Select the JSON codec used to read and write all batchman files.
+
+    Args:
+        name: One of "orjson", "msgspec" or "json" (stdlib). If not provided, the ``BATCHMAN_JSON_CODEC``
+            environment variable is used, and otherwise the fastest installed backend.
+
+    Raises:
+        ValueError: If the codec is unknown
+        ImportError: If the requested backend is not installed
+    """
+    global _codec
+    name = name or os.getenv("BATCHMAN_JSON_CODEC")
+    if name:
+        if name not in _CODECS:
+            raise ValueError(f"Unknown JSON codec {name}, expected one of {list(_CODECS)}")
+        _codec = _CODECS[name]()
+        return _codec
+
+    for codec_cls in _CODECS.values():
+        try:
+            _codec = codec_cls()
+            return _codec
+        except ImportError:
+            continue
+    raise RuntimeError("No JSON codec available")  # unreachable, the stdlib codec is always available
+
+
+def get_json_codec() -> JsonCodec:
+    """Return the JSON codec in use (selected on first use, see ``set_json_codec``)."""
+    if _codec is None:
+        return set_json_codec()
+    return _codec
+
+
+# Compression formats of the large batch files, and the suffix added to the file name
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+
+
+def is_compressed(path: Path) -> bool:
+    return path.suffix in COMPRESSION_SUFFIXES.values()
+
+
+def open_file(path: Path, mode: str = "rb") -> BinaryIO:
+    """Open a file in binary mode, transparently (de)compressing it based on its suffix (.gz or .zst).
+
+    Appending to a compressed file adds a new compressed frame (or gzip member), which is read
+    back transparently.
+    """
+    if path.suffix == COMPRESSION_SUFFIXES["gzip"]:
+        return gzip.open(path, mode, compresslevel=6)  # type: ignore[return-value]
+    if path.suffix == COMPRESSION_SUFFIXES["zstd"]:
+        try:
+            import zstandard
+        except ImportError as e:
+            raise ImportError(
+                f"zstandard is required to read or write {path}, install it with `pip install batchman[zstd]`"
+            ) from e
+        f = zstandard.open(path, mode)
+        # the zstandard reader is not line iterable, the buffered reader is
+        return io.BufferedReader(f) if "r" in mode else f  # type: ignore[no-any-return]
+    return open(path, mode)  # type: ignore[return-value]
+
+
+def fwrite(f: BinaryIO, data: Union[DictOrModel, str], end: bytes = b"") -> None:
+    if isinstance(data, str):
+        f.write(data.encode() + end)
+        return
     if isinstance(data, BaseModel):
         data = data.model_dump()
-    f.write(json.dumps(to_jsonable_python(data)) + end)
+    f.write(get_json_codec().dumps(data) + end)
 
 
 def read_json(path: Path) -> Dict[str, Any]:
     try:
-        with open(path, "r") as f:
-            txt = f.read()
-            data = json.loads(txt)
+        with open(path, "rb") as f:
+            data = get_json_codec().loads(f.read())
     except FileNotFoundError:
         raise FileNotFoundError(f"File {path} not found")
     except Exception as e:
@@ -26,7 +153,7 @@ def read_json(path: Path) -> Dict[str, Any]:
 
 
 def write_json(path: Path, data: DictOrModel) -> None:
-    with open(path, "w") as f:
+    with open(path, "wb") as f:
         fwrite(f, data)
 
 
@@ -47,30 +174,86 @@ def upsert_json(path: Path, data: DictOrModel) -> None:
 
 
 def read_jsonl(path: Path) -> List[Dict[str, Any]]:
-    with open(path, "r") as f:
+    loads = get_json_codec().loads
+    with open_file(path, "rb") as f:
         non_empty_lines = (line for line in f if line.strip())
-        return [json.loads(line) for line in non_empty_lines]
+        return [loads(line) for line in non_empty_lines]
+
+
+def iter_jsonl(path: Path) -> Iterator[Dict[str, Any]]:
+    """Iterate over the lines of a jsonl file, without loading the whole file in memory."""
+    loads = get_json_codec().loads
+    with open_file(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield loads(line)
+
+
+def read_last_jsonl(path: Path) -> Optional[Dict[str, Any]]:
+    """Return the last line of a (plain) jsonl file, reading the file backwards from its end.
+
+    Returns None if the file has no line.
+
+    Raises:
+        FileNotFoundError: If the file does not exist
+    """
+    with open(path, "rb") as f:
+        position = f.seek(0, os.SEEK_END)
+        tail = b""
+        while position > 0:
+            step = min(position, 1 << 13)
+            position -= step
+            f.seek(position)
+            tail = f.read(step) + tail
+            lines = [line for line in tail.splitlines() if line.strip()]
+            # the first line of the tail may be truncated, unless the start of the file is reached
+            if len(lines) > 1 or (lines and position == 0):
+                return get_json_codec().loads(lines[-1])
+    return None
+
+
+def _write_jsonl_lines(f: BinaryIO, data: Union[DictOrModel, List[DictOrModel], str]) -> None:
+    if isinstance(data, (str, dict, BaseModel)):
+        fwrite(f, data, end=b"\n")
+    elif isinstance(data, list):
+        for item in data:
+            fwrite(f, item, end=b"\n")
+    else:
+        raise ValueError(f"Invalid data type: {type(data)}")
 
 
 def write_jsonl(path: Path, data: Union[DictOrModel, List[DictOrModel], str]) -> None:
-    with open(path, "w") as f:
-        if isinstance(data, str):
-            f.write(data + "\n")
-        elif isinstance(data, dict):
-            fwrite(f, data, end="\n")
-        elif isinstance(data, list):
-            for item in data:
-                fwrite(f, item, end="\n")
+    with open_file(path, "wb") as f:
+        _write_jsonl_lines(f, data)
 
 
 def append_jsonl(path: Path, data: Union[DictOrModel, List[DictOrModel], str]) -> None:
-    with open(path, "a") as f:
-        if isinstance(data, str):
-            f.write(data + "\n")
-        elif isinstance(data, (dict, BaseModel)):
-            fwrite(f, data, end="\n")
-        elif isinstance(data, list):
-            for item in data:
-                fwrite(f, item, end="\n")
-        else:
-            raise ValueError(f"Invalid data type: {type(data)}")
+    with open_file(path, "ab") as f:
+        _write_jsonl_lines(f, data)
+
+
+def recompress_file(path: Path, compression: Optional[str]) -> Path:
+    """Rewrite a file with the given compression ("gzip", "zstd" or None for plain text), in a streaming way.
+
+    The new file replaces the old one, and its path is returned.
+    """
+    if compression is not None and compression not in COMPRESSION_SUFFIXES:
+        raise ValueError(f"Unknown compression {compression}, expected one of {list(COMPRESSION_SUFFIXES)}")
+
+    base_path = path.with_suffix("") if is_compressed(path) else path
+    suffix = COMPRESSION_SUFFIXES[compression] if compression else ""
+    new_path = base_path.with_name(base_path.name + suffix)
+    if new_path == path:
+        return path
+
+    # The temporary file keeps the compression suffix, so it is written with the right format
+    tmp_path = base_path.with_name(base_path.name + ".tmp" + suffix)
+    with open_file(path, "rb") as src, open_file(tmp_path, "wb") as dst:
+        while True:
+            chunk = src.read(1 << 20)
+            if not chunk:
+                break
+            dst.write(chunk)
+    os.replace(tmp_path, new_path)
+    path.unlink()
+    return new_path
@@ -0,0 +1,172 @@
+import mmap
+import os
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Tuple
+
+from .blobs import detach_file
+from .files import get_json_codec, is_compressed, open_file
+
+
+IndexEntry = Tuple[str, int, int]
+
+
+class JsonlIndex:
+    """Sidecar index of a jsonl file, mapping each line key to its (offset, length) in bytes.
+
+    The index is stored next to the indexed file as a jsonl file, and is built in a single
+    streaming pass. If the indexed file grows (e.g. requests appended), only the new tail is
+    indexed. Lines are then read with ``mmap``, so a lookup only touches the needed bytes.
+
+    Compressed files (see ``open_file``) are indexed on their uncompressed content. As random access
+    is not possible, their lines are read by decompressing the file up to the needed bytes.
+
+    Args:
+        path: The indexed jsonl file
+        index_path: The sidecar index file
+        key: Function extracting the key (usually the custom_id) from a decoded line
+    """
+
+    def __init__(self, path: Path, index_path: Path, key: Callable[[Dict[str, Any]], str]) -> None:
+        self.path = path
+        self.index_path = index_path
+        self.key = key
+        self._entries: Optional[List[IndexEntry]] = None
+        self._positions: Dict[str, int] = {}
+
+    def _load(self) -> List[IndexEntry]:
+        if self._entries is not None:
+            return self._entries
+
+        self._entries = []
+        self._positions = {}
+        if self.index_path.exists():
+            loads = get_json_codec().loads
+            with open(self.index_path, "rb") as f:
+                for line in f:
+                    if line.strip():
+                        entry = loads(line)
+                        self._add_entry((entry["custom_id"], entry["offset"], entry["length"]))
+        return self._entries
+
+    def _add_entry(self, entry: IndexEntry) -> None:
+        assert self._entries is not None
+        # On duplicated keys, the first line wins (same as a linear scan would do)
+        self._positions.setdefault(entry[0], len(self._entries))
+        self._entries.append(entry)
+
+    def _covered_size(self) -> int:
+        entries = self._load()
+        if not entries:
+            return 0
+        _, offset, length = entries[-1]
+        # +1 for the line separator
+        return offset + length + 1
+
+    def reset(self) -> None:
+        """Drop the index, it is fully rebuilt on next update."""
+        self.index_path.unlink(missing_ok=True)
+        self._entries = []
+        self._positions = {}
+
+    def _is_up_to_date(self) -> bool:
+        if is_compressed(self.path):
+            # The uncompressed size is unknown: the file is rescanned only if modified after the index
+            return self.index_path.exists() and self.path.stat().st_mtime_ns < self.index_path.stat().st_mtime_ns
+
+        file_size = self.path.stat().st_size
+        covered = self._covered_size()
+        # covered can be file_size + 1 when the last line has no line separator
+        if covered > file_size + 1:
+            self.reset()
+            return False
+        return covered >= file_size
+
+    def update(self) -> None:
+        """Index the part of the file that is not indexed yet.
+
+        If the indexed file is smaller than what the index covers, the file has been rewritten
+        and the index is rebuilt from scratch.
+        """
+        if not self.path.exists():
+            self.reset()
+            return
+
+        if self._is_up_to_date():
+            return
+
+        codec = get_json_codec()
+        covered = self._covered_size()
+        new_entries = []
+        with open_file(self.path, "rb") as f:
+            if is_compressed(self.path):
+                _skip(f, covered)
+            else:
+                f.seek(covered)
+            offset = covered
+            for line in f:
+                stripped = line.rstrip(b"\r\n")
+                if stripped.strip():
+                    new_entries.append((self.key(codec.loads(stripped)), offset, len(stripped)))
+                offset += len(line)
+
+        # the index may be shared with a copied batch
+        detach_file(self.index_path)
+        with open(self.index_path, "ab") as f:
+            for custom_id, offset, length in new_entries:
+                f.write(codec.dumps({"custom_id": custom_id, "offset": offset, "length": length}) + b"\n")
+        # Mark the index as more recent than the indexed file, even if nothing was added
+        os.utime(self.index_path)
+        for entry in new_entries:
+            self._add_entry(entry)
+
+    def __len__(self) -> int:
+        self.update()
+        return len(self._load())
+
+    def __contains__(self, custom_id: str) -> bool:
+        self.update()
+        return custom_id in self._positions
+
+    def keys(self) -> List[str]:
+        """Return the indexed keys, in file order."""
+        self.update()
+        return [entry[0] for entry in self._load()]
+
+    def get(self, custom_id: str) -> Optional[Dict[str, Any]]:
+        """Return the decoded line for the given key, or None if not found."""
+        self.update()
+        self._load()
+        position = self._positions.get(custom_id)
+        if position is None:
+            return None
+        return self.slice(position, position + 1)[0]
+
+    def slice(self, start: Optional[int] = None, stop: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Return the decoded lines between the given positions (python slice semantics)."""
+        self.update()
+        entries = self._load()[start:stop]
+        if not entries:
+            return []
+
+        loads = get_json_codec().loads
+        if is_compressed(self.path):
+            lines = []
+            with open_file(self.path, "rb") as f:
+                position = 0
+                for _, offset, length in entries:
+                    _skip(f, offset - position)
+                    lines.append(loads(f.read(length)))
+                    position = offset + length
+            return lines
+
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return [loads(mm[offset:offset + length]) for _, offset, length in entries]
+
+
+def _skip(f: BinaryIO, size: int) -> None:
+    """Move forward in a decompressed stream, which can't be seeked."""
+    while size > 0:
+        chunk = f.read(min(size, 1 << 20))
+        if not chunk:
+            return
+        size -= len(chunk)
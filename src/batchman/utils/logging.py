@@ -16,7 +16,8 @@ console_handler.setFormatter(formatter)
 logger.addHandler(console_handler)
 
 # File output configuration: show DEBUG and above
-file_handler = logging.FileHandler("batchman.log")
+# (the file is only created on the first logged message, not when importing batchman)
+file_handler = logging.FileHandler("batchman.log", delay=True)
 file_handler.setLevel(logging.DEBUG)
 file_handler.setFormatter(formatter)
 logger.addHandler(file_handler)
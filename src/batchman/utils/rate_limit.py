@@ -0,0 +1,45 @@
+import threading
+import time
+from typing import Optional
+
+
+class RateLimiter:
+    """Token bucket limiting the calls to an API.
+
+    Args:
+        per_minute: The sustained number of calls per minute
+        burst: The number of calls which can be made at once after an idle period
+    """
+
+    def __init__(self, per_minute: float, burst: int = 1) -> None:
+        if per_minute <= 0 or burst < 1:
+            raise ValueError(f"Invalid rate limit: per_minute={per_minute}, burst={burst}")
+        self.rate = per_minute / 60
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def try_acquire(self, now: Optional[float] = None) -> float:
+        """Take a token if one is available.
+
+        Returns:
+            0 if a token was taken, else the number of seconds before one is available
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self._updated is not None:
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self) -> None:
+        """Take a token, waiting for one to be available."""
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
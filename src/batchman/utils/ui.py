@@ -1,24 +1,60 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, Tuple, List
+from typing import Dict, List, Optional, Set, Tuple
 from functools import partial
-from prettytable import PrettyTable
-from enum import Enum
-import click
-from itertools import chain
-import functools
-from prettytable import PrettyTable
-import asyncio
 
+from textual import work
 from textual.app import App, ComposeResult
-from textual.widgets import DataTable, Footer, Button, Label, Markdown
+from textual.widgets import DataTable, Footer, Button, Input, Label, Markdown
 from textual.screen import ModalScreen
 from textual.containers import Grid
 from textual import events
+from textual.timer import Timer
 
 from ..providers.registry import ProviderRegistry
-from ..batch_interfaces import UploadedBatch
 from ..batch_interfaces import UploadedBatch, EditableBatch, DownloadedBatch
 from ..batchman import Batcher, LocalBatchStatus
+from ..batch_index import SORT_FIELDS, query_summaries
+from ..models.batch import BatchSummary
+from ..models.enums import FINAL_STATUSES
+from ..progress import ProgressTracker
+from .backoff import Backoff
+
+
+# (summary field, column label) of the table columns
+COLUMNS = (
+    ("unique_id", "Local ID"),
+    ("name", "Name"),
+    ("status", "Status"),
+    ("provider", "Provider"),
+    ("remote_id", "Remote ID"),
+    ("created_at", "Created"),
+    ("progress", "Progress"),
+    ("throughput", "Req/min"),
+    ("eta", "ETA"),
+)
+
+# Number of rows materialized in the table at once
+PAGE_SIZE = 200
+
+
+def _cells(summary: BatchSummary, tracker: ProgressTracker) -> Dict[str, str]:
+    progress = summary.progress
+    in_progress = progress is not None and summary.status not in FINAL_STATUSES
+    throughput = tracker.throughput(summary.unique_id, progress) if in_progress else None
+    eta = tracker.eta(summary.unique_id, progress) if in_progress else None
+    return {
+        "unique_id": summary.unique_id,
+        "name": summary.name,
+        "status": summary.status.value,
+        "provider": summary.provider or "N/A",
+        "remote_id": summary.remote_id or "N/A",
+        "created_at": summary.created_at.astimezone().strftime("%Y-%m-%d %H:%M"),
+        # completed/failed/total requests
+        "progress": f"{progress.completed}/{progress.failed}/{progress.total}" if progress else "",
+        "throughput": f"{throughput:.1f}" if throughput is not None else "",
+        "eta": eta.astimezone().strftime("%m-%d %H:%M") if eta is not None else "",
+    }
 
 
 class MarkdownPopup(ModalScreen):
@@ -139,138 +175,292 @@ Button {
         ("d", "download", "Download 📥"),
         ("p", "print", "Print paths 📄"),
         ("r", "reload", "Refresh table 🔄"),
+        ("slash", "search", "Search 🔍"),
+        ("f", "filter_status", "Status filter"),
+        ("v", "filter_provider", "Provider filter"),
+        ("s", "sort", "Sort"),
+        ("o", "order", "Order"),
+        ("left_square_bracket", "previous_page", "Prev page"),
+        ("right_square_bracket", "next_page", "Next page"),
     ]
 
-    def __init__(self, dir: str):
+    # The table has the focus at start, so the bindings work before searching
+    AUTO_FOCUS = "DataTable"
+
+    def __init__(self, dir: str, sync_workers: int = 8, poll_interval: float = 60.0, max_poll_interval: float = 900.0):
 
         self.dir = dir
         super().__init__()
+        self.search_input = Input(placeholder="Search name, local ID or remote ID (press / to search, enter to go back to the table)")
         self.data_table = DataTable()
         self.batcher = Batcher(batches_dir=Path(self.dir))
-        # self.table, self.changed_batches, self.errors = self.set_table()
-
-
-    def set_table(self) -> Tuple[PrettyTable, Dict[str, Tuple[LocalBatchStatus, LocalBatchStatus]], List[str]]:
-        errors = self.batcher.sync_batches()
-        editable_batches, uploaded_batches, downloaded_batches, listing_errors = self.batcher.list_batches()
-
-        errors.extend(listing_errors)
-
-        changed_batches = []
-
-        waiting_batches = [batch for batch in uploaded_batches if batch.status in [LocalBatchStatus.VALIDATING, LocalBatchStatus.REGISTERED, LocalBatchStatus.IN_PROGRESS]]
-
-        if waiting_batches:
-            click.echo(
-                f"Found {len(editable_batches)+len(uploaded_batches)+len(downloaded_batches)} valid batches and {len(waiting_batches)} batches to synchronize: Syncing...  ",
-                nl=False,
-            )
-            statuses = {batch.unique_id: batch.status for batch in set(uploaded_batches + editable_batches + downloaded_batches)}
-            self.batcher.sync_batches()
-            editable_batches, uploaded_batches, downloaded_batches, listing_errors = self.batcher.list_batches()
-            errors = listing_errors
-            new_statuses = {batch.unique_id: batch.status for batch in set(uploaded_batches + editable_batches + downloaded_batches)}
-            changed_batches = {batch_id: (statuses[batch_id], new_statuses[batch_id]) for batch_id in statuses if statuses[batch_id] != new_statuses[batch_id]}
-            click.echo("Done")
-
-        else:
-            click.echo(f"Found {len(editable_batches)+len(uploaded_batches)+len(downloaded_batches)} batches.")
-
-        table = PrettyTable(["Local ID", "Name", "Status", "Provider", "Remote ID"])
-
-        fields_getters = [
-            ("unique_id", lambda batch: batch.params.unique_id),
-            ("name", lambda batch: batch.params.name),
-            ("status", lambda batch: batch.status.value),
-            ("provider", lambda batch: batch.params.provider.get("name", "N/A")),
-            ("remote_id", lambda batch: batch.remote_id or "N/A"),
-        ]
-
-        for batch in chain(editable_batches, uploaded_batches, downloaded_batches):
-            row = []
-            for field, getter in fields_getters:
-                try:
-                    row.append(getter(batch))
-                except Exception as e:
-                    row.append("ERROR")
-                    errors.append(
-                        f"Batch {batch.params.name}:{batch.params.unique_id} - {field}: {e}"
-                    )
-            table.add_row(row)
-
-        return table, changed_batches, errors
-
+        self.sync_workers = sync_workers
+        # The uploaded batches are synced every poll_interval seconds (0 to disable), backing off up to
+        # max_poll_interval while none of them progresses
+        self.poll_interval = poll_interval
+        self.backoff: Optional[Backoff] = (
+            Backoff(poll_interval, max(poll_interval, max_poll_interval), jitter=0.1) if poll_interval > 0 else None
+        )
+        self._poll_timer: Optional[Timer] = None
+        self.progress_tracker = ProgressTracker()
+        # Summaries of all the batches, by unique_id
+        self.summaries: Dict[str, BatchSummary] = {}
+
+        # The table is virtualized: only the rows of the current page of the filtered and sorted
+        # batches are materialized
+        self.view: List[str] = []
+        self.page = 0
+        self.page_ids: Set[str] = set()
+        # Cells of the displayed rows, by unique_id
+        self.rendered: Dict[str, Dict[str, str]] = {}
+        self.status_filter: Optional[LocalBatchStatus] = None
+        self.provider_filter: Optional[str] = None
+        self.search = ""
+        self.sort_by = "created_at"
+        self.descending = True
 
     @staticmethod
     def _req_fmt(req_uid: str) -> str:
         return f"[chartreuse][bold]{req_uid}[/chartreuse][/bold]"
 
     def compose(self) -> ComposeResult:
+        yield self.search_input
         yield self.data_table
         yield Footer()
 
-    def re_compute(self):
-        self.table, self.changed_batches, self.errors = self.set_table()
+    def apply_query(self) -> None:
+        """Filter and sort the batches, and render the current page."""
+        summaries = query_summaries(
+            self.summaries.values(),
+            statuses=[self.status_filter] if self.status_filter else None,
+            providers=[self.provider_filter] if self.provider_filter else None,
+            search=self.search,
+            sort_by=self.sort_by,
+            descending=self.descending,
+        )
+        self.view = [summary.unique_id for summary in summaries]
+        self.page = min(self.page, max(0, (len(self.view) - 1) // PAGE_SIZE))
+        self.render_page()
+
+    def render_page(self) -> None:
+        page_ids = self.view[self.page * PAGE_SIZE:(self.page + 1) * PAGE_SIZE]
         self.data_table.clear()
+        self.rendered = {}
+        for unique_id in page_ids:
+            cells = _cells(self.summaries[unique_id], self.progress_tracker)
+            self.data_table.add_row(*(cells[field] for field, _ in COLUMNS), key=unique_id)
+            self.rendered[unique_id] = cells
+        self.page_ids = set(page_ids)
+
+        page_count = max(1, (len(self.view) + PAGE_SIZE - 1) // PAGE_SIZE)
+        filters = [
+            f"status={self.status_filter.value}" if self.status_filter else "",
+            f"provider={self.provider_filter}" if self.provider_filter else "",
+            f"search={self.search!r}" if self.search else "",
+        ]
+        filters_text = ", ".join(filter(None, filters))
+        self.title = (
+            f"{len(self.view)}/{len(self.summaries)} batches{f' ({filters_text})' if filters_text else ''}"
+            f" - sorted by {self.sort_by} {'desc' if self.descending else 'asc'} - page {self.page + 1}/{page_count}"
+        )
+
+    def update_row(self, summary: BatchSummary) -> None:
+        """Update the summary of a batch, and only the changed cells of its row if it is displayed."""
+        self.summaries[summary.unique_id] = summary
+        previous_cells = self.rendered.get(summary.unique_id)
+        if previous_cells is None:
+            return
+        cells = _cells(summary, self.progress_tracker)
+        for field, _ in COLUMNS:
+            if cells[field] != previous_cells[field]:
+                self.data_table.update_cell(summary.unique_id, field, cells[field])
+        self.rendered[summary.unique_id] = cells
+
+    def remove_row(self, unique_id: str) -> None:
+        self.summaries.pop(unique_id, None)
+        if unique_id in self.view:
+            self.view.remove(unique_id)
+        self.progress_tracker.forget(unique_id)
+        if unique_id in self.page_ids:
+            self.page_ids.discard(unique_id)
+            self.rendered.pop(unique_id, None)
+            self.data_table.remove_row(unique_id)
+
+    def refresh_rows(self) -> None:
+        """Update the table from the local state of the batches (no network call), using the batch index."""
+        summaries, errors = self.batcher.batch_summaries()
+        self.summaries = {summary.unique_id: summary for summary in summaries}
+        self.apply_query()
+        if errors:
+            self.push_screen(PopupScreen("Errors: " + "\n".join(errors)))
+
+    def on_mount(self) -> None:
         self.data_table.cursor_type = "row"
         self.data_table.zebra_stripes = True
-        if not self.data_table.columns:
-            self.data_table.add_columns(*self.table.field_names)
-        for row in self.table.rows:
-            self.data_table.add_row(*row, key=row[0])
-        self.query_one(DataTable).loading = False
-        # self.data_table.loading = False
+        for field, label in COLUMNS:
+            self.data_table.add_column(label, key=field)
+        # The table is rendered from the local state first, then updated as the batches are synced
+        self.refresh_rows()
+        self.sync_batches()
+
+    def on_unmount(self) -> None:
+        # a sync finishing after the unmount must not schedule another poll
+        self.backoff = None
+        if self._poll_timer is not None:
+            self._poll_timer.stop()
+
+    def on_input_changed(self, event: Input.Changed) -> None:
+        # incremental search
+        self.search = event.value.strip()
+        self.page = 0
+        self.apply_query()
+
+    def on_input_submitted(self, event: Input.Submitted) -> None:
+        self.data_table.focus()
+
+    def action_search(self) -> None:
+        self.search_input.focus()
+
+    def action_filter_status(self) -> None:
+        """Cycle through the statuses of the existing batches."""
+        statuses = [status for status in LocalBatchStatus if any(s.status == status for s in self.summaries.values())]
+        self.status_filter = self._next_value([None, *statuses], self.status_filter)
+        self.page = 0
+        self.apply_query()
+
+    def action_filter_provider(self) -> None:
+        """Cycle through the providers of the existing batches."""
+        providers = sorted({summary.provider for summary in self.summaries.values() if summary.provider})
+        self.provider_filter = self._next_value([None, *providers], self.provider_filter)
+        self.page = 0
+        self.apply_query()
+
+    def action_sort(self) -> None:
+        self.sort_by = self._next_value(list(SORT_FIELDS), self.sort_by)
+        self.apply_query()
+
+    def action_order(self) -> None:
+        self.descending = not self.descending
+        self.apply_query()
+
+    def action_next_page(self) -> None:
+        if (self.page + 1) * PAGE_SIZE < len(self.view):
+            self.page += 1
+            self.render_page()
+
+    def action_previous_page(self) -> None:
+        if self.page > 0:
+            self.page -= 1
+            self.render_page()
 
-    def on_mount(self) -> None:
-        self.re_compute()
-        if self.errors:
-            self.push_screen(PopupScreen("Errors: " + "\n".join(self.errors)))
-        if self.changed_batches:
+    @staticmethod
+    def _next_value(values: List, current):
+        index = values.index(current) if current in values else -1
+        return values[(index + 1) % len(values)]
+
+    def _sync_batch(self, unique_id: str) -> BatchSummary:
+        batch = self.batcher.load_batch(unique_id)
+        if isinstance(batch, UploadedBatch):
+            self.batcher._sync_batch(batch)
+        return batch.summary()
+
+    @work(thread=True, exclusive=True, group="sync")
+    def sync_batches(self) -> None:
+        """Sync the uploaded batches concurrently in the background, updating their row once synced."""
+        to_sync = [
+            summary.unique_id for summary in list(self.summaries.values())
+            if summary.remote_id and summary.status not in FINAL_STATUSES
+        ]
+        changed_batches: Dict[str, Tuple[LocalBatchStatus, LocalBatchStatus]] = {}
+        errors: List[str] = []
+        progressed = False
+        if not to_sync:
+            self.call_from_thread(self._sync_done, changed_batches, errors, progressed)
+            return
+        self.call_from_thread(setattr, self, "sub_title", f"Syncing {len(to_sync)} batches...")
+
+        with ThreadPoolExecutor(max_workers=self.sync_workers) as executor:
+            futures = {executor.submit(self._sync_batch, unique_id): unique_id for unique_id in to_sync}
+            for future in as_completed(futures):
+                unique_id = futures[future]
+                try:
+                    summary = future.result()
+                except Exception as e:
+                    errors.append(f"Error syncing batch {unique_id}: {e}")
+                    continue
+                previous = self.summaries.get(unique_id)
+                if previous is not None and previous.status != summary.status:
+                    changed_batches[unique_id] = (previous.status, summary.status)
+                progressed |= self.progress_tracker.observe(unique_id, summary.progress)
+                self.call_from_thread(self.update_row, summary)
+
+        self.call_from_thread(self._sync_done, changed_batches, errors, progressed or bool(changed_batches))
+
+    def _schedule_poll(self, changed: bool) -> None:
+        if self.backoff is None:
+            return
+        if self._poll_timer is not None:
+            self._poll_timer.stop()
+        delay = self.backoff.next(changed)
+        self._poll_timer = self.set_timer(delay, self.sync_batches)
+
+    def _sync_done(
+        self, changed_batches: Dict[str, Tuple[LocalBatchStatus, LocalBatchStatus]], errors: List[str], changed: bool
+    ) -> None:
+        self.sub_title = ""
+        self._schedule_poll(changed)
+        if changed_batches and (self.status_filter or self.sort_by == "status"):
+            # the filtered or sorted batches depend on the updated statuses
+            self.apply_query()
+        if errors:
+            self.push_screen(PopupScreen("Errors: " + "\n".join(errors)))
+        if changed_batches:
             self.push_screen(PopupScreen("Changed batches: " + "\n".join(
-                [f"{self._req_fmt(batch_id)}: {status_old.value} -> {status_new.value}" for batch_id, (status_old, status_new) in self.changed_batches.items()])))
+                [f"{self._req_fmt(batch_id)}: {status_old.value} -> {status_new.value}" for batch_id, (status_old, status_new) in changed_batches.items()])))
+
+    def _selected_batch_id(self) -> str:
+        table = self.data_table
+        return table.coordinate_to_cell_key(table.cursor_coordinate).row_key.value
 
-    def deleting_batch(self, batch_id: str, row_index: int, confirm: bool):
+    def deleting_batch(self, batch_id: str, confirm: bool):
         if confirm:
             try:
                 self.batcher.delete_batch(unique_id=batch_id)
                 self.push_screen(PopupScreen(f"Batch {self._req_fmt(batch_id)} deleted"))
-                self.table.del_row(row_index=row_index)
-                self.action_reload()
+                self.remove_row(batch_id)
             except Exception as e:
                 self.push_screen(PopupScreen(f"Failed to delete batch {self._req_fmt(batch_id)}:\n{e}"))
 
+    def _popup_from_thread(self, message: str) -> None:
+        self.call_from_thread(self.push_screen, PopupScreen(message))
+
+    @work(thread=True, group="actions")
     def cancelling_batch(self, batch_id: str, confirm: bool):
         if confirm:
             batch = self.batcher.load_batch(unique_id=batch_id)
             if isinstance(batch, UploadedBatch):
-                if batch.status.value == "cancelled":
-                    self.push_screen(PopupScreen(f"Batch {self._req_fmt(batch_id)} is already cancelled"))
+                if batch.status in (LocalBatchStatus.CANCELLING, LocalBatchStatus.CANCELLED):
+                    self._popup_from_thread(f"Batch {self._req_fmt(batch_id)} is already cancelled")
                 else:
                     try:
                         batch.cancel()
-                        self.push_screen(PopupScreen(f"Canceling of batch {self._req_fmt(batch_id)} confirmed"))
-                        self.action_reload()
+                        self.call_from_thread(self.update_row, batch.summary())
+                        self._popup_from_thread(f"Canceling of batch {self._req_fmt(batch_id)} confirmed")
                     except Exception as e:
-                        self.push_screen(PopupScreen(f"Failed to cancel batch {self._req_fmt(batch_id)}:\n{e}"))
+                        self._popup_from_thread(f"Failed to cancel batch {self._req_fmt(batch_id)}:\n{e}")
             else:
-                self.push_screen(PopupScreen(f"Batch {self._req_fmt(batch_id)} is not in a cancelable state"))
+                self._popup_from_thread(f"Batch {self._req_fmt(batch_id)} is not in a cancelable state")
 
     def action_cancel(self):
-        table = self.data_table
-        table.cursor_type = "row"
-        coord = table.cursor_coordinate.row
-        req_uid = table.get_row_at(coord)[0]
+        req_uid = self._selected_batch_id()
         self.push_screen(PopupScreen(f"Cancel request {self._req_fmt(req_uid)}?", action_confirm=True),
                          callback=partial(self.cancelling_batch, req_uid))
 
     def action_delete(self):
-        table = self.data_table
-        table.cursor_type = "row"
-        coord = table.cursor_coordinate.row
-        req_uid = table.get_row_at(coord)[0]
+        req_uid = self._selected_batch_id()
         self.push_screen(PopupScreen(f"[bold red]Delete[/bold red] request {self._req_fmt(req_uid)}? It [bold]won't[/bold] cancel/remove it on the provider, "
                                      "but it will remove it [bold]permanently[/bold] locally", action_confirm=True),
-                         callback=partial(self.deleting_batch, req_uid, coord))
+                         callback=partial(self.deleting_batch, req_uid))
 
     def action_print(self):
         provider_config_file_path = ProviderRegistry()._config_store.store_path
@@ -280,32 +470,33 @@ Button {
                                    f"* **Provider config file:** `{provider_config_file_path}`"))
 
     def action_reload(self):
-        self.data_table.loading = True
-        self.call_after_refresh(self.re_compute)
+        # Only the changed rows are updated, and the batches are synced in the background
+        if self.backoff is not None:
+            self.backoff.reset()
+        self.refresh_rows()
+        self.sync_batches()
 
+    @work(thread=True, group="actions")
     def downloading_batch(self, batch_id: str, confirm: bool):
         if confirm:
             batch = self.batcher.load_batch(unique_id=batch_id)
             if isinstance(batch, DownloadedBatch):
-                self.push_screen(PopupScreen(f"Batch {self._req_fmt(batch_id)} is already downloaded"))
+                self._popup_from_thread(f"Batch {self._req_fmt(batch_id)} is already downloaded")
             elif isinstance(batch, EditableBatch):
-                self.push_screen(PopupScreen(f"Batch {self._req_fmt(batch_id)} has not been uploaded yet"))
+                self._popup_from_thread(f"Batch {self._req_fmt(batch_id)} has not been uploaded yet")
             else:
                 try:
-                    batch.download()
-                    self.push_screen(PopupScreen(f"Downloading batch {self._req_fmt(batch_id)}"))
-                    self.action_reload()
+                    self._popup_from_thread(f"Downloading batch {self._req_fmt(batch_id)}")
+                    downloaded_batch = batch.download()
+                    self.call_from_thread(self.update_row, downloaded_batch.summary())
                 except Exception as e:
-                    self.push_screen(PopupScreen(f"Failed to download batch {self._req_fmt(batch_id)}:\n{e}"))
+                    self._popup_from_thread(f"Failed to download batch {self._req_fmt(batch_id)}:\n{e}")
 
     def action_download(self):
-        table = self.data_table
-        table.cursor_type = "row"
-        coord = table.cursor_coordinate.row
-        req_uid = table.get_row_at(coord)[0]
+        req_uid = self._selected_batch_id()
         self.push_screen(PopupScreen(f"Download request {self._req_fmt(req_uid)}?", action_confirm=True),
                          callback=partial(self.downloading_batch, req_uid))
 
     def action_quit(self):
         self.app.exit()
-        # self.push_screen(QuitScreen())
\ No newline at end of file
+        # self.push_screen(QuitScreen())
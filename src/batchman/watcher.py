@@ -0,0 +1,313 @@
+import heapq
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from .batch_interfaces import UploadedBatch
+from .models.batch import BatchSummary
+from .models.enums import FINAL_STATUSES, LocalBatchStatus
+from .models.progress import BatchProgress
+from .progress import ProgressTracker
+from .utils.backoff import Backoff
+from .utils.files import read_json, write_json
+from .utils.logging import logger
+from .utils.rate_limit import RateLimiter
+
+if TYPE_CHECKING:
+    from .batchman import Batcher
+    from .deadlines import DeadlineTracker
+    from .upload_scheduler import UploadScheduler
+
+
+# Statuses of the batches to poll
+WATCHED_STATUSES = (
+    LocalBatchStatus.VALIDATING, LocalBatchStatus.REGISTERED, LocalBatchStatus.IN_PROGRESS, LocalBatchStatus.CANCELLING,
+    LocalBatchStatus.COMPLETED,
+)
+
+
+class Watcher:
+    """Poll the in-flight batches of a Batcher on an adaptive schedule, and download them once completed.
+
+    Each batch is polled at its own interval: the interval grows exponentially from ``min_interval`` to
+    ``max_interval`` (so the batches which just started are polled less and less often), and is shortened
+    to half the estimated remaining time when the batch reports its progress (see ``ProgressTracker``),
+    so that it is polled more often near its expected completion.
+
+    The schedule is persisted in the batches directory, so a restarted watcher resumes it. The calls to
+    each provider are limited by ``rate_limits`` (calls per minute, by provider name).
+
+    Args:
+        batcher: The batcher whose batches are watched
+        min_interval: The minimum interval between two polls of a batch, in seconds
+        max_interval: The maximum interval between two polls of a batch, in seconds
+        sync_workers: The maximum number of batches synced concurrently
+        download_workers: The maximum number of batches downloaded concurrently
+        rate_limits: The maximum number of calls per minute to each provider, by provider name
+        default_rate_limit: The maximum number of calls per minute to the providers not in rate_limits
+            (None for no limit)
+        scheduler: Upload scheduler whose queued batches are admitted as the watched batches finish
+        deadlines: Deadline tracker checking the watched batches after each poll, the batches at risk are logged
+    """
+
+    def __init__(
+        self,
+        batcher: "Batcher",
+        min_interval: float = 30.0,
+        max_interval: float = 1800.0,
+        sync_workers: int = 4,
+        download_workers: int = 4,
+        rate_limits: Optional[Dict[str, float]] = None,
+        default_rate_limit: Optional[float] = 60.0,
+        scheduler: Optional["UploadScheduler"] = None,
+        deadlines: Optional["DeadlineTracker"] = None,
+    ) -> None:
+        self.batcher = batcher
+        self.scheduler = scheduler
+        self.deadlines = deadlines
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.sync_workers = sync_workers
+        self.path = batcher.batches_dir / ".watch" / "schedule.json"
+        self.rate_limits = rate_limits or {}
+        self.default_rate_limit = default_rate_limit
+        self.tracker = ProgressTracker(window=self.max_interval * 2)
+
+        # unique_id -> {"next_poll", "interval", "provider", "observed_at", "done"}
+        self.schedule: Dict[str, Dict[str, Any]] = self._load()
+        # (next_poll, unique_id), rebuilt on each refresh
+        self._heap: List[Tuple[float, str]] = []
+        self._limiters: Dict[str, RateLimiter] = {}
+        self._downloader = ThreadPoolExecutor(max_workers=download_workers)
+        self._downloads: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._errors: List[str] = []
+
+        for unique_id, entry in self.schedule.items():
+            if entry.get("observed_at") is not None:
+                self.tracker.observe(unique_id, BatchProgress(entry["done"], 0, entry["done"]), now=entry["observed_at"])
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            return read_json(self.path)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            logger.warning(f"Could not read the watch schedule {self.path}, starting a new one: {e}")
+            return {}
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.tmp-{os.getpid()}")
+        write_json(tmp_path, self.schedule)
+        os.replace(tmp_path, self.path)
+
+    def _limiter(self, provider: Optional[str]) -> Optional[RateLimiter]:
+        key = provider or ""
+        per_minute = self.rate_limits.get(key, self.default_rate_limit)
+        if per_minute is None:
+            return None
+        if key not in self._limiters:
+            self._limiters[key] = RateLimiter(per_minute)
+        return self._limiters[key]
+
+    def refresh(self, now: Optional[float] = None) -> List[str]:
+        """Add the new in-flight batches to the schedule, and remove the batches not in flight anymore.
+
+        Returns:
+            List of errors that occurred while reading the batches
+        """
+        now = time.time() if now is None else now
+        summaries, errors = self.batcher.batch_summaries(list(WATCHED_STATUSES))
+        watched = {summary.unique_id: summary for summary in summaries}
+        with self._lock:
+            downloading = set(self._downloads)
+        for unique_id in list(self.schedule):
+            if unique_id not in watched or unique_id in downloading:
+                del self.schedule[unique_id]
+                self.tracker.forget(unique_id)
+        for unique_id, summary in watched.items():
+            if unique_id in downloading:
+                continue
+            if summary.status == LocalBatchStatus.COMPLETED:
+                # completed at the last sync (e.g. by another process), not downloaded yet
+                self._download(summary)
+            elif unique_id not in self.schedule:
+                self.schedule[unique_id] = {
+                    "next_poll": now, "interval": self.min_interval, "provider": summary.provider,
+                    "observed_at": None, "done": None,
+                }
+        self._heap = [(entry["next_poll"], unique_id) for unique_id, entry in self.schedule.items()]
+        heapq.heapify(self._heap)
+        return errors
+
+    def _next_interval(self, unique_id: str, progress: Optional[BatchProgress], now: float) -> float:
+        backoff = Backoff(self.min_interval, self.max_interval, jitter=0.1)
+        backoff.interval = self.schedule[unique_id]["interval"]
+        interval = backoff.next(changed=False)
+        eta = self.tracker.eta(unique_id, progress, now)
+        if eta is not None:
+            interval = min(interval, max(self.min_interval, (eta.timestamp() - now) / 2))
+        return interval
+
+    def _sync(self, unique_id: str) -> BatchSummary:
+        batch = self.batcher.load_batch(unique_id)
+        if not isinstance(batch, UploadedBatch):
+            return batch.summary()
+        batch.sync()
+        return batch.summary()
+
+    def _download_batch(self, summary: BatchSummary) -> None:
+        limiter = self._limiter(summary.provider)
+        if limiter is not None:
+            limiter.acquire()
+        batch = self.batcher.load_batch(summary.unique_id)
+        if isinstance(batch, UploadedBatch) and batch.has_results:
+            batch.download(sync=False)
+            logger.info(f"Batch {summary.name}:{summary.unique_id} downloaded")
+
+    def _download_done(self, unique_id: str, future: Future) -> None:
+        with self._lock:
+            self._downloads.pop(unique_id, None)
+            if future.exception() is not None:
+                self._errors.append(f"Error downloading batch {unique_id}: {future.exception()}")
+
+    def _download(self, summary: BatchSummary) -> None:
+        with self._lock:
+            if summary.unique_id in self._downloads:
+                return
+            future = self._downloader.submit(self._download_batch, summary)
+            self._downloads[summary.unique_id] = future
+        future.add_done_callback(lambda f: self._download_done(summary.unique_id, f))
+
+    def poll(self, now: Optional[float] = None) -> List[str]:
+        """Sync the batches due for polling, schedule their next poll, and start the downloads of the completed ones.
+
+        Returns:
+            List of errors that occurred while syncing and downloading the batches since the last poll
+        """
+        now = time.time() if now is None else now
+        errors = self.refresh(now)
+
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, unique_id = heapq.heappop(self._heap)
+            wait = 0.0
+            limiter = self._limiter(self.schedule[unique_id]["provider"])
+            if limiter is not None:
+                wait = limiter.try_acquire()
+            if wait:
+                # rate limited: retried as soon as the provider accepts calls again
+                self.schedule[unique_id]["next_poll"] = now + wait
+            else:
+                due.append(unique_id)
+
+        if due:
+            with ThreadPoolExecutor(max_workers=self.sync_workers) as executor:
+                futures = [(unique_id, executor.submit(self._sync, unique_id)) for unique_id in due]
+                for unique_id, future in futures:
+                    entry = self.schedule[unique_id]
+                    try:
+                        summary = future.result()
+                    except Exception as e:
+                        errors.append(f"Error syncing batch {unique_id}: {e}")
+                        entry["interval"] = self._next_interval(unique_id, None, now)
+                        entry["next_poll"] = now + entry["interval"]
+                        continue
+                    if summary.status in (LocalBatchStatus.COMPLETED, LocalBatchStatus.FAILED, LocalBatchStatus.CANCELLED):
+                        del self.schedule[unique_id]
+                        self.tracker.forget(unique_id)
+                        # the failed and cancelled batches are downloaded if they have partial results
+                        self._download(summary)
+                    elif summary.status in FINAL_STATUSES or summary.status == LocalBatchStatus.INITIALIZING:
+                        del self.schedule[unique_id]
+                        self.tracker.forget(unique_id)
+                    else:
+                        if summary.progress is not None:
+                            self.tracker.observe(unique_id, summary.progress, now)
+                            entry["observed_at"], entry["done"] = now, summary.progress.done
+                        entry["interval"] = self._next_interval(unique_id, summary.progress, now)
+                        entry["next_poll"] = now + entry["interval"]
+
+        if self.deadlines is not None and due:
+            # the resubmitted batches are watched from the next refresh
+            statuses, deadline_errors = self.deadlines.check(now)
+            errors.extend(deadline_errors)
+            for status in statuses:
+                if status.at_risk:
+                    logger.warning(status.describe())
+
+        if self.scheduler is not None and self.scheduler.queue:
+            # the batches which just finished leave room for the queued ones
+            uploaded, admit_errors = self.scheduler.admit()
+            errors.extend(admit_errors)
+            for batch in uploaded:
+                if not isinstance(batch, UploadedBatch):
+                    # answered from the result cache
+                    continue
+                self.schedule[batch.unique_id] = {
+                    "next_poll": now + self.min_interval, "interval": self.min_interval,
+                    "provider": batch.params.provider.get("name"), "observed_at": None, "done": None,
+                }
+
+        self._heap = [(entry["next_poll"], unique_id) for unique_id, entry in self.schedule.items()]
+        heapq.heapify(self._heap)
+        self._save()
+
+        with self._lock:
+            errors.extend(self._errors)
+            self._errors = []
+        return errors
+
+    def next_poll(self) -> Optional[float]:
+        """Return the time of the next due poll, or None if no batch is watched."""
+        return self._heap[0][0] if self._heap else None
+
+    def wait_downloads(self) -> None:
+        """Wait for the running downloads to complete."""
+        with self._lock:
+            futures = list(self._downloads.values())
+        for future in futures:
+            try:
+                future.result()
+            except Exception:
+                # reported by poll
+                pass
+
+    def run(self, stop: Optional[threading.Event] = None, once: bool = False) -> List[str]:
+        """Watch the batches until stopped (or until no batch is in flight if once is set).
+
+        The errors are logged as they occur.
+
+        Args:
+            stop: Event stopping the watcher when set
+            once: Whether to return when all the batches are downloaded or in a final state (and no batch is
+                queued in the upload scheduler)
+
+        Returns:
+            List of the errors of the last poll
+        """
+        stop = stop or threading.Event()
+        errors: List[str] = []
+        try:
+            while not stop.is_set():
+                errors = self.poll()
+                next_poll = self.next_poll()
+                done = once and next_poll is None and not (self.scheduler is not None and self.scheduler.queue)
+                if done:
+                    self.wait_downloads()
+                    with self._lock:
+                        errors.extend(self._errors)
+                        self._errors = []
+                for error in errors:
+                    logger.error(error)
+                if done:
+                    break
+                # new batches are looked for at least every min_interval
+                delay = self.min_interval if next_poll is None else min(self.min_interval, next_poll - time.time())
+                stop.wait(max(0.0, delay))
+        finally:
+            self._downloader.shutdown(wait=True)
+        return errors
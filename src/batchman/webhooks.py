@@ -0,0 +1,284 @@
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+import urllib.request
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Protocol, Tuple
+
+from .batch_interfaces import UploadedBatch
+from .utils.logging import logger
+
+if TYPE_CHECKING:
+    from .batchman import Batcher
+
+
+# Batch events sent by OpenAI, and the status of the batch they report
+BATCH_EVENTS = {
+    "batch.completed": "completed",
+    "batch.failed": "failed",
+    "batch.expired": "expired",
+    "batch.cancelled": "cancelled",
+}
+
+# Maximum age of a webhook, in seconds, to prevent replays
+SIGNATURE_TOLERANCE = 300
+
+
+class WebhookVerificationError(ValueError):
+    """Raised when the signature of a webhook is invalid."""
+
+
+class Headers(Protocol):
+    """Headers of a webhook request, e.g. a dict or the case-insensitive headers of ``http.server``."""
+
+    def get(self, name: str, /) -> Optional[str]: ...
+
+
+def _secret_key(secret: str) -> bytes:
+    # Standard Webhooks secrets are base64 encoded, with a "whsec_" prefix
+    if secret.startswith("whsec_"):
+        return base64.b64decode(secret[len("whsec_"):])
+    return secret.encode()
+
+
+def sign_payload(secret: str, webhook_id: str, timestamp: int, body: bytes) -> str:
+    """Return the signature header of a webhook, following the Standard Webhooks specification."""
+    signed = f"{webhook_id}.{timestamp}.".encode() + body
+    digest = hmac.new(_secret_key(secret), signed, hashlib.sha256).digest()
+    return "v1," + base64.b64encode(digest).decode()
+
+
+def verify_signature(
+    secret: str, headers: Headers, body: bytes, tolerance: float = SIGNATURE_TOLERANCE, now: Optional[float] = None
+) -> None:
+    """Verify the signature of a webhook, following the Standard Webhooks specification used by OpenAI.
+
+    Args:
+        secret: The webhook signing secret
+        headers: The headers of the webhook request (webhook-id, webhook-timestamp and webhook-signature)
+        body: The raw body of the webhook request
+        tolerance: The maximum difference between the webhook timestamp and now, in seconds
+
+    Raises:
+        WebhookVerificationError: If the headers are missing, the timestamp is too old or the signature is invalid
+    """
+    webhook_id = headers.get("webhook-id")
+    timestamp = headers.get("webhook-timestamp")
+    signatures = headers.get("webhook-signature")
+    if not webhook_id or not timestamp or not signatures:
+        raise WebhookVerificationError("Missing webhook headers")
+    try:
+        timestamp_value = int(timestamp)
+    except ValueError:
+        raise WebhookVerificationError(f"Invalid webhook timestamp: {timestamp}")
+    now = time.time() if now is None else now
+    if abs(now - timestamp_value) > tolerance:
+        raise WebhookVerificationError("Webhook timestamp out of the tolerance window")
+
+    expected = sign_payload(secret, webhook_id, timestamp_value, body)
+    # several space separated signatures can be sent, e.g. during a secret rotation
+    if not any(hmac.compare_digest(expected, signature) for signature in signatures.split(" ")):
+        raise WebhookVerificationError("Invalid webhook signature")
+
+
+def post_event(
+    url: str, secret: str, event_type: str, remote_id: str, timeout: float = 10.0
+) -> Tuple[int, Dict[str, Any]]:
+    """Post a signed sample batch event, like the ones sent by OpenAI, e.g. to test a ``WebhookReceiver``.
+
+    Returns:
+        The response status code, and the JSON response
+    """
+    webhook_id = f"wh_{uuid.uuid4().hex}"
+    timestamp = int(time.time())
+    body = json.dumps({
+        "object": "event",
+        "id": f"evt_{uuid.uuid4().hex}",
+        "type": event_type,
+        "created_at": timestamp,
+        "data": {"id": remote_id},
+    }).encode()
+    request = urllib.request.Request(url, data=body, method="POST", headers={
+        "Content-Type": "application/json",
+        "webhook-id": webhook_id,
+        "webhook-timestamp": str(timestamp),
+        "webhook-signature": sign_payload(secret, webhook_id, timestamp, body),
+    })
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.status, json.loads(response.read() or b"{}")
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    server: "_WebhookServer"
+
+    def _respond(self, status: int, content: Dict[str, Any]) -> None:
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self) -> None:
+        receiver = self.server.receiver
+        if self.path != receiver.path:
+            self._respond(404, {"error": "not found"})
+            return
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        try:
+            verify_signature(receiver.secret, self.headers, body)
+            event = json.loads(body)
+            if not isinstance(event, dict):
+                raise ValueError("expected a JSON object")
+        except WebhookVerificationError as e:
+            self._respond(401, {"error": str(e)})
+            return
+        except ValueError as e:
+            self._respond(400, {"error": f"Invalid event: {e}"})
+            return
+        # answered right away, the batch is synced and downloaded in the background
+        self._respond(200, {"status": receiver.receive(self.headers["webhook-id"], event)})
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug("[Webhooks] " + format % args)
+
+
+class _WebhookServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], receiver: "WebhookReceiver") -> None:
+        self.receiver = receiver
+        super().__init__(address, _WebhookHandler)
+
+
+class WebhookReceiver:
+    """Local HTTP receiver of the batch webhooks, to download the batches as soon as they are finished.
+
+    The signature of each event is verified (see ``verify_signature``), and the event is mapped to the
+    local batch by remote_id. The batch is then synced, which saves its remote state, and downloaded if
+    completed (or expired or cancelled with partial results, see ``UploadedBatch.has_results``), in the
+    background. Polling (e.g. ``batchman watch``) remains the fallback for missed events.
+
+    Args:
+        batcher: The batcher whose batches are updated
+        secret: The webhook signing secret
+        host: The host to listen on
+        port: The port to listen on (0 for a free port, see ``url``)
+        path: The path of the webhook endpoint
+        workers: The maximum number of batches synced and downloaded concurrently
+    """
+
+    def __init__(
+        self,
+        batcher: "Batcher",
+        secret: str,
+        host: str = "127.0.0.1",
+        port: int = 8000,
+        path: str = "/webhooks",
+        workers: int = 4,
+    ) -> None:
+        self.batcher = batcher
+        self.secret = secret
+        self.path = path
+        self._server = _WebhookServer((host, port), self)
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # ids of the last received webhooks, as they can be delivered more than once
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self._remote_ids: Dict[str, str] = {}
+        self._pending: List[Future] = []
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        if isinstance(host, bytes):
+            host = host.decode()
+        return f"http://{host}:{port}{self.path}"
+
+    def _find_batch(self, remote_id: str) -> Optional[str]:
+        with self._lock:
+            unique_id = self._remote_ids.get(remote_id)
+        if unique_id is None:
+            summaries, _ = self.batcher.batch_summaries()
+            with self._lock:
+                self._remote_ids = {summary.remote_id: summary.unique_id for summary in summaries if summary.remote_id}
+                unique_id = self._remote_ids.get(remote_id)
+        return unique_id
+
+    def receive(self, webhook_id: str, event: Dict[str, Any]) -> str:
+        """Handle a verified event, returning what was done with it ("accepted", "duplicate" or "ignored")."""
+        # the webhook id is reserved before handling, as the deliveries of a webhook can be concurrent
+        with self._lock:
+            if webhook_id in self._seen:
+                return "duplicate"
+            self._seen[webhook_id] = None
+            if len(self._seen) > 10_000:
+                self._seen.popitem(last=False)
+
+        if event.get("type") not in BATCH_EVENTS:
+            return "ignored"
+        try:
+            remote_id = (event.get("data") or {}).get("id")
+            unique_id = self._find_batch(remote_id) if remote_id else None
+            if unique_id is None:
+                # handled if redelivered, e.g. when the batch is listed by then
+                self._forget(webhook_id)
+                logger.info(f"[Webhooks] Ignoring {event['type']} event of unknown batch {remote_id}")
+                return "ignored"
+            future = self._executor.submit(self._update_batch, webhook_id, unique_id, event["type"])
+        except Exception:
+            self._forget(webhook_id)
+            raise
+        with self._lock:
+            self._pending = [pending for pending in self._pending if not pending.done()] + [future]
+        return "accepted"
+
+    def _forget(self, webhook_id: str) -> None:
+        with self._lock:
+            self._seen.pop(webhook_id, None)
+
+    def _update_batch(self, webhook_id: str, unique_id: str, event_type: str) -> None:
+        try:
+            batch = self.batcher.load_batch(unique_id)
+            if not isinstance(batch, UploadedBatch):
+                return
+            # the event only has the remote id of the batch, its full state comes from the provider
+            self.batcher._sync_batch(batch)
+            logger.info(f"[Webhooks] Batch {unique_id} updated from {event_type} event: {batch.status.value}")
+        except Exception as e:
+            # handled again if redelivered
+            self._forget(webhook_id)
+            logger.error(f"[Webhooks] Error updating batch {unique_id} from {event_type} event: {e}")
+
+    def wait_idle(self) -> None:
+        """Wait for the batches of the received events to be synced and downloaded."""
+        with self._lock:
+            pending = list(self._pending)
+        for future in pending:
+            future.result()
+
+    def serve_forever(self) -> None:
+        try:
+            self._server.serve_forever()
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def start(self) -> "WebhookReceiver":
+        """Serve in a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, name="batchman-webhooks", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+        self._executor.shutdown(wait=True)
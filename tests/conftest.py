@@ -0,0 +1,98 @@
+import uuid
+from typing import Any, Dict
+
+import pytest
+from pydantic_core import to_jsonable_python
+
+from batchman import Batcher
+from batchman.models import LocalBatchStatus, Result
+from batchman.models.content import expand_content
+from batchman.providers.base import Provider
+from batchman.providers.registry import ProviderRegistry
+from batchman.utils import read_jsonl
+
+
+class DummyProvider(Provider):
+    """Offline provider answering each request with its last user message, in the OpenAI format.
+
+    Batches are in progress right after upload, and completed on the first sync.
+    """
+
+    name = "dummy"
+
+    def validate_request(self, local_request) -> None:
+        if not local_request.model:
+            raise ValueError("Model is required")
+
+    def _prepare_request(self, request, blobs=None) -> Dict[str, Any]:
+        body = to_jsonable_python(request.model_dump())
+        body["messages"] = [{**message, "content": expand_content(message["content"], blobs)} for message in body["messages"]]
+        return {"custom_id": request.custom_id, "body": body}
+
+    def upload_batch(self, local_batch) -> str:
+        remote_requests = [self._prepare_request(request, local_batch.batcher.content_blobs) for request in local_batch._requests_to_upload()]
+        local_batch._save_remote_requests(remote_requests)
+        remote_id = "dummy-" + str(uuid.uuid4())
+        local_batch._save_remote_state(
+            {"id": remote_id, "status": "in_progress", "request_counts": {"total": len(remote_requests), "completed": 0, "failed": 0}}
+        )
+        return remote_id
+
+    def cancel_batch(self, local_batch) -> None:
+        local_batch._save_remote_state({**local_batch._remote_state, "status": "cancelled"})
+
+    def sync_batch(self, local_batch) -> None:
+        state = local_batch._remote_state
+        if state["status"] == "in_progress":
+            total = state["request_counts"]["total"]
+            state = {**state, "status": "completed", "request_counts": {"total": total, "completed": total, "failed": 0}}
+        local_batch._save_remote_state(state)
+
+    def download_batch_results(self, local_batch) -> None:
+        results = []
+        for line in read_jsonl(local_batch._files.remote_requests):
+            body = line["body"]
+            content = body["messages"][-1]["content"]
+            results.append({
+                "custom_id": line["custom_id"],
+                "response": {"body": {
+                    "choices": [{"message": {"content": f"echo: {content}", "role": "assistant"}, "finish_reason": "stop", "index": 0}],
+                    "usage": {"prompt_tokens": len(str(content)), "completion_tokens": 3, "total_tokens": len(str(content)) + 3},
+                }},
+            })
+        local_batch._save_remote_results(results)
+
+    def convert_batch_status(self, provider_state: Dict[str, Any]) -> LocalBatchStatus:
+        return LocalBatchStatus(provider_state["status"])
+
+    def convert_batch_result(self, provider_result: Dict[str, Any]) -> Result:
+        body = provider_result["response"]["body"]
+        if "error" in body:
+            return Result(custom_id=provider_result["custom_id"], choices=[], error=str(body["error"]))
+        return Result(custom_id=provider_result["custom_id"], choices=body["choices"], usage=body["usage"])
+
+
+ProviderRegistry.register(DummyProvider)
+
+
+class SlowDummyProvider(DummyProvider):
+    """Dummy provider completing one request per sync."""
+
+    name = "slow_dummy"
+
+    def sync_batch(self, local_batch) -> None:
+        state = local_batch._remote_state
+        counts = state["request_counts"]
+        if state["status"] == "in_progress":
+            completed = counts["completed"] + 1
+            status = "completed" if completed == counts["total"] else "in_progress"
+            state = {**state, "status": status, "request_counts": {**counts, "completed": completed}}
+        local_batch._save_remote_state(state)
+
+
+ProviderRegistry.register(SlowDummyProvider)
+
+
+@pytest.fixture
+def dummy_batcher(tmp_path) -> Batcher:
+    return Batcher(batches_dir=tmp_path / "dummy_batches")
@@ -59,7 +59,7 @@ assert anthropic_batch.processing_status == "canceling" or anthropic_batch.proce
 
 uploaded_batch.sync()
 
-assert uploaded_batch.status == LocalBatchStatus.CANCELLED
+assert uploaded_batch.status in (LocalBatchStatus.CANCELLING, LocalBatchStatus.CANCELLED)
 
 test_batcher._rm_batch_dir(im_sure_to_delete_all_batches=True)
 
@@ -0,0 +1,54 @@
+from batchman import Batcher, Request, UserMessage
+from batchman.batch_index import query_summaries
+from batchman.models.batch import Batch
+from batchman.models.enums import LocalBatchStatus
+
+
+def test_summaries_are_reused(dummy_batcher: Batcher, monkeypatch):
+    first = dummy_batcher.create_batch(name="first")
+    second = dummy_batcher.create_batch(name="second", provider="dummy")
+    summaries, errors = dummy_batcher.index.summaries()
+    assert not errors
+    assert {summary.unique_id for summary in summaries} == {first.unique_id, second.unique_id}
+    assert dummy_batcher.index.path.exists()
+
+    # unchanged batches are not read again
+    loaded = []
+    original_from_directory = Batch.from_directory.__func__
+
+    def from_directory(cls, batcher, directory):
+        loaded.append(directory.name)
+        return original_from_directory(cls, batcher, directory)
+
+    monkeypatch.setattr(Batch, "from_directory", classmethod(from_directory))
+    dummy_batcher.index.summaries()
+    assert loaded == []
+
+    # a modified batch is recomputed
+    second.override_request_params(model="model")
+    second.add_requests(Request([UserMessage("prompt")], custom_id="req"))
+    uploaded = second.upload()
+    loaded.clear()
+    summaries, _ = dummy_batcher.index.summaries()
+    assert loaded == [second.directory.name]
+    by_id = {summary.unique_id: summary for summary in summaries}
+    assert by_id[uploaded.unique_id].status == LocalBatchStatus.IN_PROGRESS
+
+    # a deleted batch is dropped
+    dummy_batcher.delete_batch(first.unique_id)
+    summaries, _ = dummy_batcher.index.summaries()
+    assert [summary.unique_id for summary in summaries] == [second.unique_id]
+
+
+def test_query_summaries(dummy_batcher: Batcher):
+    batches = [dummy_batcher.create_batch(name=name) for name in ("alpha", "beta", "gamma")]
+    batches[1].set_provider("dummy")
+    summaries, _ = dummy_batcher.batch_summaries()
+
+    assert [s.name for s in query_summaries(summaries)] == ["gamma", "beta", "alpha"]
+    assert [s.name for s in query_summaries(summaries, sort_by="name", descending=False)] == ["alpha", "beta", "gamma"]
+    assert [s.name for s in query_summaries(summaries, providers=["dummy"])] == ["beta"]
+    assert [s.name for s in query_summaries(summaries, providers=[None], sort_by="name")] == ["gamma", "alpha"]
+    assert [s.name for s in query_summaries(summaries, search="AMM")] == ["gamma"]
+    assert [s.name for s in query_summaries(summaries, search=batches[0].unique_id)] == ["alpha"]
+    assert query_summaries(summaries, statuses=[LocalBatchStatus.DOWNLOADED]) == []
@@ -75,3 +75,124 @@ def test_list_batches(batcher_test: Batcher):
     assert len(uploaded_batches) == 0
     assert len(downloaded_batches) == 0
     assert len(errors) == 0
+
+
+def test_request_table(batcher_test: Batcher):
+    batch = batcher_test.create_batch(name="test-batch")
+    batch.add_requests(
+        [
+            Request([UserMessage(content=f"Test prompt {i % 3}")], custom_id=f"req-{i}", max_tokens=10 * i)
+            for i in range(6)
+        ]
+    )
+    batch.override_request_params(system_prompt="Shared system prompt", model="test-model")
+
+    table = batch.request_table
+    assert len(table) == 6
+    # identical messages and the system prompt are stored once
+    assert len(table._columns.messages_pool) == 3
+    assert table[4].messages[0].content == "Test prompt 1"
+    assert table[4].system_prompt == "Shared system prompt"
+    assert table[4].max_tokens == 40
+    assert table[4].to_request() == batch.requests[4]
+    assert table.to_requests() == batch.requests
+
+    assert table[1:3].custom_ids == ["req-1", "req-2"]
+    filtered = table.filter(lambda row: row.max_tokens >= 30)
+    assert filtered.custom_ids == ["req-3", "req-4", "req-5"]
+    assert filtered[-1].custom_id == "req-5"
+    assert [shard.custom_ids for shard in filtered.shards(2)] == [["req-3", "req-4"], ["req-5"]]
+
+    batch_copy = batcher_test.create_batch(name="test-batch-copy")
+    batch_copy.add_requests(filtered)
+    assert [request.custom_id for request in batch_copy.requests] == ["req-3", "req-4", "req-5"]
+
+
+def test_copy_shares_requests(batcher_test: Batcher):
+    batch = batcher_test.create_batch(name="test-batch")
+    batch.add_requests([Request([UserMessage(content=f"Test prompt {i}")], custom_id=f"req-{i}") for i in range(3)])
+    assert batch.get_request("req-1").custom_id == "req-1"
+
+    copies = [batch.copy(f"copy-{i}") for i in range(3)]
+    for copy in copies:
+        assert copy._files.requests.samefile(batch._files.requests)
+        assert copy.requests == batch.requests
+    assert batch._files.requests.stat().st_nlink == 5  # the batch, its 3 copies and the blob
+
+    # Appending to a copy does not change the other batches
+    copies[0].add_requests(Request([UserMessage(content="Only in the copy")], custom_id="req-copy"))
+    assert len(copies[0].requests) == 4
+    assert copies[0].get_request("req-copy").custom_id == "req-copy"
+    assert len(batch.requests) == 3
+    with pytest.raises(KeyError):
+        batch.get_request("req-copy")
+    assert copies[1].copy()._files.requests.samefile(batch._files.requests)
+
+    # The blob is removed with its last user
+    blob = batcher_test.blobs.path(batch._share_requests())
+    editable_batches = batcher_test.list_batches()[0]
+    assert len(editable_batches) == 5
+    # the first copy does not share the blob anymore, it is deleted first
+    editable_batches.sort(key=lambda editable_batch: editable_batch.unique_id != copies[0].unique_id)
+    for editable_batch in editable_batches:
+        assert blob.exists()
+        batcher_test.delete_batch(editable_batch.unique_id)
+    assert not blob.exists()
+    assert batcher_test.list_batches()[3] == []
+
+
+def test_fan_out(dummy_batcher: Batcher):
+    batch = dummy_batcher.create_batch(name="fan-out", provider="dummy")
+    batch.add_requests([Request([UserMessage(content=f"Test prompt {i}")], custom_id=f"req-{i}") for i in range(3)])
+    batch.override_request_params(temperature=0.5)
+
+    derived = batch.fan_out(models=["model-a", "model-b"], params_grid={"max_tokens": [10, 20], "top_p": [0.9]})
+    assert len(derived) == 4
+    assert [(b.global_request_params["model"], b.global_request_params["max_tokens"]) for b in derived] == [
+        ("model-a", 10), ("model-a", 20), ("model-b", 10), ("model-b", 20)
+    ]
+    for derived_batch in derived:
+        assert derived_batch.params.parent_id == batch.unique_id
+        assert derived_batch.params.provider == batch.params.provider
+        assert derived_batch.global_request_params["temperature"] == 0.5
+        assert derived_batch._files.requests.samefile(batch._files.requests)
+
+    uploaded, errors = dummy_batcher.upload_batches(derived + [dummy_batcher.create_batch(name="no-provider")])
+    assert len(uploaded) == 4
+    assert len(errors) == 1
+    assert {b.request_table[0].model for b in uploaded} == {"model-a", "model-b"}
+
+
+def test_shared_prefixes():
+    from batchman.models.dataclasses import AssistantMessage
+    from batchman.models.request_table import RequestTable, SharedPrefix
+    from batchman.providers.anthropic import AnthropicProvider
+
+    def conversation(*contents, system_prompt="Shared system prompt", custom_id):
+        messages = [
+            UserMessage(content) if i % 2 == 0 else AssistantMessage(content) for i, content in enumerate(contents)
+        ]
+        return Request(messages, custom_id=custom_id, system_prompt=system_prompt, model="model", max_tokens=10)
+
+    table = RequestTable.from_requests([
+        conversation("document", "summary", "question 1", custom_id="a"),
+        conversation("other", custom_id="b"),
+        conversation("document", "summary", "question 2", custom_id="c"),
+        conversation("document", custom_id="d", system_prompt="Other system prompt"),
+    ])
+    assert table.shared_prefixes() == [
+        SharedPrefix(system_prompt=True, messages=2),
+        SharedPrefix(system_prompt=True, messages=0),
+        SharedPrefix(system_prompt=True, messages=2),
+        SharedPrefix(system_prompt=False, messages=0),
+    ]
+    ordered = table.by_shared_prefix().custom_ids
+    assert abs(ordered.index("a") - ordered.index("c")) == 1
+
+    provider = AnthropicProvider.__new__(AnthropicProvider)
+    params = provider._prepare_request(table[0], shared_prefix=table.shared_prefixes()[0])["params"]
+    assert params["system"] == [{"type": "text", "text": "Shared system prompt", "cache_control": {"type": "ephemeral"}}]
+    assert params["messages"][1]["content"] == [{"type": "text", "text": "summary", "cache_control": {"type": "ephemeral"}}]
+    assert params["messages"][2]["content"] == "question 1"
+    params = provider._prepare_request(table[3], shared_prefix=table.shared_prefixes()[3])["params"]
+    assert params["system"] == "Other system prompt"
@@ -0,0 +1,62 @@
+import json
+
+from click.testing import CliRunner
+
+from batchman import Batcher, Request, UserMessage
+from batchman.cli import cli
+from batchman.models import LocalBatchStatus
+
+
+def _uploaded_batch(batcher: Batcher, name: str):
+    batch = batcher.create_batch(name=name, provider="dummy")
+    batch.override_request_params(model="model")
+    batch.add_requests([Request([UserMessage(f"prompt {i}")], custom_id=f"req-{i}") for i in range(2)])
+    return batch.upload()
+
+
+def test_ls_sync_download(dummy_batcher: Batcher):
+    runner = CliRunner()
+    directory = str(dummy_batcher.batches_dir)
+    editable = dummy_batcher.create_batch(name="editable")
+    first = _uploaded_batch(dummy_batcher, "first")
+    second = _uploaded_batch(dummy_batcher, "second")
+
+    result = runner.invoke(cli, ["--dir", directory, "ls", "--json", "--status", "in_progress"])
+    assert result.exit_code == 0, result.output
+    listed = json.loads(result.output)
+    assert sorted(batch["unique_id"] for batch in listed) == sorted([first.unique_id, second.unique_id])
+    assert listed[0]["provider"] == "dummy" and listed[0]["status"] == "in_progress"
+
+    result = runner.invoke(cli, ["--dir", directory, "ls"])
+    assert result.exit_code == 0, result.output
+    assert len(result.output.splitlines()) == 3
+    assert f"{editable.unique_id}\teditable\tinitializing\tN/A\tN/A" in result.output.splitlines()
+
+    # syncing a single batch: the dummy provider completes it
+    first.sync()
+    result = runner.invoke(cli, ["--dir", directory, "download", "--all", "--parallel", "4"])
+    assert result.exit_code == 0, result.output
+    assert result.output.split() == [first.unique_id]
+    assert dummy_batcher.load_batch(first.unique_id).status == LocalBatchStatus.DOWNLOADED
+
+    result = runner.invoke(cli, ["--dir", directory, "sync", "--parallel", "4"])
+    assert result.exit_code == 0, result.output
+    assert dummy_batcher.load_batch(second.unique_id).status == LocalBatchStatus.DOWNLOADED
+
+    result = runner.invoke(cli, ["--dir", directory, "download", editable.unique_id])
+    assert result.exit_code == 1
+    assert "not been uploaded" in result.output
+
+    result = runner.invoke(cli, ["--dir", directory, "download"])
+    assert result.exit_code == 2
+
+
+def test_watch_once(dummy_batcher: Batcher):
+    runner = CliRunner()
+    uploaded = _uploaded_batch(dummy_batcher, "watched")
+    result = runner.invoke(cli, ["--dir", str(dummy_batcher.batches_dir), "watch", "--once", "--rate-limit", "dummy=600"])
+    assert result.exit_code == 0, result.output
+    assert dummy_batcher.load_batch(uploaded.unique_id).status == LocalBatchStatus.DOWNLOADED
+
+    result = runner.invoke(cli, ["--dir", str(dummy_batcher.batches_dir), "watch", "--rate-limit", "dummy"])
+    assert result.exit_code == 2
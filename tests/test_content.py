@@ -0,0 +1,68 @@
+import base64
+
+from batchman import Batcher, Request, UserMessage
+from batchman.models.content import CONTENT_BLOB_MIN_SIZE, expand_content
+from batchman.models.dataclasses import BlobContent, ImageContent, TextContent
+from batchman.utils import read_jsonl
+
+
+def test_content_interned_and_expanded(dummy_batcher: Batcher, tmp_path):
+    image_path = tmp_path / "image.png"
+    image_path.write_bytes(b"\x89PNG fake image")
+    document = "shared document " * CONTENT_BLOB_MIN_SIZE
+
+    batch = dummy_batcher.create_batch(name="content", provider="dummy")
+    batch.override_request_params(model="model")
+    batch.add_requests([
+        Request([UserMessage(document)], custom_id="text"),
+        Request([UserMessage([TextContent(document), TextContent("short"), ImageContent(str(image_path))])], custom_id="parts"),
+        Request([UserMessage([ImageContent("https://example.com/image.png")])], custom_id="remote"),
+    ], intern_content=True)
+
+    # the document is stored once, the requests only hold references
+    assert batch._files.requests.stat().st_size < len(document)
+    assert len(list(dummy_batcher.content_blobs.directory.glob("*/*"))) == 2
+    text_request = batch.get_request("text")
+    assert isinstance(text_request.messages[0].content, BlobContent)
+    parts = batch.get_request("parts").messages[0].content
+    assert [type(part) for part in parts] == [BlobContent, TextContent, BlobContent]
+    assert parts[2].media_type == "image/png"
+    assert batch.get_request("remote").messages[0].content[0].url == "https://example.com/image.png"
+
+    blobs = dummy_batcher.content_blobs
+    assert expand_content(text_request.messages[0].content, blobs) == document
+    expanded_parts = expand_content(parts, blobs)
+    assert expanded_parts[0] == {"content": document, "type": "text"}
+    assert expanded_parts[2] == {
+        "url": "data:image/png;base64," + base64.b64encode(b"\x89PNG fake image").decode(), "type": "image"
+    }
+
+    # the provider receives the expanded contents
+    batch.upload()
+    remote_requests = {line["custom_id"]: line["body"] for line in read_jsonl(batch._files.remote_requests)}
+    assert remote_requests["text"]["messages"][0]["content"] == document
+    assert remote_requests["parts"]["messages"][0]["content"] == expanded_parts
+
+
+def test_data_url_interned(dummy_batcher: Batcher):
+    data_url = "data:image/jpeg;base64," + base64.b64encode(b"jpeg bytes").decode()
+    batch = dummy_batcher.create_batch(name="data-url")
+    batch.add_requests([Request([UserMessage([ImageContent(data_url)])], custom_id=f"req-{i}") for i in range(3)], intern_content=True)
+
+    content = batch.get_request("req-0").messages[0].content[0]
+    assert content.media_type == "image/jpeg"
+    assert dummy_batcher.content_blobs.get_bytes(content.digest) == b"jpeg bytes"
+    assert expand_content([content], dummy_batcher.content_blobs)[0]["url"] == data_url
+
+
+def test_content_not_interned_by_default(dummy_batcher: Batcher):
+    document = "x" * CONTENT_BLOB_MIN_SIZE
+    request = Request([UserMessage(document), UserMessage([TextContent(document), TextContent("short")])], custom_id="req")
+    batch = dummy_batcher.create_batch(name="not-interned")
+    batch.add_requests(request)
+    # the requests read back are the ones added
+    assert batch.get_request("req") == request
+    assert batch.requests == [request]
+    assert batch.get_requests() == [request]
+    assert batch.request_table.to_requests() == [request]
+    assert list(dummy_batcher.content_blobs.directory.glob("*/*")) == []
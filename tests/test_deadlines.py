@@ -0,0 +1,135 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from batchman import Batcher, Request, UserMessage
+from batchman.deadlines import DeadlineTracker
+from batchman.models import CompletionWindow, LocalBatchStatus
+from batchman.utils import read_jsonl, upsert_json
+
+from .conftest import SlowDummyProvider
+
+
+def _upload(batcher: Batcher, name: str, size: int, uploaded_ago: timedelta = timedelta(0)):
+    batch = batcher.create_batch(name=name, provider="slow_dummy")
+    batch.override_request_params(model="model")
+    batch.add_requests([Request([UserMessage(f"prompt {i}")], custom_id=f"req-{i}") for i in range(size)])
+    uploaded = batch.upload()
+    upsert_json(uploaded._files.batch_params, {"uploaded_at": datetime.now(timezone.utc) - uploaded_ago})
+    return uploaded
+
+
+def test_deadline(dummy_batcher: Batcher):
+    uploaded = _upload(dummy_batcher, "batch", 2)
+    summary = dummy_batcher.load_batch(uploaded.unique_id).summary()
+    assert summary.deadline - uploaded.params.uploaded_at == CompletionWindow.HOURS_24.duration == timedelta(hours=24)
+    assert dummy_batcher.create_batch(name="editable").summary().deadline is None
+
+    # uploaded before uploaded_at was stored: from the creation date of the remote batch
+    upsert_json(uploaded._files.batch_params, {"uploaded_at": None})
+    uploaded._save_remote_state({**uploaded._remote_state, "created_at": 1_700_000_000})
+    summary = dummy_batcher.load_batch(uploaded.unique_id).summary()
+    assert summary.deadline == datetime.fromtimestamp(1_700_000_000, timezone.utc) + timedelta(hours=24)
+
+
+def test_flags_batches_at_risk(dummy_batcher: Batcher):
+    on_time = _upload(dummy_batcher, "on-time", 4)
+    late = _upload(dummy_batcher, "late", 4, uploaded_ago=timedelta(hours=24, seconds=-100))
+    stalled = _upload(dummy_batcher, "stalled", 4, uploaded_ago=timedelta(hours=20))
+    now = time.time()
+
+    tracker = DeadlineTracker(dummy_batcher, margin=0, stall_margin=6 * 3600)
+    statuses, errors = tracker.check(now)
+    assert errors == []
+    # no progress measured yet: the batches close to their deadline are at risk
+    assert {status.unique_id: status.at_risk for status in statuses} == {
+        on_time.unique_id: False, late.unique_id: True, stalled.unique_id: True,
+    }
+
+    # 1 request per minute: 3 more minutes for the 3 remaining requests
+    for batch in (on_time, late):
+        dummy_batcher.load_batch(batch.unique_id).sync()
+    # a new tracker resumes the observations
+    tracker = DeadlineTracker(dummy_batcher, margin=0, stall_margin=6 * 3600)
+    statuses, _ = tracker.check(now + 60)
+    by_id = {status.unique_id: status for status in statuses}
+    assert by_id[on_time.unique_id].eta.timestamp() == pytest.approx(now + 240)
+    assert not by_id[on_time.unique_id].at_risk
+    # expected 140s after its deadline
+    assert by_id[late.unique_id].at_risk
+    assert "no estimate yet" in by_id[stalled.unique_id].describe()
+
+    # a batch whose progress is not reported
+    no_progress = dummy_batcher.load_batch(stalled.unique_id)
+    no_progress._save_remote_state({key: value for key, value in no_progress._remote_state.items() if key != "request_counts"})
+    statuses, errors = tracker.check(now + 120)
+    assert errors == []
+    assert {status.unique_id: status.eta for status in statuses}[stalled.unique_id] is None
+
+
+def test_resubmits_batches_at_risk(dummy_batcher: Batcher):
+    late = _upload(dummy_batcher, "late", 3, uploaded_ago=timedelta(hours=23))
+    tracker = DeadlineTracker(dummy_batcher, resubmit=True, provider="dummy")
+    statuses, errors = tracker.check()
+    assert errors == []
+    [status] = statuses
+    assert status.at_risk and status.resubmitted_as
+
+    # without cancel, all the requests are resubmitted, and the original batch keeps running
+    resubmitted = dummy_batcher.load_batch(status.resubmitted_as)
+    assert resubmitted.params.parent_id == late.unique_id
+    assert resubmitted.params.provider["name"] == "dummy"
+    assert [request.custom_id for request in resubmitted.request_table] == ["req-0", "req-1", "req-2"]
+    assert dummy_batcher.load_batch(late.unique_id).status == LocalBatchStatus.IN_PROGRESS
+
+    # the resubmitted batch has a new completion window, and is not resubmitted again
+    statuses, _ = tracker.check()
+    assert sorted((status.unique_id, status.at_risk) for status in statuses) == sorted(
+        [(late.unique_id, True), (resubmitted.unique_id, False)]
+    )
+    assert {status.unique_id: status.resubmitted_as for status in statuses}[late.unique_id] == resubmitted.unique_id
+
+
+def test_resubmits_requests_without_result(dummy_batcher: Batcher, monkeypatch):
+    download_batch_results = SlowDummyProvider.download_batch_results
+
+    def download_processed(self, local_batch):
+        download_batch_results(self, local_batch)
+        completed = local_batch._remote_state["request_counts"]["completed"]
+        local_batch._save_remote_results(read_jsonl(local_batch._files.remote_results)[:completed])
+
+    monkeypatch.setattr(SlowDummyProvider, "cancel_batch", lambda self, local_batch: local_batch._save_remote_state(
+        {**local_batch._remote_state, "status": "cancelling"}
+    ))
+    monkeypatch.setattr(SlowDummyProvider, "download_batch_results", download_processed)
+    monkeypatch.setattr(SlowDummyProvider, "has_partial_results", lambda self, state: state["request_counts"]["completed"] > 0)
+    late = _upload(dummy_batcher, "late", 3, uploaded_ago=timedelta(hours=23))
+    # the first request is processed
+    dummy_batcher.load_batch(late.unique_id).sync()
+
+    tracker = DeadlineTracker(dummy_batcher, resubmit=True, provider="dummy", cancel=True)
+    statuses, errors = tracker.check()
+    assert errors == []
+    [status] = statuses
+    assert status.at_risk and status.resubmitted_as is None
+    cancelling = dummy_batcher.load_batch(late.unique_id)
+    assert cancelling.status == LocalBatchStatus.CANCELLING
+    # nothing is resubmitted while the batch is being cancelled, even by a new tracker
+    tracker = DeadlineTracker(dummy_batcher, resubmit=True, provider="dummy", cancel=True)
+    assert tracker.check() == ([], [])
+
+    cancelling._save_remote_state({**cancelling._remote_state, "status": "cancelled"})
+    statuses, errors = tracker.check()
+    assert errors == []
+    [status] = statuses
+    resubmitted = dummy_batcher.load_batch(status.unique_id)
+    assert resubmitted.params.parent_id == late.unique_id
+    assert resubmitted.params.provider["name"] == "dummy"
+    # the processed request keeps its result
+    assert [request.custom_id for request in resubmitted.request_table] == ["req-1", "req-2"]
+    original = dummy_batcher.load_batch(late.unique_id)
+    assert original.status == LocalBatchStatus.CANCELLED
+    assert [result.custom_id for result in original.get_results()] == ["req-0"]
+    # the cancelled batch is forgotten, and the resubmitted batch is tracked
+    assert list(tracker.state) == [resubmitted.unique_id]
@@ -1,5 +1,5 @@
 import pytest
-from batchman import load_batch, create_batch, list_batches, sync_batches, delete_batch
+from batchman import load_batch, create_batch, list_batches, sync_batches, delete_batch, upload_batches, as_completed, wait
 from batchman import Batcher
 
 def test_doc_similarity():
@@ -7,4 +7,7 @@ def test_doc_similarity():
     assert create_batch.__doc__ == Batcher.create_batch.__doc__
     assert list_batches.__doc__ == Batcher.list_batches.__doc__
     assert sync_batches.__doc__ == Batcher.sync_batches.__doc__
-    assert delete_batch.__doc__ == Batcher.delete_batch.__doc__
\ No newline at end of file
+    assert delete_batch.__doc__ == Batcher.delete_batch.__doc__
+    assert upload_batches.__doc__ == Batcher.upload_batches.__doc__
+    assert as_completed.__doc__ == Batcher.as_completed.__doc__
+    assert wait.__doc__ == Batcher.wait.__doc__
@@ -0,0 +1,145 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+from pydantic_core import to_jsonable_python
+
+from batchman import Batcher, Request, UserMessage
+from batchman.models.provider_config import ProviderConfig
+from batchman.providers.config_store import ConfigStore
+from batchman.result_cache import ResultCache
+from batchman.models.enums import MessageRole
+from batchman.utils import files
+from batchman.utils.files import COMPRESSION_SUFFIXES, JsonCodec, read_jsonl, set_json_codec, write_jsonl
+
+
+DATA = {
+    "text": "Unicode café ☕ and \"quotes\"\n",
+    "number": 0.1,
+    "integers": [1, -2, 3],
+    "nested": {"a": None, "b": True},
+    "role": MessageRole.USER,
+    "date": datetime(2025, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+}
+
+
+@pytest.fixture(autouse=True)
+def restore_codec():
+    codec = files._codec
+    yield
+    files._codec = codec
+
+
+@pytest.mark.parametrize("name", ["orjson", "msgspec"])
+def test_codecs_same_output(name):
+    pytest.importorskip(name)
+    codec = set_json_codec(name)
+    reference = JsonCodec()
+
+    assert codec.dumps(DATA) == reference.dumps(DATA)
+    encoded = reference.dumps(DATA)
+    assert codec.loads(encoded) == reference.loads(encoded)
+
+    request = Request([UserMessage("Hello é")], custom_id="a", temperature=0.5).model_dump()
+    assert codec.dumps(request) == reference.dumps(request)
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        set_json_codec("yaml")
+
+
+@pytest.mark.parametrize("name", ["json", "orjson"])
+def test_jsonl_roundtrip(tmp_path, name):
+    pytest.importorskip(name)
+    set_json_codec(name)
+    path = tmp_path / "data.jsonl"
+    requests = [Request([UserMessage(f"prompt {i} ✓")], custom_id=f"req-{i}") for i in range(3)]
+
+    write_jsonl(path, requests)
+    assert [Request(**line) for line in read_jsonl(path)] == requests
+
+
+def test_files_in_previous_format(tmp_path):
+    """Files written before the codecs (stdlib json with its default separators and ascii escapes) are
+    still read, and give the same config hashes and result cache keys."""
+    config = ProviderConfig(api_key="key é", base_url="https://api.test.com")
+    store_path = tmp_path / "provider_configs.jsonl"
+    config_hash = ConfigStore(store_path)._compute_hash(config.model_dump(exclude_none=True))
+    store_path.write_text(json.dumps({"hash": config_hash, "config": config.model_dump(exclude_none=True)}) + "\n")
+    assert ConfigStore(store_path).store(config) == config_hash
+    assert len(store_path.read_text().splitlines()) == 1
+
+    request = Request([UserMessage("Hello é ☕")], custom_id="a", model="model", temperature=0)
+    path = tmp_path / "requests.jsonl"
+    path.write_text(json.dumps(to_jsonable_python(request.model_dump())) + "\n")
+    for name in ("json", "orjson"):
+        if name == "orjson":
+            pytest.importorskip(name)
+        set_json_codec(name)
+        [line] = read_jsonl(path)
+        assert ResultCache.request_key("dummy", Request(**line)) == ResultCache.request_key("dummy", request)
+
+
+def _run_dummy_batch(batcher: Batcher, n: int = 5):
+    batch = batcher.create_batch(name="compressed", provider="dummy")
+    batch.add_requests([Request([UserMessage(f"prompt {i} ✓")], custom_id=f"req-{i}") for i in range(n)])
+    batch.add_requests([Request([UserMessage("last prompt")], custom_id="req-last")])
+    batch.override_request_params(model="dummy-model")
+    return batch.upload().download()
+
+
+@pytest.mark.parametrize("compression", ["gzip", "zstd"])
+def test_compressed_batch(tmp_path, compression):
+    if compression == "zstd":
+        pytest.importorskip("zstandard")
+    batcher = Batcher(batches_dir=tmp_path / "batches", compression=compression)
+    batch = _run_dummy_batch(batcher)
+
+    suffix = COMPRESSION_SUFFIXES[compression]
+    for path in (batch._files.requests, batch._files.remote_requests, batch._files.remote_results):
+        assert path.name.endswith(".jsonl" + suffix)
+        assert path.exists()
+
+    assert batch.get_request("req-3").messages[0].content == "prompt 3 ✓"
+    assert batch.get_result("req-last").choices[0].message.content == "echo: last prompt"
+    assert [r.custom_id for r in batch.get_results(4, 6, mode="text")] == ["req-4", "req-last"]
+    assert len(batch.get_results()) == 6
+
+    # A plain batcher reads the compressed batch, and its copies keep the compression
+    plain_batch = Batcher(batches_dir=tmp_path / "batches").load_batch(batch.unique_id)
+    assert len(plain_batch.get_results(mode="raw")) == 6
+    assert plain_batch.copy()._files.requests.name.endswith(suffix)
+
+
+def test_compress_batches_migration(tmp_path):
+    batcher = Batcher(batches_dir=tmp_path / "batches")
+    batch = _run_dummy_batch(batcher)
+    results = batch.get_results()
+    assert batch.get_request("req-1").custom_id == "req-1"
+
+    assert batcher.compress_batches("gzip") == []
+    batch = batcher.load_batch(batch.unique_id)
+    assert batch._files.requests.name == "requests.jsonl.gz"
+    assert not (batch.directory / "requests.jsonl").exists()
+    assert batch.get_results() == results
+    assert batch.get_request("req-1").custom_id == "req-1"
+    assert batch.get_result("req-2") == results[2]
+
+    assert batcher.compress_batches(None) == []
+    batch = batcher.load_batch(batch.unique_id)
+    assert batch._files.remote_results.name == "remote_results.jsonl"
+    assert batch.get_result("req-2") == results[2]
+
+
+def test_read_last_jsonl(tmp_path):
+    from batchman.utils.files import read_last_jsonl
+
+    path = tmp_path / "states.jsonl"
+    path.write_text("")
+    assert read_last_jsonl(path) is None
+    path.write_text('{"a": 1}')
+    assert read_last_jsonl(path) == {"a": 1}
+    lines = [{"i": i, "padding": "x" * 3000} for i in range(10)]
+    path.write_text("\n".join(json.dumps(line) for line in lines) + "\n\n")
+    assert read_last_jsonl(path) == lines[-1]
@@ -0,0 +1,58 @@
+import pytest
+
+from batchman import Batcher, Request, UserMessage
+from batchman.utils.index import JsonlIndex
+
+
+def _requests(n):
+    return [Request([UserMessage(f"prompt {i}")], custom_id=f"req-{i}") for i in range(n)]
+
+
+def test_jsonl_index_incremental(tmp_path):
+    path = tmp_path / "data.jsonl"
+    index_path = tmp_path / "data.index.jsonl"
+    path.write_text('{"custom_id": "a", "v": 1}\n\n{"custom_id": "b", "v": 2}\n')
+
+    index = JsonlIndex(path, index_path, key=lambda line: line["custom_id"])
+    assert index.keys() == ["a", "b"]
+    assert index.get("b") == {"custom_id": "b", "v": 2}
+
+    with open(path, "a") as f:
+        f.write('{"custom_id": "c", "v": 3}\n')
+    assert len(index) == 3
+    assert index.slice(1, 3) == [{"custom_id": "b", "v": 2}, {"custom_id": "c", "v": 3}]
+
+    # A new index object reuses the sidecar file
+    assert JsonlIndex(path, index_path, key=lambda line: line["custom_id"]).get("c")["v"] == 3
+
+    # Rewriting the file with a smaller content rebuilds the index
+    path.write_text('{"custom_id": "z", "v": 0}\n')
+    assert index.keys() == ["z"]
+    assert index.get("a") is None
+
+
+def test_get_request(dummy_batcher: Batcher):
+    batch = dummy_batcher.create_batch(name="index")
+    batch.add_requests(_requests(5))
+    batch.add_requests(_requests(10)[5:])
+    batch.override_request_params(model="dummy-model")
+
+    request = batch.get_request("req-7")
+    assert request.messages[0].content == "prompt 7"
+    assert request.model == "dummy-model"
+    assert [r.custom_id for r in batch.get_requests(2, 4)] == ["req-2", "req-3"]
+    with pytest.raises(KeyError):
+        batch.get_request("missing")
+
+
+def test_get_result(dummy_batcher: Batcher):
+    batch = dummy_batcher.create_batch(name="index", provider="dummy")
+    batch.add_requests(_requests(10))
+    batch.override_request_params(model="dummy-model")
+    uploaded = batch.upload()
+    downloaded = uploaded.download()
+
+    assert downloaded._files.remote_results_index.exists()
+    assert downloaded.get_result("req-3").choices[0].message.content == "echo: prompt 3"
+    assert [r.custom_id for r in downloaded.get_results(8)] == ["req-8", "req-9"]
+    assert downloaded.get_results() == downloaded.get_results(0, 10)
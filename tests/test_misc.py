@@ -58,3 +58,18 @@ def test_upload_not_set_provider(temp_batcher: Batcher):
     batch.add_requests([Request([UserMessage("Write a short story about a child dreaming of being a doctor.")])])
     with pytest.raises(ValueError):
         batch.upload()
+
+
+def test_import_has_no_side_effects(tmp_path):
+    import subprocess
+    import sys
+
+    code = (
+        "import sys, batchman; "
+        "assert not {'openai', 'anthropic', 'requests'} & set(sys.modules), 'provider SDK imported'; "
+        "assert batchman.providers.registry.ProviderRegistry.get('exxa') is not None; "
+        "assert 'requests' in sys.modules"
+    )
+    env = {**os.environ, "HOME": str(tmp_path)}
+    subprocess.run([sys.executable, "-c", code], cwd=tmp_path, env=env, check=True)
+    assert list(tmp_path.iterdir()) == []
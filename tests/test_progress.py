@@ -0,0 +1,75 @@
+import random
+from datetime import datetime, timezone
+
+from batchman import Batcher, Request, UserMessage
+from batchman.models import BatchProgress, ProviderConfig
+from batchman.progress import ProgressTracker
+from batchman.providers.anthropic import AnthropicProvider
+from batchman.providers.openai import OpenAIProvider
+from batchman.utils.backoff import Backoff
+
+
+CONFIG = ProviderConfig(api_key="test-key")
+
+
+def test_convert_batch_progress():
+    openai_state = {
+        "status": "in_progress", "created_at": 1700000000, "in_progress_at": 1700000060,
+        "request_counts": {"total": 10, "completed": 4, "failed": 1},
+    }
+    progress = OpenAIProvider(config=CONFIG).convert_batch_progress(openai_state)
+    assert progress == BatchProgress(4, 1, 10, datetime.fromtimestamp(1700000060, timezone.utc))
+    assert progress.done == 5 and progress.remaining == 5
+    assert OpenAIProvider(config=CONFIG).convert_batch_progress({"status": "validating", "request_counts": {"total": 0}}) is None
+
+    anthropic_state = {
+        "processing_status": "in_progress", "created_at": "2024-01-01T00:00:00Z",
+        "request_counts": {"processing": 5, "succeeded": 3, "errored": 1, "canceled": 0, "expired": 1},
+    }
+    progress = AnthropicProvider(config=CONFIG).convert_batch_progress(anthropic_state)
+    assert progress == BatchProgress(3, 2, 10, datetime(2024, 1, 1, tzinfo=timezone.utc))
+    assert BatchProgress.from_dict(progress.to_dict()) == progress
+
+
+def test_progress_tracker():
+    tracker = ProgressTracker(window=600)
+    started_at = datetime.fromtimestamp(1000, timezone.utc)
+    first = BatchProgress(10, 0, 100, started_at)
+    # single observation: average since the start of the batch
+    assert tracker.observe("batch", first, now=1600)
+    assert tracker.throughput("batch", first, now=1600) == 1.0
+
+    # then measured between the observations
+    second = BatchProgress(40, 0, 100, started_at)
+    assert tracker.observe("batch", second, now=1660)
+    assert not tracker.observe("batch", second, now=1720)
+    assert tracker.throughput("batch", second, now=1720) == 15.0
+    assert tracker.eta("batch", second, now=1720) == datetime.fromtimestamp(1720 + 4 * 60, timezone.utc)
+
+    # the old observations leave the window
+    tracker.observe("batch", BatchProgress(50, 0, 100, started_at), now=2400)
+    assert tracker.throughput("batch", None) is None
+    assert tracker.throughput("batch", BatchProgress(50, 0, 100), now=2400) == 10 / (2400 - 1720) * 60
+    assert tracker.eta("unknown", BatchProgress(0, 0, 100)) is None
+
+
+def test_backoff():
+    backoff = Backoff(initial=10, maximum=50)
+    assert [backoff.next(changed=False) for _ in range(4)] == [20, 40, 50, 50]
+    assert backoff.next(changed=True) == 10
+
+    jittered = Backoff(initial=10, maximum=50, jitter=0.5, rng=random.Random(0))
+    delays = [jittered.next(changed=True) for _ in range(20)]
+    assert all(5 <= delay <= 15 for delay in delays) and len(set(delays)) > 1
+
+
+def test_summary_progress(dummy_batcher: Batcher):
+    batch = dummy_batcher.create_batch(name="progress", provider="dummy")
+    batch.override_request_params(model="model")
+    batch.add_requests([Request([UserMessage(f"prompt {i}")], custom_id=f"req-{i}") for i in range(3)])
+    assert batch.progress is None
+    uploaded = batch.upload()
+    assert uploaded.summary().progress == BatchProgress(0, 0, 3)
+    uploaded.sync()
+    summaries, _ = dummy_batcher.batch_summaries()
+    assert summaries[0].progress == BatchProgress(3, 0, 3)
@@ -0,0 +1,104 @@
+import pytest
+
+from batchman import Batcher, Request, UserMessage
+from batchman.batch_interfaces import DownloadedBatch
+from batchman.models.enums import LocalBatchStatus
+from batchman.result_cache import ResultCache
+from batchman.utils import read_jsonl
+
+
+def _run(batch):
+    uploaded = batch.upload(use_cache=True)
+    uploaded.sync()
+    return uploaded.download()
+
+
+def _batch(batcher, prompts, temperature=0.0, name="cached"):
+    batch = batcher.create_batch(name=name, provider="dummy")
+    batch.override_request_params(model="model", temperature=temperature)
+    batch.add_requests([Request([UserMessage(prompt)], custom_id=f"{name}-{i}") for i, prompt in enumerate(prompts)])
+    return batch
+
+
+def test_request_key():
+    request = Request([UserMessage("hello")], custom_id="a", model="model", temperature=0, metadata={"run": 1})
+    same = Request([UserMessage("hello")], custom_id="b", model="model", temperature=0, metadata={"run": 2})
+    other = Request([UserMessage("hello")], custom_id="a", model="model", temperature=0.5)
+    assert ResultCache.request_key("dummy", request) == ResultCache.request_key("dummy", same)
+    assert ResultCache.request_key("dummy", request) != ResultCache.request_key("dummy", other)
+    assert ResultCache.request_key("dummy", request) != ResultCache.request_key("openai", request)
+    assert ResultCache.is_cacheable(request)
+    assert not ResultCache.is_cacheable(other)
+    assert ResultCache.is_cacheable(other, max_temperature=1.0)
+    assert not ResultCache.is_cacheable(Request([UserMessage("hello")]), max_temperature=2.0)
+
+
+def test_cached_results_merged(dummy_batcher: Batcher):
+    first = _run(_batch(dummy_batcher, ["a", "b"], name="first"))
+    assert first.status == LocalBatchStatus.DOWNLOADED
+    assert len(dummy_batcher.result_cache) == 2
+
+    second_batch = _batch(dummy_batcher, ["b", "c", "a"], name="second")
+    second = _run(second_batch)
+    # only the new request has been uploaded
+    assert [line["custom_id"] for line in read_jsonl(second._files.remote_requests)] == ["second-1"]
+
+    results = {result.custom_id: result.choices[0].message.content for result in second.get_results()}
+    assert results == {"second-0": "echo: b", "second-1": "echo: c", "second-2": "echo: a"}
+    assert second.get_result("second-2").choices[0].message.content == "echo: a"
+    assert len(dummy_batcher.result_cache) == 3
+
+
+def test_all_requests_cached(dummy_batcher: Batcher):
+    _run(_batch(dummy_batcher, ["a", "c"], name="first"))
+    third = _batch(dummy_batcher, ["a", "c", "a"], name="third").upload(use_cache=True, deduplicate=True)
+    # nothing is uploaded, the batch is completed from the cache
+    assert isinstance(third, DownloadedBatch)
+    assert not third._files.remote_requests.exists()
+    assert third.status == LocalBatchStatus.DOWNLOADED
+    assert third.progress.done == 3
+    results = {result.custom_id: result.choices[0].message.content for result in third.get_results()}
+    assert results == {"third-0": "echo: a", "third-1": "echo: c", "third-2": "echo: a"}
+
+    # and it is not synced again
+    assert dummy_batcher.sync_batches() == []
+    assert isinstance(dummy_batcher.load_batch(third.unique_id), DownloadedBatch)
+
+
+def test_temperature_rules(dummy_batcher: Batcher):
+    _run(_batch(dummy_batcher, ["a", "b"], temperature=0.7, name="first"))
+
+    # not deterministic, not served by default
+    second = _run(_batch(dummy_batcher, ["a", "c"], temperature=0.7, name="second"))
+    assert len(read_jsonl(second._files.remote_requests)) == 2
+
+    third = _batch(dummy_batcher, ["a", "d"], temperature=0.7, name="third").upload(use_cache=True, max_cached_temperature=1.0)
+    assert len(read_jsonl(third._files.remote_requests)) == 1
+
+
+def test_deduplicate(dummy_batcher: Batcher):
+    batch = _batch(dummy_batcher, ["a", "b", "a", "a", "c"], name="dedup")
+    batch.add_requests(Request([UserMessage("a")], custom_id="dedup-tagged", metadata={"tag": 1}))
+    uploaded = batch.upload(deduplicate=True)
+    assert [line["custom_id"] for line in read_jsonl(uploaded._files.remote_requests)] == [
+        "dedup-0", "dedup-1", "dedup-4"
+    ]
+
+    uploaded.sync()
+    downloaded = uploaded.download()
+    results = {result.custom_id: result.choices[0].message.content for result in downloaded.get_results()}
+    assert results == {f"dedup-{i}": f"echo: {prompt}" for i, prompt in enumerate(["a", "b", "a", "a", "c"])} | {
+        "dedup-tagged": "echo: a"
+    }
+    assert downloaded.get_result("dedup-3", mode="text").text == "echo: a"
+    assert downloaded.get_result("dedup-tagged", mode="text").text == "echo: a"
+
+
+def test_deduplicate_with_cache(dummy_batcher: Batcher):
+    _run(_batch(dummy_batcher, ["a"], name="first"))
+    batch = _batch(dummy_batcher, ["a", "b", "a", "b"], name="second")
+    uploaded = batch.upload(use_cache=True, deduplicate=True)
+    assert [line["custom_id"] for line in read_jsonl(uploaded._files.remote_requests)] == ["second-1"]
+    uploaded.sync()
+    results = {result.custom_id: result.choices[0].message.content for result in uploaded.download().get_results()}
+    assert results == {"second-0": "echo: a", "second-1": "echo: b", "second-2": "echo: a", "second-3": "echo: b"}
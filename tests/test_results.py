@@ -0,0 +1,107 @@
+import pytest
+
+from batchman import Batcher, Request, UserMessage
+from batchman.batch_interfaces import DownloadedBatch
+
+
+@pytest.fixture
+def downloaded_batch(dummy_batcher: Batcher) -> DownloadedBatch:
+    batch = dummy_batcher.create_batch(name="results", provider="dummy")
+    batch.add_requests([Request([UserMessage(f"prompt {i}")], custom_id=f"req-{i}") for i in range(5)])
+    batch.override_request_params(model="dummy-model")
+    return batch.upload().download()
+
+
+def test_results_cache(downloaded_batch: DownloadedBatch, monkeypatch):
+    # The results are converted at download time
+    assert downloaded_batch._results_cache_is_valid()
+    results = downloaded_batch.get_results()
+
+    def failing_convert(provider_result):
+        raise AssertionError("provider conversion should be skipped")
+
+    provider = downloaded_batch._provider
+    monkeypatch.setattr(provider, "convert_batch_result", failing_convert)
+    assert downloaded_batch.get_results() == results
+
+    # Changing the raw results invalidates the cache
+    with open(downloaded_batch._files.remote_results, "a") as f:
+        f.write("\n")
+    assert not downloaded_batch._results_cache_is_valid()
+    monkeypatch.undo()
+    assert downloaded_batch.get_results() == results
+    assert downloaded_batch._results_cache_is_valid()
+
+
+def test_results_cache_schema_version(downloaded_batch: DownloadedBatch, monkeypatch):
+    assert downloaded_batch._results_cache_is_valid()
+    monkeypatch.setattr(DownloadedBatch, "RESULTS_SCHEMA_VERSION", DownloadedBatch.RESULTS_SCHEMA_VERSION + 1)
+    assert not downloaded_batch._results_cache_is_valid()
+
+
+def test_results_modes(downloaded_batch: DownloadedBatch):
+    full = downloaded_batch.get_results()
+    text = downloaded_batch.get_results(mode="text")
+    raw = downloaded_batch.get_results(mode="raw")
+
+    assert [r.custom_id for r in text] == [r.custom_id for r in full]
+    assert text[0].text == full[0].choices[0].message.content == "echo: prompt 0"
+    assert text[0].finish_reason == "stop"
+    assert text[0].completion_tokens == 3
+    assert raw[0]["custom_id"] == "req-0"
+    assert downloaded_batch.get_result("req-2", mode="text").text == "echo: prompt 2"
+    assert downloaded_batch.get_results(1, 2, mode="raw") == raw[1:2]
+    with pytest.raises(ValueError):
+        downloaded_batch.get_results(mode="fast")
+
+
+def test_provider_text_decoders():
+    from batchman.providers.anthropic import AnthropicProvider
+    from batchman.providers.exxa import ExxaProvider
+    from batchman.providers.openai import OpenAIProvider
+
+    openai_result = {"custom_id": "a", "response": {"body": {
+        "choices": [{"message": {"role": "assistant", "content": "hi"}, "finish_reason": "stop", "index": 0}],
+        "usage": {"prompt_tokens": 5, "completion_tokens": 1, "total_tokens": 6},
+    }}}
+    assert OpenAIProvider.decode_text_result(None, openai_result) == ("a", "hi", "stop", 5, 1, None)
+
+    anthropic_result = {"custom_id": "b", "result": {"type": "succeeded", "message": {
+        "content": [{"type": "text", "text": "hello"}], "stop_reason": "end_turn",
+        "usage": {"input_tokens": 7, "output_tokens": 2},
+    }}}
+    assert AnthropicProvider.decode_text_result(None, anthropic_result) == ("b", "hello", "end_turn", 7, 2, None)
+    assert AnthropicProvider.decode_text_result(None, {"custom_id": "c", "result": {"type": "expired"}}).error == "expired"
+
+    exxa_result = {"metadata": {"custom_id": "d"}, "result_body": {
+        "choices": [{"message": {"role": "assistant", "content": "yo"}, "finish_reason": "length", "index": 0}],
+        "usage": {"prompt_tokens": 3, "completion_tokens": 9},
+    }}
+    assert ExxaProvider.decode_text_result(None, exxa_result) == ("d", "yo", "length", 3, 9, None)
+    assert ExxaProvider.convert_batch_result(None, exxa_result).choices[0].message.content == "yo"
+
+
+def test_result_table(downloaded_batch: DownloadedBatch):
+    table = downloaded_batch.result_table()
+    assert len(table) == 5
+    assert table.columns["custom_id"] == [f"req-{i}" for i in range(5)]
+    assert list(table) == downloaded_batch.get_results(mode="text")
+    assert table[1].text == "echo: prompt 1"
+
+
+def test_arrow_export(downloaded_batch: DownloadedBatch, tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    table = downloaded_batch.to_arrow(chunk_size=2)
+    assert table.num_rows == 5
+    assert table.column("custom_id").to_pylist() == [f"req-{i}" for i in range(5)]
+    assert pa.types.is_dictionary(table.schema.field("finish_reason").type)
+
+    path = tmp_path / "results.parquet"
+    downloaded_batch.to_parquet(path, chunk_size=2)
+    assert pq.read_table(path).column("text").to_pylist() == [f"echo: prompt {i}" for i in range(5)]
+
+    pytest.importorskip("pandas")
+    df = downloaded_batch.to_pandas()
+    assert list(df["completion_tokens"]) == [3] * 5
@@ -0,0 +1,71 @@
+import time
+
+from batchman import Batcher, Request, UserMessage
+from batchman.rolling import RollingBatcher
+
+
+def _requests(count, start=0):
+    return [Request([UserMessage(f"prompt {i}")], custom_id=f"req-{i}") for i in range(start, start + count)]
+
+
+def test_rolling_by_count(dummy_batcher: Batcher):
+    rolling = RollingBatcher(dummy_batcher, "dummy", max_requests=3, request_params={"model": "model"})
+    rolling.add_requests(_requests(4))
+    for request in _requests(3, start=4):
+        rolling.add_requests(request)
+    assert [len(batch.requests) for batch in rolling.sealed] == [3, 3]
+    rolling.close()
+    assert [len(batch.requests) for batch in rolling.sealed] == [3, 3, 1]
+    assert len(rolling.uploaded) == 3 and rolling.errors == []
+
+    results = list(rolling.results(poll_interval=0.001))
+    assert sorted(result.custom_id for result in results) == [f"req-{i}" for i in range(7)]
+    assert {result.choices[0].message.content for result in results} == {f"echo: prompt {i}" for i in range(7)}
+
+
+def test_rolling_by_bytes_and_age(dummy_batcher: Batcher):
+    size = len(_requests(1)[0].model_dump_json())
+    with RollingBatcher(dummy_batcher, "dummy", max_bytes=2 * size + 1, max_age=0.05, request_params={"model": "model"}) as rolling:
+        rolling.add_requests(_requests(5))
+        assert [len(batch.requests) for batch in rolling.sealed] == [2, 2]
+        # the last request is sealed by age
+        time.sleep(0.3)
+        assert [len(batch.requests) for batch in rolling.sealed] == [2, 2, 1]
+
+
+def test_rolling_spreads_providers(dummy_batcher: Batcher):
+    with RollingBatcher(dummy_batcher, ["dummy", "slow_dummy", "unknown"], max_requests=1, request_params={"model": "model"}) as rolling:
+        rolling.add_requests(_requests(4))
+    providers = {batch.unique_id: batch.params.provider["name"] for batch in rolling.uploaded}
+    # the third batch falls back to the next provider
+    assert [providers[batch.unique_id] for batch in rolling.sealed] == ["dummy", "slow_dummy", "dummy", "dummy"]
+    assert len(list(rolling.results(poll_interval=0.001))) == 4
+
+
+def test_rolling_single_poller(dummy_batcher: Batcher, monkeypatch):
+    import batchman.batchman
+
+    backoffs = []
+    original = batchman.batchman.Backoff
+
+    def backoff(*args, **kwargs):
+        backoffs.append(original(*args, **kwargs))
+        return backoffs[-1]
+
+    monkeypatch.setattr(batchman.batchman, "Backoff", backoff)
+    rolling = RollingBatcher(dummy_batcher, "slow_dummy", max_requests=3, request_params={"model": "model"})
+    rolling.add_requests(_requests(3))
+    added = []
+
+    def sleep(delay):
+        # a batch is uploaded while the first one is polled
+        if not added:
+            added.append(delay)
+            rolling.add_requests(_requests(3, start=3))
+            rolling.close()
+
+    monkeypatch.setattr(batchman.batchman.time, "sleep", sleep)
+    results = list(rolling.results(poll_interval=0.001, refresh_interval=0.001))
+    assert sorted(result.custom_id for result in results) == [f"req-{i}" for i in range(6)]
+    # the batches are polled by a single poller, whatever the refresh interval
+    assert len(backoffs) == 1
@@ -0,0 +1,86 @@
+import asyncio
+
+from batchman import Batcher, Request, UserMessage
+from batchman.utils.ui import TableApp
+
+
+def test_table_app_syncs_in_background(dummy_batcher: Batcher):
+    editable = dummy_batcher.create_batch(name="editable")
+    batch = dummy_batcher.create_batch(name="uploaded", provider="dummy")
+    batch.override_request_params(model="model")
+    batch.add_requests(Request([UserMessage("prompt")], custom_id="req"))
+    uploaded = batch.upload()
+
+    async def run() -> None:
+        app = TableApp(str(dummy_batcher.batches_dir))
+        async with app.run_test() as pilot:
+            await app.workers.wait_for_complete()
+            await pilot.pause()
+            table = app.data_table
+            assert table.row_count == 2
+            # the uploaded batch has been synced (and downloaded) in the background
+            assert table.get_cell(uploaded.unique_id, "status") == "downloaded"
+            assert table.get_cell(editable.unique_id, "status") == "initializing"
+
+            # a reload only adds the new batches
+            new_batch = dummy_batcher.create_batch(name="new")
+            dummy_batcher.delete_batch(editable.unique_id)
+            await pilot.press("escape")
+            app.action_reload()
+            await app.workers.wait_for_complete()
+            await pilot.pause()
+            assert set(app.summaries) == {uploaded.unique_id, new_batch.unique_id}
+            assert table.row_count == 2
+
+    asyncio.run(run())
+
+
+def test_table_app_filters_and_pages(dummy_batcher: Batcher, monkeypatch):
+    monkeypatch.setattr("batchman.utils.ui.PAGE_SIZE", 2)
+    batches = [dummy_batcher.create_batch(name=f"batch-{i}") for i in range(5)]
+    batches[0].set_provider("dummy")
+
+    async def run() -> None:
+        app = TableApp(str(dummy_batcher.batches_dir))
+        async with app.run_test() as pilot:
+            await app.workers.wait_for_complete()
+            await pilot.pause()
+            table = app.data_table
+            # only the first page is materialized, most recent first
+            assert table.row_count == 2
+            assert list(app.page_ids) and app.view[:2] == [batches[4].unique_id, batches[3].unique_id]
+            await pilot.press("right_square_bracket", "right_square_bracket", "right_square_bracket")
+            assert app.page == 2 and table.row_count == 1
+            await pilot.press("left_square_bracket")
+            assert app.page == 1 and table.row_count == 2
+
+            await pilot.press("v")
+            assert app.provider_filter == "dummy"
+            assert app.page == 0 and app.view == [batches[0].unique_id]
+
+            await pilot.press("v", "slash", *"batch-2", "enter")
+            assert app.search == "batch-2"
+            assert app.view == [batches[2].unique_id]
+            assert table.get_cell(batches[2].unique_id, "name") == "batch-2"
+
+    asyncio.run(run())
+
+
+def test_table_app_polls_progress(dummy_batcher: Batcher):
+    batch = dummy_batcher.create_batch(name="polled", provider="dummy")
+    batch.override_request_params(model="model")
+    batch.add_requests([Request([UserMessage(f"prompt {i}")], custom_id=f"req-{i}") for i in range(3)])
+    uploaded = batch.upload()
+
+    async def run() -> None:
+        app = TableApp(str(dummy_batcher.batches_dir), poll_interval=0.05, max_poll_interval=0.2)
+        async with app.run_test() as pilot:
+            await app.workers.wait_for_complete()
+            await pilot.pause()
+            assert app.data_table.get_cell(uploaded.unique_id, "progress") == "3/0/3"
+            # nothing progresses anymore: the polling backs off
+            await pilot.pause(0.5)
+            await app.workers.wait_for_complete()
+            assert app.backoff.interval == 0.2
+
+    asyncio.run(run())
@@ -0,0 +1,138 @@
+import threading
+
+from batchman import Batcher, EditableBatch, Request, UserMessage
+from batchman.models import LocalBatchStatus
+from batchman.upload_scheduler import CHARS_PER_TOKEN, UploadQuota, UploadScheduler, estimate_tokens
+from batchman.watcher import Watcher
+
+
+def _batch(batcher: Batcher, name: str, provider: str, size: int, model: str = "model"):
+    batch = batcher.create_batch(name=name, provider=provider)
+    batch.override_request_params(model=model)
+    batch.add_requests([Request([UserMessage("x" * 40)], custom_id=f"req-{i}") for i in range(size)])
+    return batch
+
+
+def test_estimate_tokens(dummy_batcher: Batcher):
+    batch = _batch(dummy_batcher, "batch", "dummy", 3)
+    assert estimate_tokens(batch) == 3 * 40 // CHARS_PER_TOKEN
+    batch.override_request_params(system_prompt="s" * 20)
+    assert estimate_tokens(batch) == 3 * 60 // CHARS_PER_TOKEN
+
+
+def test_batch_quota(dummy_batcher: Batcher):
+    scheduler = UploadScheduler(dummy_batcher, quotas={"slow_dummy": UploadQuota(max_batches=1)})
+    first = scheduler.submit(_batch(dummy_batcher, "first", "slow_dummy", 2))
+    assert first is not None and first.status != LocalBatchStatus.INITIALIZING
+    second = _batch(dummy_batcher, "second", "slow_dummy", 2)
+    assert scheduler.submit(second) is None
+    assert [entry["unique_id"] for entry in scheduler.queue] == [second.unique_id]
+
+    # the first batch is still running
+    scheduler.sync_running()
+    assert scheduler.admit() == ([], [])
+
+    # a new scheduler resumes the queue and the quotas
+    scheduler = UploadScheduler(dummy_batcher)
+    assert scheduler.quotas == {"slow_dummy": UploadQuota(max_batches=1)}
+    scheduler.sync_running()
+    uploaded, errors = scheduler.admit()
+    assert errors == [] and [batch.unique_id for batch in uploaded] == [second.unique_id]
+    assert scheduler.queue == [] and list(scheduler.running) == [second.unique_id]
+
+
+def test_batches_uploaded_directly(dummy_batcher: Batcher):
+    # uploaded without the scheduler
+    direct = _batch(dummy_batcher, "direct", "slow_dummy", 3).upload()
+    scheduler = UploadScheduler(dummy_batcher, quotas={("slow_dummy", "model"): UploadQuota(max_tokens=50)})
+    assert scheduler.usage() == {("slow_dummy", "model", direct.params.provider.get("config_hash")): (30, 1)}
+    held = _batch(dummy_batcher, "held", "slow_dummy", 3)
+    assert scheduler.submit(held) is None
+
+    # admitted once the batch uploaded directly is completed
+    for _ in range(3):
+        scheduler.sync_running()
+    uploaded, errors = scheduler.admit()
+    assert errors == [] and [batch.unique_id for batch in uploaded] == [held.unique_id]
+
+
+def test_token_quota_per_capacity(dummy_batcher: Batcher):
+    # 10 tokens per request
+    scheduler = UploadScheduler(dummy_batcher, quotas={("slow_dummy", "model"): UploadQuota(max_tokens=50)})
+    assert scheduler.submit(_batch(dummy_batcher, "first", "slow_dummy", 3)) is not None
+    held = _batch(dummy_batcher, "held", "slow_dummy", 3)
+    assert scheduler.submit(held) is None
+    # the batches queued behind keep their order, even if they would fit
+    small = _batch(dummy_batcher, "small", "slow_dummy", 1)
+    assert scheduler.submit(small) is None
+    # other models and providers are not limited
+    assert scheduler.submit(_batch(dummy_batcher, "other-model", "slow_dummy", 10, model="other")) is not None
+    assert scheduler.submit(_batch(dummy_batcher, "other-provider", "dummy", 10)) is not None
+    assert [entry["unique_id"] for entry in scheduler.queue] == [held.unique_id, small.unique_id]
+
+    # a batch larger than the whole quota is admitted alone
+    scheduler = UploadScheduler(dummy_batcher, quotas={("dummy", "large"): UploadQuota(max_tokens=50)})
+    assert scheduler.submit(_batch(dummy_batcher, "large", "dummy", 10, model="large")) is not None
+
+
+def test_run_admits_queued_batches(dummy_batcher: Batcher):
+    scheduler = UploadScheduler(dummy_batcher, quotas={"slow_dummy": UploadQuota(max_batches=1)})
+    batches = [_batch(dummy_batcher, f"batch-{i}", "slow_dummy", 2) for i in range(3)]
+    for batch in batches:
+        scheduler.submit(batch)
+    assert len(scheduler.queue) == 2
+    assert scheduler.run(poll_interval=0.01, max_poll_interval=0.01) == []
+    assert scheduler.queue == []
+    assert all(dummy_batcher.load_batch(batch.unique_id).status != LocalBatchStatus.INITIALIZING for batch in batches)
+
+
+def test_watcher_admits_queued_batches(dummy_batcher: Batcher):
+    scheduler = UploadScheduler(dummy_batcher, quotas={"slow_dummy": UploadQuota(max_batches=1)})
+    first = scheduler.submit(_batch(dummy_batcher, "first", "slow_dummy", 1))
+    second = _batch(dummy_batcher, "second", "slow_dummy", 1)
+    scheduler.submit(second)
+
+    watcher = Watcher(dummy_batcher, min_interval=0.01, max_interval=0.01, default_rate_limit=None, scheduler=scheduler)
+    watcher.run(once=True)
+    for batch in (first, second):
+        assert dummy_batcher.load_batch(batch.unique_id).status == LocalBatchStatus.DOWNLOADED
+
+
+def test_admit_uploads_outside_the_lock(dummy_batcher: Batcher, monkeypatch):
+    scheduler = UploadScheduler(dummy_batcher, quotas={"slow_dummy": UploadQuota(max_batches=1)})
+    upload = EditableBatch.upload
+    uploading, release = threading.Event(), threading.Event()
+
+    def slow_upload(self, **kwargs):
+        uploading.set()
+        assert release.wait(5)
+        return upload(self, **kwargs)
+
+    monkeypatch.setattr(EditableBatch, "upload", slow_upload)
+    first = _batch(dummy_batcher, "first", "slow_dummy", 2)
+    thread = threading.Thread(target=scheduler.submit, args=(first,))
+    thread.start()
+    assert uploading.wait(5)
+    # the scheduler is usable during the upload, and the batch being uploaded holds its capacity
+    second = _batch(dummy_batcher, "second", "slow_dummy", 2)
+    assert scheduler.submit(second) is None
+    assert list(scheduler.usage().values()) == [(estimate_tokens(first), 1)]
+    release.set()
+    thread.join()
+    assert [entry["unique_id"] for entry in scheduler.queue] == [second.unique_id]
+    assert list(scheduler.running) == [first.unique_id]
+
+    # a failed upload releases its capacity, and the batch stays queued
+    def failing_upload(self, **kwargs):
+        raise RuntimeError("network error")
+
+    monkeypatch.setattr(EditableBatch, "upload", failing_upload)
+    for _ in range(2):
+        scheduler.sync_running()
+    uploaded, errors = scheduler.admit()
+    assert uploaded == [] and errors == [f"Error uploading batch {second.unique_id}: network error"]
+    assert scheduler.usage() == {}
+    assert [entry["unique_id"] for entry in scheduler.queue] == [second.unique_id]
+    monkeypatch.setattr(EditableBatch, "upload", upload)
+    uploaded, errors = scheduler.admit()
+    assert errors == [] and [batch.unique_id for batch in uploaded] == [second.unique_id]
@@ -0,0 +1,185 @@
+import pytest
+
+from batchman import Batcher, DownloadedBatch, Request, UserMessage
+from batchman.models import LocalBatchStatus
+from batchman.utils import read_jsonl
+
+from .conftest import SlowDummyProvider
+
+
+def _upload(batcher: Batcher, name: str, size: int):
+    batch = batcher.create_batch(name=name, provider="slow_dummy")
+    batch.override_request_params(model="model")
+    batch.add_requests([Request([UserMessage(f"prompt {i}")], custom_id=f"req-{i}") for i in range(size)])
+    return batch.upload()
+
+
+def test_as_completed(dummy_batcher: Batcher, monkeypatch):
+    synced_groups = []
+    original = SlowDummyProvider.sync_batches
+
+    def sync_batches(self, local_batches):
+        synced_groups.append(len(local_batches))
+        return original(self, local_batches)
+
+    monkeypatch.setattr(SlowDummyProvider, "sync_batches", sync_batches)
+    batches = [_upload(dummy_batcher, f"batch-{size}", size) for size in (3, 1, 2)]
+    finished = list(dummy_batcher.as_completed(batches, poll_interval=0.001, max_poll_interval=0.01))
+    assert [batch.params.name for batch in finished] == ["batch-1", "batch-2", "batch-3"]
+    assert all(isinstance(batch, DownloadedBatch) for batch in finished)
+    # the pending batches are synced together
+    assert synced_groups == [3, 2, 1]
+
+    # already downloaded
+    assert list(dummy_batcher.as_completed(finished)) == finished
+
+    with pytest.raises(ValueError, match="not been uploaded"):
+        list(dummy_batcher.as_completed([dummy_batcher.create_batch(name="editable")]))
+
+
+def test_wait(dummy_batcher: Batcher):
+    batches = [_upload(dummy_batcher, f"batch-{size}", size) for size in (1, 5)]
+    done, not_done = dummy_batcher.wait(batches, return_when="FIRST_COMPLETED", poll_interval=0.001)
+    assert [batch.unique_id for batch in done] == [batches[0].unique_id]
+    assert not_done == [batches[1]]
+
+    # timeout before the next poll
+    done, not_done = dummy_batcher.wait(not_done, timeout=0, poll_interval=0.001)
+    assert done == [] and not_done == [batches[1]]
+    with pytest.raises(TimeoutError):
+        list(dummy_batcher.as_completed(not_done, timeout=0))
+
+    cancelled = _upload(dummy_batcher, "cancelled", 5)
+    cancelled.cancel()
+    done, not_done = dummy_batcher.wait([batches[1], cancelled], return_when="FIRST_EXCEPTION", poll_interval=0.001)
+    assert [batch.unique_id for batch in done] == [cancelled.unique_id]
+    assert done[0].status == LocalBatchStatus.CANCELLED
+
+    done, not_done = dummy_batcher.wait([batches[1]], poll_interval=0.001)
+    assert not_done == [] and done[0].status == LocalBatchStatus.DOWNLOADED
+
+
+def test_cancelling_batches_synced(dummy_batcher: Batcher, monkeypatch):
+    original = SlowDummyProvider.sync_batch
+
+    def sync_batch(self, local_batch):
+        # the batch is cancelled after one sync
+        if local_batch._remote_state["status"] == "cancelling":
+            local_batch._save_remote_state({**local_batch._remote_state, "status": "cancelled"})
+        else:
+            original(self, local_batch)
+
+    monkeypatch.setattr(SlowDummyProvider, "sync_batch", sync_batch)
+    batches = [_upload(dummy_batcher, f"cancelling-{i}", 3) for i in range(2)]
+    for batch in batches:
+        batch._save_remote_state({**batch._remote_state, "status": "cancelling"})
+        assert batch.status == LocalBatchStatus.CANCELLING
+
+    finished = list(dummy_batcher.as_completed([batches[0]], poll_interval=0.001))
+    assert [batch.status for batch in finished] == [LocalBatchStatus.CANCELLED]
+
+    assert dummy_batcher.sync_batches() == []
+    assert dummy_batcher.load_batch(batches[1].unique_id).status == LocalBatchStatus.CANCELLED
+
+
+def test_openai_bulk_sync():
+    from types import SimpleNamespace
+
+    from batchman.models import ProviderConfig
+    from batchman.providers.openai import OpenAIProvider
+
+    class RemoteBatch(SimpleNamespace):
+        def model_dump(self):
+            return {"id": self.id, "status": "in_progress"}
+
+    class LocalBatch:
+        def __init__(self, remote_id):
+            self.remote_id = remote_id
+            self.unique_id = f"local-{remote_id}"
+            self.states = []
+
+        def _save_remote_state(self, state):
+            self.states.append(state)
+
+    provider = OpenAIProvider(config=ProviderConfig(api_key="test-key"))
+    listed = [RemoteBatch(id=f"batch_{i}") for i in range(5)]
+    retrieved = []
+    provider.client = SimpleNamespace(batches=SimpleNamespace(
+        list=lambda limit: iter(listed),
+        retrieve=lambda remote_id: retrieved.append(remote_id) or RemoteBatch(id=remote_id),
+    ))
+    local_batches = [LocalBatch("batch_1"), LocalBatch("batch_3"), LocalBatch("batch_old")]
+    assert provider.sync_batches(local_batches) == {}
+    assert [batch.states for batch in local_batches] == [
+        [{"id": "batch_1", "status": "in_progress"}],
+        [{"id": "batch_3", "status": "in_progress"}],
+        [{"id": "batch_old", "status": "in_progress"}],
+    ]
+    # only the batch not listed is retrieved
+    assert retrieved == ["batch_old"]
+
+
+def test_map(dummy_batcher: Batcher, monkeypatch):
+    def get_result(self, custom_id, mode="full"):
+        raise AssertionError("the results of a shard are read at once")
+
+    monkeypatch.setattr(DownloadedBatch, "get_result", get_result)
+    requests = [Request([UserMessage(f"prompt {i}")], custom_id=f"req-{i}") for i in range(7)]
+    # the last shard (a single request) completes first, its results are held until the previous shards are done
+    results = list(dummy_batcher.map(
+        iter(requests), provider="slow_dummy", max_shard=3, request_params={"model": "model"}, poll_interval=0.001
+    ))
+    assert [result.custom_id for result in results] == [f"req-{i}" for i in range(7)]
+    assert [result.choices[0].message.content for result in results] == [f"echo: prompt {i}" for i in range(7)]
+    # the shards are regular batches
+    summaries, _ = dummy_batcher.batch_summaries([LocalBatchStatus.DOWNLOADED])
+    assert sorted(summary.name for summary in summaries) == ["map-0", "map-1", "map-2"]
+
+    results = list(dummy_batcher.map(
+        requests, provider="slow_dummy", max_shard=3, ordered=False, name="unordered", request_params={"model": "model"},
+        poll_interval=0.001,
+    ))
+    # the last shard (a single request) completes first
+    assert results[0].custom_id == "req-6"
+    assert sorted(result.custom_id for result in results) == sorted(f"req-{i}" for i in range(7))
+
+
+def test_map_expired_shard(dummy_batcher: Batcher, monkeypatch):
+    sync_batch = SlowDummyProvider.sync_batch
+    download_batch_results = SlowDummyProvider.download_batch_results
+
+    def expire(self, local_batch):
+        # the second shard expires after processing its first request
+        if local_batch.params.name.endswith("-1"):
+            state = local_batch._remote_state
+            local_batch._save_remote_state({**state, "status": "failed", "request_counts": {**state["request_counts"], "completed": 1}})
+        else:
+            sync_batch(self, local_batch)
+
+    def download_processed(self, local_batch):
+        download_batch_results(self, local_batch)
+        completed = local_batch._remote_state["request_counts"]["completed"]
+        local_batch._save_remote_results(read_jsonl(local_batch._files.remote_results)[:completed])
+
+    monkeypatch.setattr(SlowDummyProvider, "sync_batch", expire)
+    monkeypatch.setattr(SlowDummyProvider, "download_batch_results", download_processed)
+    monkeypatch.setattr(SlowDummyProvider, "has_partial_results", lambda self, state: state["request_counts"]["completed"] > 0)
+    for ordered in (True, False):
+        # distinct prompts, not answered by the result cache of the previous run
+        requests = [Request([UserMessage(f"prompt {i} {ordered}")], custom_id=f"req-{i}") for i in range(7)]
+        results = list(dummy_batcher.map(
+            requests, provider="slow_dummy", max_shard=3, ordered=ordered, name=f"map-{ordered}", request_params={"model": "model"},
+            poll_interval=0.001,
+        ))
+        assert sorted(result.custom_id for result in results) == sorted(f"req-{i}" for i in range(7))
+        errors = {result.custom_id: result.error for result in results if result.error is not None}
+        assert sorted(errors) == ["req-4", "req-5"]
+        assert all(error.endswith("(failed)") for error in errors.values())
+        if ordered:
+            assert [result.custom_id for result in results] == [f"req-{i}" for i in range(7)]
+
+    # a shard failing without any result can't be mapped
+    monkeypatch.setattr(SlowDummyProvider, "has_partial_results", lambda self, state: False)
+    requests = [Request([UserMessage(f"other prompt {i}")], custom_id=f"req-{i}") for i in range(7)]
+    with pytest.raises(ValueError, match="failed"):
+        list(dummy_batcher.map(requests, provider="slow_dummy", max_shard=3, request_params={"model": "model"}, poll_interval=0.001))
@@ -0,0 +1,82 @@
+from batchman import Batcher, Request, UserMessage
+from batchman.models import LocalBatchStatus
+from batchman.watcher import Watcher
+
+from .conftest import SlowDummyProvider
+
+
+def _upload(batcher: Batcher, name: str, size: int):
+    batch = batcher.create_batch(name=name, provider="slow_dummy")
+    batch.override_request_params(model="model")
+    batch.add_requests([Request([UserMessage(f"prompt {i}")], custom_id=f"req-{i}") for i in range(size)])
+    return batch.upload()
+
+
+def test_adaptive_schedule(dummy_batcher: Batcher):
+    uploaded = _upload(dummy_batcher, "slow", 4)
+    watcher = Watcher(dummy_batcher, min_interval=10, max_interval=100, default_rate_limit=None)
+    assert watcher.poll(now=0) == []
+    entry = watcher.schedule[uploaded.unique_id]
+    assert entry["done"] == 1
+    # no estimate yet: the interval backs off
+    assert 18 <= entry["interval"] <= 22 and entry["next_poll"] == entry["interval"]
+
+    # not due yet
+    watcher.poll(now=5)
+    assert watcher.schedule[uploaded.unique_id]["done"] == 1
+
+    # the schedule is resumed by a new watcher, and the estimated completion shortens the interval
+    watcher = Watcher(dummy_batcher, min_interval=10, max_interval=100, default_rate_limit=None)
+    watcher.poll(now=30)
+    entry = watcher.schedule[uploaded.unique_id]
+    assert entry["done"] == 2
+    # 1 request per 30s, 2 remaining: expected in 60s
+    assert entry["interval"] == 30
+
+    watcher.poll(now=60)
+    watcher.poll(now=90)
+    # completed on the last sync, downloaded in the background
+    watcher.wait_downloads()
+    assert watcher.schedule == {}
+    assert dummy_batcher.load_batch(uploaded.unique_id).status == LocalBatchStatus.DOWNLOADED
+
+
+def test_rate_limits(dummy_batcher: Batcher):
+    first = _upload(dummy_batcher, "first", 2)
+    second = _upload(dummy_batcher, "second", 2)
+    watcher = Watcher(dummy_batcher, min_interval=10, rate_limits={"slow_dummy": 1})
+    watcher.poll(now=0)
+    polled = [unique_id for unique_id, entry in watcher.schedule.items() if entry["done"] is not None]
+    assert len(polled) == 1
+    rate_limited = ({first.unique_id, second.unique_id} - set(polled)).pop()
+    assert 55 <= watcher.schedule[rate_limited]["next_poll"] <= 60
+
+
+def test_run_once(dummy_batcher: Batcher):
+    batches = [_upload(dummy_batcher, f"batch-{i}", i + 1) for i in range(3)]
+    dummy_batcher.create_batch(name="editable")
+    watcher = Watcher(dummy_batcher, min_interval=0.01, max_interval=0.05, default_rate_limit=None)
+    assert watcher.run(once=True) == []
+    for batch in batches:
+        assert dummy_batcher.load_batch(batch.unique_id).status == LocalBatchStatus.DOWNLOADED
+
+
+def test_cancelling_batch_watched(dummy_batcher: Batcher, monkeypatch):
+    original = SlowDummyProvider.sync_batch
+
+    def sync_batch(self, local_batch):
+        # the batch is cancelled after one sync
+        if local_batch._remote_state["status"] == "cancelling":
+            local_batch._save_remote_state({**local_batch._remote_state, "status": "cancelled"})
+        else:
+            original(self, local_batch)
+
+    monkeypatch.setattr(SlowDummyProvider, "sync_batch", sync_batch)
+    uploaded = _upload(dummy_batcher, "cancelling", 3)
+    uploaded._save_remote_state({**uploaded._remote_state, "status": "cancelling"})
+
+    watcher = Watcher(dummy_batcher, min_interval=0.01, max_interval=0.05, default_rate_limit=None)
+    watcher.refresh()
+    assert list(watcher.schedule) == [uploaded.unique_id]
+    assert watcher.run(once=True) == []
+    assert dummy_batcher.load_batch(uploaded.unique_id).status == LocalBatchStatus.CANCELLED
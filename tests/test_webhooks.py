@@ -0,0 +1,190 @@
+import base64
+import json
+import threading
+import time
+import urllib.error
+from types import SimpleNamespace
+
+import pytest
+
+from batchman import Batcher, DownloadedBatch, Request, UserMessage
+from batchman.models import LocalBatchStatus, ProviderConfig
+from batchman.providers.config_store import ConfigStore
+from batchman.providers.openai import OpenAIProvider
+from batchman.providers.registry import ProviderRegistry
+from batchman.webhooks import WebhookReceiver, WebhookVerificationError, post_event, sign_payload, verify_signature
+
+from .conftest import DummyProvider
+
+SECRET = "whsec_" + base64.b64encode(b"test-secret").decode()
+
+
+def test_verify_signature():
+    body = b'{"type": "batch.completed"}'
+    headers = {"webhook-id": "wh_1", "webhook-timestamp": "1000", "webhook-signature": sign_payload(SECRET, "wh_1", 1000, body)}
+    verify_signature(SECRET, headers, body, now=1100)
+    # one of several signatures
+    verify_signature(SECRET, {**headers, "webhook-signature": "v1,b3RoZXI= " + headers["webhook-signature"]}, body, now=1100)
+
+    with pytest.raises(WebhookVerificationError, match="signature"):
+        verify_signature(SECRET, headers, body + b" ", now=1100)
+    with pytest.raises(WebhookVerificationError, match="tolerance"):
+        verify_signature(SECRET, headers, body, now=2000)
+    with pytest.raises(WebhookVerificationError, match="headers"):
+        verify_signature(SECRET, {"webhook-id": "wh_1"}, body)
+
+
+def test_openai_final_statuses():
+    provider = OpenAIProvider(config=ProviderConfig(api_key="test-key"))
+    assert provider.convert_batch_status({"status": "failed"}) == LocalBatchStatus.FAILED
+    assert provider.convert_batch_status({"status": "expired"}) == LocalBatchStatus.FAILED
+    assert provider.convert_batch_status({"status": "finalizing"}) == LocalBatchStatus.IN_PROGRESS
+    assert provider.has_partial_results({"status": "expired", "output_file_id": "file-1", "error_file_id": None})
+    assert not provider.has_partial_results({"status": "failed", "output_file_id": None, "error_file_id": None})
+
+
+def _upload(batcher: Batcher, name: str):
+    batch = batcher.create_batch(name=name, provider="dummy")
+    batch.override_request_params(model="model")
+    batch.add_requests(Request([UserMessage("prompt")], custom_id="req"))
+    return batch.upload()
+
+
+def test_receiver_downloads_batch(dummy_batcher: Batcher):
+    uploaded = _upload(dummy_batcher, "pushed")
+
+    receiver = WebhookReceiver(dummy_batcher, SECRET, port=0).start()
+    try:
+        assert post_event(receiver.url, SECRET, "batch.completed", "unknown") == (200, {"status": "ignored"})
+        assert post_event(receiver.url, SECRET, "batch.completed", uploaded.remote_id) == (200, {"status": "accepted"})
+        receiver.wait_idle()
+        assert dummy_batcher.load_batch(uploaded.unique_id).status == LocalBatchStatus.DOWNLOADED
+
+        # redelivered events are handled once
+        event = {"type": "batch.completed", "data": {"id": uploaded.remote_id}}
+        assert receiver.receive("wh_redelivered", event) == "accepted"
+        assert receiver.receive("wh_redelivered", event) == "duplicate"
+        receiver.wait_idle()
+
+        with pytest.raises(urllib.error.HTTPError) as error:
+            post_event(receiver.url, "whsec_" + base64.b64encode(b"other").decode(), "batch.completed", uploaded.remote_id)
+        assert error.value.code == 401
+    finally:
+        receiver.stop()
+
+
+def test_receiver_downloads_partial_results(dummy_batcher: Batcher, monkeypatch):
+    def sync_batch(self, local_batch):
+        # expired after processing its requests, like an OpenAI batch with an output file
+        local_batch._save_remote_state({**local_batch._remote_state, "status": "failed", "output_file_id": "file-1"})
+
+    monkeypatch.setattr(DummyProvider, "sync_batch", sync_batch)
+    monkeypatch.setattr(DummyProvider, "has_partial_results", lambda self, state: bool(state.get("output_file_id")))
+    uploaded = _upload(dummy_batcher, "expired")
+
+    receiver = WebhookReceiver(dummy_batcher, SECRET, port=0).start()
+    try:
+        # the events of a batch not listed yet are handled when redelivered
+        event = {"type": "batch.expired", "data": {"id": uploaded.remote_id}}
+        with monkeypatch.context() as m:
+            m.setattr(receiver, "_find_batch", lambda remote_id: None)
+            assert receiver.receive("wh_expired", event) == "ignored"
+        assert receiver.receive("wh_expired", event) == "accepted"
+        receiver.wait_idle()
+    finally:
+        receiver.stop()
+
+    downloaded = dummy_batcher.load_batch(uploaded.unique_id)
+    assert isinstance(downloaded, DownloadedBatch)
+    assert downloaded.status == LocalBatchStatus.FAILED
+    assert downloaded.get_result("req", mode="text").text == "echo: prompt"
+
+
+class _RemoteBatch(SimpleNamespace):
+    def model_dump(self):
+        return dict(self.__dict__)
+
+
+def test_openai_expired_batch_results(dummy_batcher: Batcher, monkeypatch, tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    # the first request was processed before the batch expired, the second one is in the error file, without response
+    output = {"custom_id": "req-0", "error": None, "response": {"status_code": 200, "body": {
+        "choices": [{"message": {"role": "assistant", "content": "answer"}, "finish_reason": "stop", "index": 0}],
+        "usage": {"prompt_tokens": 5, "completion_tokens": 1, "total_tokens": 6},
+    }}}
+    expired = {"custom_id": "req-1", "response": None, "error": {"code": "batch_expired", "message": "expired"}}
+    files = {"file-output": json.dumps(output) + "\n", "file-errors": json.dumps(expired) + "\n"}
+    remote_batch = _RemoteBatch(id="batch_1", status="in_progress", output_file_id=None, error_file_id=None)
+    client = SimpleNamespace(
+        models=SimpleNamespace(list=lambda: [SimpleNamespace(id="model")]),
+        files=SimpleNamespace(
+            create=lambda file, purpose: SimpleNamespace(id="file-input"),
+            content=lambda file_id: SimpleNamespace(text=files[file_id]),
+        ),
+        batches=SimpleNamespace(
+            create=lambda **kwargs: remote_batch,
+            retrieve=lambda remote_id: remote_batch,
+            list=lambda limit: iter([remote_batch]),
+        ),
+    )
+    monkeypatch.setattr("batchman.providers.openai.OpenAI", lambda **kwargs: client)
+    monkeypatch.setattr(ProviderRegistry, "_config_store", ConfigStore(tmp_path / "providers_configs.jsonl"))
+
+    batch = dummy_batcher.create_batch(name="expired", provider="openai", provider_config=ProviderConfig(api_key="test-key"))
+    batch.override_request_params(model="model")
+    batch.add_requests([Request([UserMessage(f"prompt {i}")], custom_id=f"req-{i}") for i in range(2)])
+    uploaded = batch.upload()
+    remote_batch.status, remote_batch.output_file_id, remote_batch.error_file_id = "expired", "file-output", "file-errors"
+    assert dummy_batcher.sync_batches() == []
+
+    downloaded = dummy_batcher.load_batch(uploaded.unique_id)
+    assert isinstance(downloaded, DownloadedBatch) and downloaded.status == LocalBatchStatus.FAILED
+    results = {result.custom_id: result for result in downloaded.get_results()}
+    assert results["req-0"].choices[0].message.content == "answer"
+    assert not results["req-1"].choices and "batch_expired" in results["req-1"].error
+    texts = {result.custom_id: result for result in downloaded.get_results(mode="text")}
+    assert texts["req-0"].text == "answer" and "batch_expired" in texts["req-1"].error
+    assert sorted(result["custom_id"] for result in downloaded.get_results(mode="raw")) == ["req-0", "req-1"]
+    assert "batch_expired" in downloaded.get_result("req-1", mode="text").error
+    table = downloaded.to_arrow()
+    assert isinstance(table, pa.Table) and sorted(table.column("custom_id").to_pylist()) == ["req-0", "req-1"]
+
+
+def test_receiver_handles_webhook_once(dummy_batcher: Batcher, monkeypatch):
+    uploaded = _upload(dummy_batcher, "concurrent")
+    receiver = WebhookReceiver(dummy_batcher, SECRET, port=0).start()
+    try:
+        event = {"type": "batch.completed", "data": {"id": uploaded.remote_id}}
+        find_batch = receiver._find_batch
+
+        def slow_find_batch(remote_id):
+            time.sleep(0.05)
+            return find_batch(remote_id)
+
+        monkeypatch.setattr(receiver, "_find_batch", slow_find_batch)
+        # concurrent deliveries of the same webhook
+        statuses = []
+        threads = [threading.Thread(target=lambda: statuses.append(receiver.receive("wh_1", event))) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        receiver.wait_idle()
+        assert sorted(statuses) == ["accepted", "duplicate"]
+
+        # a webhook whose handling failed is handled when redelivered
+        failing = _upload(dummy_batcher, "failing")
+        event = {"type": "batch.completed", "data": {"id": failing.remote_id}}
+
+        def failing_sync(batch):
+            raise ValueError("provider unavailable")
+
+        with monkeypatch.context() as m:
+            m.setattr(dummy_batcher, "_sync_batch", failing_sync)
+            assert receiver.receive("wh_2", event) == "accepted"
+            receiver.wait_idle()
+        assert receiver.receive("wh_2", event) == "accepted"
+        receiver.wait_idle()
+        assert dummy_batcher.load_batch(failing.unique_id).status == LocalBatchStatus.DOWNLOADED
+    finally:
+        receiver.stop()